@@ -0,0 +1,225 @@
+import gzip
+from datetime import date
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
+from app import conditional, venues_page, artists_page, shows_page, show_entry, get_live_or_404, \
+  cached_venue_data, cached_artist_data, venue_context, artist_context, timeline_limits
+from models import Venue, Artist
+from profiling import query_budget
+from timeline import Timeline
+import search
+
+try:
+  import orjson
+except ImportError:  # optional: pip install orjson
+  orjson = None
+
+try:
+  import brotli
+except ImportError:  # optional: pip install brotli
+  brotli = None
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# /api/v1 serves the data behind the HTML pages as JSON, from the same query
+# functions, caches and conditional (ETag) handling:
+#
+#   GET /api/v1/venues?cursor=&per_page=&genre=&city=&state=
+#   GET /api/v1/venues/<id>?past=&upcoming=
+#   GET /api/v1/venues/search?q=
+#   ... and the same for /artists, plus
+#   GET /api/v1/shows?from=&to=&when=&city=&state=&venue_id=&artist_id=
+#
+# ?fields=id,name returns only those fields; on the detail endpoints leaving
+# out every show field also skips the show queries. Responses larger than
+# API_COMPRESS_MIN_SIZE are sent with brotli (when the brotli package is
+# installed) or gzip, whichever the client accepts.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_LIST_FIELDS = ('id', 'name', 'city', 'state', 'num_upcoming_shows')
+ARTIST_LIST_FIELDS = ('id', 'name')
+SHOW_FIELDS = ('venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+SEARCH_FIELDS = ('id', 'name', 'city', 'state')
+TIMELINE_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count',
+                   'more_past_shows', 'more_upcoming_shows')
+VENUE_FIELDS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'address', 'website', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'image_link') + TIMELINE_FIELDS
+ARTIST_FIELDS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'image_link') + TIMELINE_FIELDS
+
+
+def requested_fields(allowed):
+  # the ?fields= set, or None for every field; unknown names are a 400
+  value = request.args.get('fields')
+  if not value:
+    return None
+  fields = set(name.strip() for name in value.split(',') if name.strip())
+  unknown = fields.difference(allowed)
+  if unknown:
+    abort(400, 'unknown fields: %s' % ', '.join(sorted(unknown)))
+  return fields
+
+
+def pick(record, fields):
+  if fields is None:
+    return record
+  return dict((key, value) for key, value in record.items() if key in fields)
+
+
+def page_response(page, items, fields):
+  return jsonify(data=[pick(item, fields) for item in items],
+                 next_url=page.next_url, prev_url=page.prev_url, **page.to_dict())
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@query_budget(1)
+@conditional('Venue', time_window=True)
+def venues():
+  fields = requested_fields(VENUE_LIST_FIELDS)
+  page = venues_page()
+  items = [{
+    'id': venue.id,
+    'name': venue.name,
+    'city': venue.city,
+    'state': venue.state,
+    'num_upcoming_shows': venue.num_upcoming_shows,
+  } for venue in page.items]
+  return page_response(page, items, fields)
+
+
+@api.route('/venues/<int:venue_id>')
+@query_budget(3)
+def venue(venue_id):
+  fields = requested_fields(VENUE_FIELDS)
+  if fields is not None and not fields.intersection(TIMELINE_FIELDS):
+    data = venue_context(get_live_or_404(Venue, venue_id), Timeline([], [], 0, 0))
+  else:
+    data = cached_venue_data(venue_id, *timeline_limits())
+  return jsonify(pick(data, fields))
+
+
+@api.route('/venues/search')
+@query_budget(1)
+def search_venues():
+  fields = requested_fields(SEARCH_FIELDS)
+  results = search.search(Venue, request.args.get('q', ''))
+  return jsonify(count=len(results), data=[pick(result, fields) for result in results])
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@query_budget(1)
+@conditional('Artist')
+def artists():
+  fields = requested_fields(ARTIST_LIST_FIELDS)
+  page = artists_page()
+  items = [{'id': artist.id, 'name': artist.name} for artist in page.items]
+  return page_response(page, items, fields)
+
+
+@api.route('/artists/<int:artist_id>')
+@query_budget(3)
+def artist(artist_id):
+  fields = requested_fields(ARTIST_FIELDS)
+  if fields is not None and not fields.intersection(TIMELINE_FIELDS):
+    data = artist_context(get_live_or_404(Artist, artist_id), Timeline([], [], 0, 0))
+  else:
+    data = cached_artist_data(artist_id, *timeline_limits())
+  return jsonify(pick(data, fields))
+
+
+@api.route('/artists/search')
+@query_budget(1)
+def search_artists():
+  fields = requested_fields(SEARCH_FIELDS)
+  results = search.search(Artist, request.args.get('q', ''))
+  return jsonify(count=len(results), data=[pick(result, fields) for result in results])
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@query_budget(1)
+@conditional('Show', 'Venue', 'Artist', time_window=True)
+def shows():
+  fields = requested_fields(SHOW_FIELDS)
+  page = shows_page()
+  return page_response(page, [show_entry(q) for q in page.items], fields)
+
+
+#  Errors and compression
+#  ----------------------------------------------------------------
+
+# registered by code as well: Flask looks for the app's 404 and 500
+# handlers before a blueprint's HTTPException one
+@api.errorhandler(HTTPException)
+@api.errorhandler(404)
+@api.errorhandler(500)
+def http_error(error):
+  response = jsonify(error={'status': error.code, 'name': error.name, 'message': error.description})
+  response.status_code = error.code
+  return response
+
+
+@api.after_request
+def compress(response):
+  if response.direct_passthrough or response.status_code in (204, 304) or 'Content-Encoding' in response.headers:
+    return response
+  response.vary.add('Accept-Encoding')
+  data = response.get_data()
+  if len(data) < current_app.config['API_COMPRESS_MIN_SIZE']:
+    return response
+
+  encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+  if encoding == 'br':
+    data = brotli.compress(data, quality=current_app.config['API_BROTLI_QUALITY'])
+  elif encoding == 'gzip':
+    data = gzip.compress(data, compresslevel=current_app.config['API_GZIP_LEVEL'])
+  else:
+    return response
+  response.set_data(data)
+  response.headers['Content-Encoding'] = encoding
+  # the same ETag now names a different byte sequence per encoding
+  etag, _ = response.get_etag()
+  if etag:
+    response.set_etag(etag, weak=True)
+  return response
+
+
+#  JSON encoding
+#  ----------------------------------------------------------------
+
+class FastJSONProvider(DefaultJSONProvider):
+  # dates and datetimes as ISO 8601 rather than HTTP dates, and jsonify()
+  # through orjson when it is installed
+
+  @staticmethod
+  def default(o):
+    if isinstance(o, date):
+      return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+  def response(self, *args, **kwargs):
+    if orjson is None:
+      return super().response(*args, **kwargs)
+    obj = self._prepare_response_obj(args, kwargs)
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    if self.compact is False or (self.compact is None and self._app.debug):
+      option |= orjson.OPT_INDENT_2
+    return self._app.response_class(orjson.dumps(obj, default=self.default, option=option) + b'\n',
+                                    mimetype=self.mimetype)
+
+
+def init_app(app):
+  app.register_blueprint(api)
+  app.json = FastJSONProvider(app)
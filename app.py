@@ -2,16 +2,33 @@
 # Imports
 #----------------------------------------------------------------------------#
 import os
+import time
+import urllib.error
+import urllib.request
+import hashlib
+import inspect
 import babel
+import babel.dates
+from functools import lru_cache, wraps
 import dateutil.parser
-from flask import Flask, jsonify, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, abort, g, has_request_context, jsonify, render_template, request, Response, flash, redirect, url_for, session, make_response, stream_with_context
+from markupsafe import Markup
+from werkzeug.exceptions import HTTPException
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSQLAlchemy, ReplicaCache
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import configure_mappers
 import logging
 from logging import Formatter, FileHandler
 from forms import *
 from flask_migrate import Migrate
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from metrics import InstrumentedQueuePool, pool_stats
+from pagination import page_args, paginate, keyset, build_page
+from profiling import query_budget
+import profiling
+import sessions
+from cache import create_cache, create_versions, venue_key, artist_key
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -23,28 +40,431 @@ app.config.from_object('config')
 
 app.config['SQLALCHEMY_DATABASE_URI']
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS']
+if 'pool_size' in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('poolclass', InstrumentedQueuePool)
 
 # connect to a local postgresql database
 
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 from models import *
+from timeline import venue_timeline, artist_timeline
 
 migrate = Migrate(app, db)
+page_cache = create_cache(app.config)
+table_versions = create_versions(app.config)
+import search
+import replicas
+replicas.init_app(app, db)
+if app.config['DATABASE_REPLICA_URLS']:
+  page_cache = ReplicaCache(page_cache, app.config['REPLICA_CACHE_TTL'])
+profiling.init_app(app)
+sessions.init_app(app)
+
+import counters
+import tasks
+tasks.init_app(app)
+import geo
+import exporter
+import deletion
+from importer import stored_datetime
+import commands
+commands.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# Show times are formatted in the visitor's language (Accept-Language, among
+# LOCALES) and, when TIMEZONE names the zone they are stored in, converted to
+# the zone in the visitor's "tz" cookie (or DISPLAY_TIMEZONE). Patterns are
+# compiled once per (format, locale) rather than on every call.
+
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=128)
+def datetime_pattern(format, locale):
+  # the compiled Babel pattern and Locale for a filter format: one of
+  # DATETIME_FORMATS, a CLDR width ('short', 'long') or a custom pattern
+  locale = babel.Locale.parse(locale.replace('-', '_'))
+  pattern = DATETIME_FORMATS.get(format, format)
+  if pattern in ('short', 'long', 'full', 'medium'):
+    pattern = babel.dates.get_datetime_format(pattern, locale=locale) \
+      .replace('{0}', babel.dates.get_time_format(pattern, locale=locale).pattern) \
+      .replace('{1}', babel.dates.get_date_format(pattern, locale=locale).pattern)
+  return babel.dates.parse_pattern(pattern), locale
+
+
+@lru_cache(maxsize=128)
+def time_zone(name):
+  # a tzinfo for an IANA zone name, or None for an unknown one
+  try:
+    return babel.dates.get_timezone(name) if name else None
+  except LookupError:
+    return None
+
+
+def display_locale():
+  locales = app.config['LOCALES']
+  if not has_request_context():
+    return locales[0]
+  if 'display_locale' not in g:
+    g.display_locale = request.accept_languages.best_match(locales) or locales[0]
+  return g.display_locale
+
+
+def display_timezone():
+  if not has_request_context():
+    return time_zone(app.config['DISPLAY_TIMEZONE'])
+  if 'display_timezone' not in g:
+    g.display_timezone = time_zone(request.cookies.get('tz')) or time_zone(app.config['DISPLAY_TIMEZONE'])
+  return g.display_timezone
+
+
+def format_datetime(value, format='medium', locale=None, tz=None):
+  # value is a datetime; strings, from older cached pages, are parsed
+  if value is None:
+    return ''
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  stored = time_zone(app.config['TIMEZONE'])
+  tz = time_zone(tz) if isinstance(tz, str) else (tz or display_timezone())
+  if stored is not None and tz is not None:
+    if value.tzinfo is None:
+      value = stored.localize(value) if hasattr(stored, 'localize') else value.replace(tzinfo=stored)
+    value = value.astimezone(tz)
+  pattern, locale = datetime_pattern(format, locale or display_locale())
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def timeline_limits():
+  # ?past=<n>&upcoming=<n> grow the show lists on the detail pages
+  size = app.config['TIMELINE_PAGE_SIZE']
+  cap = app.config['TIMELINE_MAX_SHOWS']
+  past = request.args.get('past', size, type=int)
+  upcoming = request.args.get('upcoming', size, type=int)
+  return max(1, min(past, cap)), max(1, min(upcoming, cap))
+
+
+def invalidate_pages(venue_ids=(), artist_ids=()):
+  # drop cached detail pages after a write that touched these records
+  page_cache.delete(*([venue_key(i) for i in venue_ids] + [artist_key(i) for i in artist_ids]))
+
+
+def time_bucket():
+  # start of the current CONDITIONAL_TIME_WINDOW, in epoch seconds
+  window = app.config['CONDITIONAL_TIME_WINDOW']
+  return int(time.time() // window) * window
+
+
+def conditional(*tables, **options):
+  # answer repeat requests for a list page with 304 from the version stamps
+  # of the tables it reads, before the view runs any query or template.
+  # time_window=True also rolls the ETag every CONDITIONAL_TIME_WINDOW
+  # seconds for pages whose content depends on the clock. Works on the
+  # coroutine views of asgi.py as well.
+  def validators():
+    token, last_modified = table_versions.stamp(*tables)
+    if options.get('time_window'):
+      bucket = time_bucket()
+      token += ':%d' % bucket
+      last_modified = max(last_modified, datetime.fromtimestamp(bucket, last_modified.tzinfo))
+    # the pages show dates in the visitor's locale and time zone
+    variant = '%s %s' % (display_locale(), display_timezone())
+    etag = hashlib.sha1((token + ' ' + variant + ' ' + request.full_path).encode('utf-8')).hexdigest()
+
+    # weak comparison: compressed API responses carry the ETag as W/"..."
+    if request.if_none_match:
+      not_modified = request.if_none_match.contains_weak(etag)
+    else:
+      not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    return etag, last_modified, not_modified
+
+  def finish(response, etag, last_modified):
+    # the ETag varies with the locale and the tz cookie, so must shared caches
+    response.vary.update(('Accept-Language', 'Cookie'))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+  def decorator(view):
+    if inspect.iscoroutinefunction(view):
+      @wraps(view)
+      async def async_wrapper(*args, **kwargs):
+        if '_flashes' in session:
+          return await view(*args, **kwargs)
+        etag, last_modified, not_modified = validators()
+        response = make_response('', 304) if not_modified else make_response(await view(*args, **kwargs))
+        return finish(response, etag, last_modified)
+      return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if '_flashes' in session:
+        return view(*args, **kwargs)
+      etag, last_modified, not_modified = validators()
+      response = make_response('', 304) if not_modified else make_response(view(*args, **kwargs))
+      return finish(response, etag, last_modified)
+    return wrapper
+  return decorator
+
+
+def render_fragment(key, template, **context):
+  # render a template fragment once per key; keys embed a version token
+  html = page_cache.get(key)
+  if html is None:
+    html = render_template(template, **context)
+    page_cache.set(key, html)
+  return Markup(html)
+
+
+def related_ids(column, owner_column, owner_id):
+  # ids on the other side of an entity's shows, whose pages show its name
+  return [row[0] for row in db.session.query(column).filter(owner_column == owner_id).distinct()]
+
+
+# the columns the other side's pages show next to each of its shows
+MENTIONED_COLUMNS = {'name', 'image_link'}
+
+
+def invalidate_mentions(model, record_id):
+  # after a rename or a new image: drop the pages of the other side that
+  # show them (deletions clear them themselves, see deletion.py)
+  if model is Venue:
+    invalidate_pages(artist_ids=related_ids(Show.artist_id, Show.venue_id, record_id))
+  else:
+    invalidate_pages(venue_ids=related_ids(Show.venue_id, Show.artist_id, record_id))
+
+
+def get_live_or_404(model, record_id):
+  # a venue or artist that exists and is not soft deleted
+  record = model.query.filter(model.id == record_id, live(model)).first()
+  if record is None:
+    abort(404)
+  return record
+
+
+def requested_ids():
+  # the ids of a bulk DELETE: a JSON body {"ids": [...]} or ?id=1&id=2
+  body = request.get_json(silent=True)
+  values = body.get('ids') if isinstance(body, dict) else None
+  if values is None:
+    values = request.args.getlist('id')
+  try:
+    ids = [int(value) for value in values]
+  except (TypeError, ValueError):
+    ids = None
+  if not ids or len(ids) > app.config['DELETE_MAX_IDS']:
+    error = 'give between 1 and %d integer ids' % app.config['DELETE_MAX_IDS']
+    abort(make_response(jsonify(success=False, error=error), 400))
+  return ids
+
+
+def delete_records(model, ids):
+  # delete (soft unless ?soft=false or DELETE_SOFT is off) and answer with
+  # what was deleted and how long it took; one id that is not there is a 404
+  soft = request.args.get('soft', str(app.config['DELETE_SOFT'])).lower() in ('1', 'true', 'yes')
+  try:
+    report = deletion.delete(model, ids, soft=soft)
+  except deletion.DeletionFailed as e:
+    app.logger.exception('could not delete %s %s', model.__tablename__, ids[:10])
+    return jsonify(success=False, error=str(e)), 500
+  finally:
+    db.session.close()
+  if len(ids) == 1 and not report.deleted:
+    return jsonify(success=False, error='not found', **report.to_dict()), 404
+  return jsonify(success=True, **report.to_dict())
+
+
+def location_filters(model):
+  # ?city=<name>&state=<code> narrow the venue and artist listings
+  return [getattr(model, field) == request.args[field]
+          for field in ('city', 'state') if request.args.get(field)]
+
+
+def genre_filters(model, owner_column):
+  # ?genre=<name>, repeatable; a listed entity must have every genre asked for
+  links = owner_column.table
+  return [model.id.in_(db.select(owner_column)
+                       .join(Genre, Genre.id == links.c.genre_id)
+                       .where(Genre.name == name))
+          for name in request.args.getlist('genre')]
+
+
+def genre_facets(model, owner_column):
+  # genre counts for the entities matching the current filters, from one
+  # grouped query over the link table, cached per table version and filter
+  links = owner_column.table
+  selected = sorted(set(request.args.getlist('genre')))
+  token = table_versions.stamp(model.__tablename__)[0]
+  key = 'facets:%s:%s:%s|%s|%s' % (model.__tablename__, token, request.args.get('city', ''),
+                                   request.args.get('state', ''), ','.join(selected))
+  counts = page_cache.get(key)
+  if counts is None:
+    count = db.func.count(owner_column)
+    query = db.session.query(Genre.name, count).select_from(links) \
+      .join(Genre, Genre.id == links.c.genre_id)
+    conditions = location_filters(model) + genre_filters(model, owner_column)
+    if conditions:
+      query = query.join(model, model.id == owner_column).filter(*conditions)
+    counts = [tuple(row) for row in query.group_by(Genre.name).order_by(count.desc(), Genre.name)]
+    page_cache.set(key, counts)
+
+  def facet_url(genres):
+    args = dict((field, request.args[field]) for field in ('city', 'state', 'per_page') if request.args.get(field))
+    return url_for(request.endpoint, genre=genres, **args)
+
+  return [{
+    'name': name,
+    'count': n,
+    'selected': name in selected,
+    'url': facet_url([g for g in selected if g != name] if name in selected else selected + [name]),
+  } for name, n in counts]
+
+# edit form field -> column
+VENUE_EDIT_FIELDS = {
+  'name': 'name', 'city': 'city', 'state': 'state', 'address': 'address', 'phone': 'phone',
+  'image_link': 'image_link', 'facebook_link': 'facebook_link', 'website_link': 'website_link',
+  'seeking_talent': 'looking_for_talent', 'seeking_description': 'seeking_description',
+}
+ARTIST_EDIT_FIELDS = {
+  'name': 'name', 'city': 'city', 'state': 'state', 'phone': 'phone',
+  'image_link': 'image_link', 'facebook_link': 'facebook_link', 'website_link': 'website_link',
+  'seeking_venue': 'seeking_venue', 'seeking_description': 'seeking_description',
+}
+
+
+def form_changes(form, fields, current):
+  # {column: value} for the fields of a submitted form that differ from the
+  # current row; text fields left out of the submission are not changes,
+  # and an empty field matches NULL
+  changes = {}
+  for name, column in fields.items():
+    field = form[name]
+    if field.type != 'BooleanField' and name not in request.form:
+      continue
+    old = getattr(current, column)
+    if field.data == old or (field.data == '' and old is None):
+      continue
+    changes[column] = field.data
+  return changes
+
+
+def save_edit(model, record_id, form, fields, links, owner_column):
+  # write an edit form as one UPDATE of the columns it changes, guarded by
+  # the version the form was loaded at; genre links are rewritten only when
+  # the genres changed. Returns the changed columns (empty when nothing
+  # changed, and then nothing is written), or None when the row has been
+  # edited since the form was loaded
+  table = model.__table__
+  current = db.session.execute(db.select(table.c.version, table.c.genres, *[table.c[c] for c in fields.values()])
+                               .where(table.c.id == record_id, table.c.deleted_at.is_(None))).first()
+  if current is None:
+    abort(404)
+  changes = form_changes(form, fields, current)
+  # like the text fields, genres left out of the submission are kept
+  genres = genre_names(form.genres.data or []) if 'genres' in request.form else split_genres(current.genres)
+  if genres != split_genres(current.genres):
+    changes['genres'] = ', '.join(genres)
+  if not changes:
+    return changes
+  if request.form.get('version', current.version, type=int) != current.version:
+    return None
+  if model is Venue and ('city' in changes or 'state' in changes):
+    # placed again by the locate_venue task
+    changes.update(latitude=None, longitude=None, geohash=None)
+
+  updated = db.session.execute(table.update()
+                               .where(table.c.id == record_id, table.c.version == current.version)
+                               .values(version=current.version + 1, **changes))
+  if not updated.rowcount:
+    db.session.rollback()
+    return None
+  if 'genres' in changes:
+    link_genres(links, owner_column, record_id, genres)
+  db.session.commit()
+  return changes
+
+
+def edit_conflict(model, record_id, form, template):
+  # the edit form again, with the submitted values and the current version,
+  # when the record changed after the form was loaded
+  record = model.query.get_or_404(record_id)
+  form.version.data = record.version
+  flash(record.name + ' was changed by someone else while you were editing, so your changes were not saved. '
+        'Submit the form again to save them over the other changes.')
+  return render_template(template, form=form, **{model.__tablename__.lower(): record}), 409
+
+
+def edit_rejected(model, record_id, form, template):
+  # the edit form again, with the submitted values, when the database
+  # refused the edit: a unique column, the name, already taken
+  db.session.rollback()
+  record = get_live_or_404(model, record_id)
+  flash(record.name + ' was not saved: another ' + model.__tablename__.lower() + ' already has the name '
+        + (form.name.data or '') + '.')
+  return render_template(template, form=form, **{model.__tablename__.lower(): record}), 409
+
+
+#----------------------------------------------------------------------------#
+# Background tasks.
+#----------------------------------------------------------------------------#
+
+# Run after the write routes commit (see tasks.py). Cache invalidation is
+# not among them: a job may run in another process, whose caches are not
+# the ones serving the writer's pages, so the routes clear those inline.
+
+# Edits pass changed=[columns] so the tasks that only care about some of
+# them can skip the rest.
+
+@tasks.task(on=['venue.saved'])
+def locate_venue(venue_id, changed=None):
+  # place a new or moved venue at its city from the gazetteer (see geo.py);
+  # in a process without the web workers' versions, the nearby pages pick
+  # it up with their time window
+  if changed is not None and 'latitude' not in changed:
+    return
+  located, _ = geo.locate_venues([venue_id])
+  if located:
+    db.session.commit()
+    table_versions.bump('Venue')
+
+
+@tasks.task(on=['venue.saved', 'artist.saved'], max_attempts=3, when='CHECK_IMAGE_LINKS')
+def check_image_link(venue_id=None, artist_id=None, changed=None):
+  # log a warning when an image_link does not answer with an image; network
+  # errors and 5xx answers raise, so the check is retried
+  if changed is not None and 'image_link' not in changed:
+    return
+  model, record_id = (Venue, venue_id) if venue_id is not None else (Artist, artist_id)
+  link = db.session.query(model.image_link).filter(model.id == record_id).scalar()
+  if not link:
+    return
+  if not link.startswith(('http://', 'https://')):
+    app.logger.warning('%s %s: image_link %r is not an http(s) URL', model.__tablename__, record_id, link)
+    return
+  head = urllib.request.Request(link, method='HEAD', headers={'User-Agent': 'fyyur-image-check'})
+  try:
+    with urllib.request.urlopen(head, timeout=app.config['IMAGE_CHECK_TIMEOUT']) as response:
+      content_type = response.headers.get('Content-Type', '')
+  except urllib.error.HTTPError as e:
+    if e.code >= 500:
+      raise
+    app.logger.warning('%s %s: image_link %s answered %d', model.__tablename__, record_id, link, e.code)
+    return
+  if not content_type.startswith('image/'):
+    app.logger.warning('%s %s: image_link %s is %s, not an image',
+                       model.__tablename__, record_id, link, content_type or 'untyped')
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -57,100 +477,153 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
-  
-  venues = Venue.query.all()
-  data = []
-
-  for venue in venues:
-    num_upcoming_shows = Venue.query.join(shows_table).filter(Venue.id==venue.id).filter(shows_table.c.start_date > datetime.now()).count()
-
-    new_data = {
-      'city': venue.city,
-      'state': venue.state,
-      'venues': [{
-        'id': venue.id,
-        'name': venue.name,
-        'num_upcoming_shows': num_upcoming_shows,
-      }]
-    }
+def venues_page():
+  # one page of venues, keyset-paginated on (name, id), each with its count
+  # of upcoming shows read from the counter on the row (see counters.py)
+  cursor, per_page = page_args(app.config['VENUES_PER_PAGE'])
+  query = db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')) \
+    .filter(live(Venue), *(location_filters(Venue) + genre_filters(Venue, venue_genres.c.venue_id)))
+  return paginate(query, [Venue.name, Venue.id], lambda v: (v.name, v.id), cursor, per_page)
 
-    if len(data) == 0:
-      data.append(new_data)
-      continue
-    
-    size = 0
-    for item in data:
-      if item['city']==new_data['city'] and item['state']==new_data['state']:
-        item['venues'].extend(new_data['venues'])
-        break
-      else:
-        size += 1
-        if size == len(data):
-          data.append(new_data)
 
-  return render_template('pages/venues.html', areas=data)
+@app.route('/venues')
+@query_budget(2)
+@conditional('Venue', time_window=True)
+def venues():
+  page = venues_page()
+
+  areas = {}
+  for venue in page.items:
+    area = areas.get((venue.city, venue.state))
+    if area is None:
+      area = areas[(venue.city, venue.state)] = {'city': venue.city, 'state': venue.state, 'venues': []}
+    area['venues'].append({
+      'id': venue.id,
+      'name': venue.name,
+      'num_upcoming_shows': venue.num_upcoming_shows,
+    })
+
+  # each area block is rendered once per venue-table version and query string
+  token = table_versions.stamp('Venue')[0]
+  prefix = 'fragment:venue-area:%s:%s:' % (token, request.query_string.decode('utf-8'))
+  fragments = [
+    render_fragment(prefix + '%s|%s' % (area['city'], area['state']), 'pages/venue_area.html', area=area)
+    for area in areas.values()
+  ]
+
+  return render_template('pages/venues.html', areas=fragments, page=page,
+    facets=genre_facets(Venue, venue_genres.c.venue_id))
+
+
+@app.route('/venues.json')
+@query_budget(2)
+@conditional('Venue', time_window=True)
+def venues_json():
+  page = venues_page()
+  data = [{
+    'id': venue.id,
+    'name': venue.name,
+    'city': venue.city,
+    'state': venue.state,
+    'num_upcoming_shows': venue.num_upcoming_shows,
+  } for venue in page.items]
+  facets = [{'name': f['name'], 'count': f['count']} for f in genre_facets(Venue, venue_genres.c.venue_id)]
+  return jsonify(data=data, facets=facets, **page.to_dict())
+
+
+def nearby_origin():
+  # the point to search around: ?lat=&lng=, or ?city=&state= placed by the
+  # gazetteer; None when neither is given
+  if request.args.get('lat') or request.args.get('lng'):
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+      abort(400)
+    return lat, lng
+  if request.args.get('state'):
+    origin = geo.geocode(request.args.get('city'), request.args['state'])
+    if origin is None:
+      abort(400)
+    return origin
+  return None
+
+
+def nearby_venues_data():
+  # ?k= venues nearest the origin, within ?within= km, with upcoming shows
+  # unless ?all=1
+  k = request.args.get('k', app.config['NEARBY_DEFAULT_K'], type=int)
+  within = request.args.get('within', app.config['NEARBY_MAX_KM'], type=float)
+  k = max(1, min(k, app.config['NEARBY_MAX_K']))
+  within = max(0.0, min(within, app.config['NEARBY_MAX_KM']))
+  origin = nearby_origin()
+  if origin is None:
+    return None, [], within
+  return origin, geo.nearest(origin[0], origin[1], k, within, request.args.get('all') != '1'), within
+
+
+@app.route('/venues/nearby')
+@query_budget(6)
+@conditional('Venue', time_window=True)
+def nearby_venues():
+  origin, venues, within = nearby_venues_data()
+  return render_template('pages/nearby.html', origin=origin, venues=venues, within=within)
+
+
+@app.route('/venues/nearby.json')
+@query_budget(6)
+@conditional('Venue', time_window=True)
+def nearby_venues_json():
+  origin, venues, within = nearby_venues_data()
+  if origin is None:
+    abort(400)
+  return jsonify(origin={'latitude': origin[0], 'longitude': origin[1]}, within_km=within, data=venues)
 
 
 @app.route('/venues/search', methods=['POST'])
+@query_budget(1)
 def search_venues():
-  # search on artists with case-insensitive partial string search
-  term = request.form.get('search_term', '')
-  term = '%'+term+'%'
-  queried_data = db.session.query(Venue).filter(Venue.name.ilike(term)).all()
+  # ranked, case-insensitive partial search on name, city, state and genres
+  search_term = request.form.get('search_term', '')
+  queried_data = search.search(Venue, search_term)
   response={
     "count": len(queried_data),
     "data": queried_data
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  
-  venue = Venue.query.filter(Venue.id==venue_id).first()
-
-  past_shows_list = []
-  past_shows = db.session.query(Artist.id, Artist.name, Artist.image_link, shows_table.c.start_date) \
-    .select_from(shows_table).join(Artist, shows_table.c.artist_id==Artist.id) \
-      .join(Venue, shows_table.c.venue_id==Venue.id) \
-        .filter(Venue.id==venue.id) \
-          .filter(shows_table.c.start_date < datetime.now()) \
-            .all()
-
-  for item in past_shows:
-    add_show = {
-      'artist_id': item[0],
-      'artist_name': item[1],
-      'artist_image_link': item[2],
-      'start_time': str(item[3])
-    }
-    past_shows_list.append(add_show)
-  
+def venue_page_data(venue_id, past_limit, upcoming_limit):
+  venue = get_live_or_404(Venue, venue_id)
+  return venue_context(venue, venue_timeline(venue.id, past_limit, upcoming_limit))
 
-  upcoming_shows_list = []
-  upcoming_shows = db.session.query(Artist.id, Artist.name, Artist.image_link, shows_table.c.start_date) \
-    .select_from(shows_table).join(Artist, shows_table.c.artist_id==Artist.id) \
-      .join(Venue, shows_table.c.venue_id==Venue.id) \
-        .filter(Venue.id==venue.id) \
-          .filter(shows_table.c.start_date > datetime.now()) \
-            .all()
-  
-  for item in upcoming_shows:
-    add_show = {
-      'artist_id': item[0],
-      'artist_name': item[1],
-      'artist_image_link': item[2],
-      'start_time': str(item[3])
+
+def cached_venue_data(venue_id, past_limit, upcoming_limit):
+  # the default view is served from the page cache
+  cacheable = past_limit == upcoming_limit == app.config['TIMELINE_PAGE_SIZE']
+  data = page_cache.get(venue_key(venue_id)) if cacheable else None
+  if data is None:
+    data = venue_page_data(venue_id, past_limit, upcoming_limit)
+    if cacheable:
+      page_cache.set(venue_key(venue_id), data)
+  return data
+
+
+def venue_context(venue, timeline):
+  # the show_venue.html context for a venue row and its timeline
+  def show_data(item):
+    return {
+      'artist_id': item.artist_id,
+      'artist_name': item.artist_name,
+      'artist_image_link': item.artist_image_link,
+      'start_time': item.start_date
     }
-    upcoming_shows_list.append(add_show)
 
-  data = {
+  return {
     'id': venue.id,
     'name': venue.name,
-    'genres': venue.genres,
+    'genres': split_genres(venue.genres),
     'city': venue.city,
     'state': venue.state,
     'phone': venue.phone,
@@ -158,14 +631,25 @@ def show_venue(venue_id):
     'website': venue.website_link,
     'facebook_link': venue.facebook_link,
     'seeking_talent': venue.looking_for_talent,
+    'seeking_description': venue.seeking_description,
     'image_link': venue.image_link,
-    'past_shows': past_shows_list,
-    'upcoming_shows': upcoming_shows_list,
-    'past_shows_count': len(past_shows_list),
-    'upcoming_shows_count': len(upcoming_shows_list),
+    'past_shows': [show_data(item) for item in timeline.past],
+    'upcoming_shows': [show_data(item) for item in timeline.upcoming],
+    'past_shows_count': timeline.past_count,
+    'upcoming_shows_count': timeline.upcoming_count,
+    'more_past_shows': timeline.more_past,
+    'more_upcoming_shows': timeline.more_upcoming,
   }
 
-  return render_template('pages/show_venue.html', venue=data)
+
+@app.route('/venues/<int:venue_id>')
+@query_budget(3)
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  past_limit, upcoming_limit = timeline_limits()
+  data = cached_venue_data(venue_id, past_limit, upcoming_limit)
+  return render_template('pages/show_venue.html', venue=data,
+    past_limit=past_limit, upcoming_limit=upcoming_limit)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -178,126 +662,154 @@ def create_venue_form():
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # insert form data as a new Venue record in the db
-  try:    
-    print(True if request.form.get('seeking_talent') == "y" else False) # for debugging
-    
+  try:
     venue = Venue(
       name = request.form['name'],
       city = request.form['city'],
       state = request.form['state'],
       address = request.form['address'],
       phone = request.form['phone'],
-      genres = request.form['genres'],
       facebook_link = request.form['facebook_link'],
       image_link = request.form['image_link'],
       website_link = request.form['website_link'],
       looking_for_talent = True if request.form.get('seeking_talent') == "y" else False,
       seeking_description = request.form['seeking_description']
     )
+    set_genres(venue, request.form.getlist('genres'))
     db.session.add(venue)
+    db.session.flush()
+    venue_id = venue.id
     db.session.commit()
-    # on successful db insert, flash success
-    flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except Exception as e:
+  except Exception:
     db.session.rollback()
-    print(request.form.get('seeking_talent')) # for debugging
-    print(e) # for debuggin
+    app.logger.exception('could not create venue %r', request.form.get('name'))
     flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed')
+    return render_template('pages/home.html')
   finally:
     db.session.close()
+  # saved: what follows the commit cannot undo the listing
+  table_versions.bump('Venue')
+  tasks.fire('venue.saved', venue_id=venue_id)
+  # on successful db insert, flash success
+  flash('Venue ' + request.form['name'] + ' was successfully listed!')
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # delete a record. Handle cases where the session commit could fail.
-  try:
-    Venue.query.filter(Venue.id==venue_id).delete()
-    db.session.commit()
-  except:
-    db.session.rollback()
-  finally:
-    db.session.close()
-  return jsonify({'success': True})
+  return delete_records(Venue, [venue_id])
+
+
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+  return delete_records(Venue, requested_ids())
 
 #  Artists
 #  ----------------------------------------------------------------
+def artists_page():
+  cursor, per_page = page_args(app.config['ARTISTS_PER_PAGE'])
+  query = db.session.query(Artist.id, Artist.name) \
+    .filter(live(Artist), *(location_filters(Artist) + genre_filters(Artist, artist_genres.c.artist_id)))
+  return paginate(query, [Artist.name, Artist.id], lambda a: (a.name, a.id), cursor, per_page)
+
+
 @app.route('/artists')
+@query_budget(2)
+@conditional('Artist')
 def artists():
   # return artists data returned from querying the database
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  page = artists_page()
+  return render_template('pages/artists.html', artists=page.items, page=page,
+    facets=genre_facets(Artist, artist_genres.c.artist_id))
+
+
+@app.route('/artists.json')
+@query_budget(2)
+@conditional('Artist')
+def artists_json():
+  page = artists_page()
+  data = [{'id': artist.id, 'name': artist.name} for artist in page.items]
+  facets = [{'name': f['name'], 'count': f['count']} for f in genre_facets(Artist, artist_genres.c.artist_id)]
+  return jsonify(data=data, facets=facets, **page.to_dict())
 
 
 @app.route('/artists/search', methods=['POST'])
+@query_budget(1)
 def search_artists():
-  # implement search on artists with case-insensitive partial string search
-  term = request.form.get('search_term', '')
-  term = '%'+term+'%'
-  queried_data = db.session.query(Artist).filter(Artist.name.ilike(term)).all()
+  # ranked, case-insensitive partial search on name, city, state and genres
+  search_term = request.form.get('search_term', '')
+  queried_data = search.search(Artist, search_term)
   response={
     "count": len(queried_data),
     "data": queried_data
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # shows the artist page with the given artist_id
-  artist = Artist.query.filter(Artist.id==artist_id).first()
-
-  past_shows_list = []
-  past_shows = db.session.query(Venue.id, Venue.name, Venue.image_link, shows_table.c.start_date) \
-    .select_from(shows_table).join(Artist, shows_table.c.artist_id==Artist.id) \
-      .join(Venue, shows_table.c.venue_id==Venue.id) \
-        .filter(Artist.id==artist.id) \
-          .filter(shows_table.c.start_date < datetime.now()) \
-            .all()
-
-  for item in past_shows:
-    add_show = {
-      'venue_id': item[0],
-      'venue_name': item[1],
-      'venue_image_link': item[2],
-      'start_time': str(item[3])
-    }
-    past_shows_list.append(add_show)
-  
-  upcoming_shows_list = []
-  upcoming_shows = db.session.query(Venue.id, Venue.name, Venue.image_link, shows_table.c.start_date) \
-    .select_from(shows_table).join(Artist, shows_table.c.artist_id==Artist.id) \
-      .join(Venue, shows_table.c.venue_id==Venue.id) \
-        .filter(Artist.id==artist.id) \
-          .filter(shows_table.c.start_date > datetime.now()) \
-            .all()
-  
-  for item in upcoming_shows:
-    add_show = {
-      'venue_id': item[0],
-      'venue_name': item[1],
-      'venue_image_link': item[2],
-      'start_time': str(item[3])
+def artist_page_data(artist_id, past_limit, upcoming_limit):
+  artist = get_live_or_404(Artist, artist_id)
+  return artist_context(artist, artist_timeline(artist.id, past_limit, upcoming_limit))
+
+
+def cached_artist_data(artist_id, past_limit, upcoming_limit):
+  # the default view is served from the page cache
+  cacheable = past_limit == upcoming_limit == app.config['TIMELINE_PAGE_SIZE']
+  data = page_cache.get(artist_key(artist_id)) if cacheable else None
+  if data is None:
+    data = artist_page_data(artist_id, past_limit, upcoming_limit)
+    if cacheable:
+      page_cache.set(artist_key(artist_id), data)
+  return data
+
+
+def artist_context(artist, timeline):
+  # the show_artist.html context for an artist row and its timeline
+  def show_data(item):
+    return {
+      'venue_id': item.venue_id,
+      'venue_name': item.venue_name,
+      'venue_image_link': item.venue_image_link,
+      'start_time': item.start_date
     }
-    upcoming_shows_list.append(add_show)
 
-  data = {
+  return {
     'id': artist.id,
     'name': artist.name,
-    'genres': artist.genres,
+    'genres': split_genres(artist.genres),
     'city': artist.city,
     'state': artist.state,
     'phone': artist.phone,
     'website': artist.website_link,
     'facebook_link': artist.facebook_link,
     'seeking_venue': artist.seeking_venue,
+    'seeking_description': artist.seeking_description,
     'image_link': artist.image_link,
-    'past_shows': past_shows_list,
-    'upcoming_shows': upcoming_shows_list,
-    'past_shows_count': len(past_shows_list),
-    'upcoming_shows_count': len(upcoming_shows_list),
+    'past_shows': [show_data(item) for item in timeline.past],
+    'upcoming_shows': [show_data(item) for item in timeline.upcoming],
+    'past_shows_count': timeline.past_count,
+    'upcoming_shows_count': timeline.upcoming_count,
+    'more_past_shows': timeline.more_past,
+    'more_upcoming_shows': timeline.more_upcoming,
   }
 
-  return render_template('pages/show_artist.html', artist=data)
+
+@app.route('/artists/<int:artist_id>')
+@query_budget(3)
+def show_artist(artist_id):
+  # shows the artist page with the given artist_id
+  past_limit, upcoming_limit = timeline_limits()
+  data = cached_artist_data(artist_id, past_limit, upcoming_limit)
+  return render_template('pages/show_artist.html', artist=data,
+    past_limit=past_limit, upcoming_limit=upcoming_limit)
+
+
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  return delete_records(Artist, [artist_id])
+
+
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+  return delete_records(Artist, requested_ids())
 
 
 #  Update
@@ -307,42 +819,46 @@ def edit_artist(artist_id):
   form = ArtistForm()
   
   # populate form with fields from artist with ID <artist_id>
-  artist = Artist.query.filter(Artist.id == artist_id).first()
-  form.name.data = artist.name,
+  artist = get_live_or_404(Artist, artist_id)
+  form.name.data = artist.name
   form.city.data = artist.city
   form.state.data = artist.state
   form.phone.data = artist.phone
-  form.genres.data = artist.genres
+  form.genres.data = split_genres(artist.genres)
   form.facebook_link.data = artist.facebook_link
   form.image_link.data = artist.image_link
   form.website_link.data = artist.website_link
   form.seeking_venue.data = artist.seeking_venue
   form.seeking_description.data = artist.seeking_description
+  form.version.data = artist.version
     
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
+  # update only the columns the form changed, unless the artist was edited
+  # by someone else since the form was loaded
+  form = ArtistForm(request.form)
   try:
-    artist = Artist.query.filter(Artist.id == artist_id).first()
-    artist.name = request.form['name']
-    artist.city = request.form['city']
-    artist.state = request.form['state']
-    artist.phone = request.form['phone']
-    artist.genres = request.form['genres']
-    artist.facebook_link = request.form['facebook_link']
-    artist.image_link = request.form['image_link']
-    artist.website_link = request.form['website_link']
-    artist.seeking_venue = True if request.form.get('seeking_venue') == "y" else False
-    artist.seeking_description = request.form['seeking_description']
-    db.session.commit()
-  except:
+    changes = save_edit(Artist, artist_id, form, ARTIST_EDIT_FIELDS, artist_genres, 'artist_id')
+  except HTTPException:
+    raise
+  except IntegrityError:
+    return edit_rejected(Artist, artist_id, form, 'forms/edit_artist.html')
+  except Exception:
     db.session.rollback()
-  finally:
-    db.session.close()  
+    app.logger.exception('could not update artist %s', artist_id)
+    flash('An error occurred. Your changes to artist ' + str(artist_id) + ' were not saved.')
+    changes = {}
+  if changes is None:
+    return edit_conflict(Artist, artist_id, form, 'forms/edit_artist.html')
+  if changes:
+    table_versions.bump('Artist')
+    invalidate_pages(artist_ids=[artist_id])
+    if changes.keys() & MENTIONED_COLUMNS:
+      invalidate_mentions(Artist, artist_id)
+    tasks.fire('artist.saved', artist_id=artist_id, changed=sorted(changes))
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 
@@ -351,40 +867,45 @@ def edit_venue(venue_id):
   form = VenueForm()
   
   # populate form with values from venue with ID <venue_id>
-  venue = Venue.query.filter(Venue.id == venue_id).first()
+  venue = get_live_or_404(Venue, venue_id)
   form.name.data = venue.name
   form.city.data = venue.city
   form.state.data = venue.state
+  form.address.data = venue.address
   form.phone.data = venue.phone
-  form.genres.data = venue.genres
+  form.genres.data = split_genres(venue.genres)
   form.facebook_link.data = venue.facebook_link
   form.image_link.data = venue.image_link
   form.website_link.data = venue.website_link
   form.seeking_talent.data = venue.looking_for_talent
   form.seeking_description.data = venue.seeking_description
+  form.version.data = venue.version
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  # update only the columns the form changed, unless the venue was edited
+  # by someone else since the form was loaded
+  form = VenueForm(request.form)
   try:
-    venue = Venue.query.filter(Venue.id == venue_id).first()
-    venue.name = request.form['name']
-    venue.city = request.form['city']
-    venue.state = request.form['state']
-    venue.phone = request.form['phone']
-    venue.genres = request.form['genres']
-    venue.facebook_link = request.form['facebook_link']
-    venue.image_link = request.form['image_link']
-    venue.website_link = request.form['website_link']
-    venue.seeking_talent = True if request.form.get('seeking_talent') == "y" else False
-    venue.seeking_description = request.form['seeking_description']
-    db.session.commit()
-  except:
+    changes = save_edit(Venue, venue_id, form, VENUE_EDIT_FIELDS, venue_genres, 'venue_id')
+  except HTTPException:
+    raise
+  except IntegrityError:
+    return edit_rejected(Venue, venue_id, form, 'forms/edit_venue.html')
+  except Exception:
     db.session.rollback()
-  finally:
-    db.session.close()  
+    app.logger.exception('could not update venue %s', venue_id)
+    flash('An error occurred. Your changes to venue ' + str(venue_id) + ' were not saved.')
+    changes = {}
+  if changes is None:
+    return edit_conflict(Venue, venue_id, form, 'forms/edit_venue.html')
+  if changes:
+    table_versions.bump('Venue')
+    invalidate_pages(venue_ids=[venue_id])
+    if changes.keys() & MENTIONED_COLUMNS:
+      invalidate_mentions(Venue, venue_id)
+    tasks.fire('venue.saved', venue_id=venue_id, changed=sorted(changes))
   return redirect(url_for('show_venue', venue_id=venue_id))
   
 
@@ -406,50 +927,228 @@ def create_artist_submission():
       city = request.form['city'],
       state = request.form['state'],
       phone = request.form['phone'],
-      genres = request.form['genres'],
       facebook_link = request.form['facebook_link'],
       image_link = request.form['image_link'],
       website_link = request.form['website_link'],
       seeking_venue = True if request.form.get('seeking_venue') == "y" else False,
       seeking_description = request.form['seeking_description']
     )
+    set_genres(artist, request.form.getlist('genres'))
     db.session.add(artist)
+    db.session.flush()
+    artist_id = artist.id
     db.session.commit()
-    # on successful db insert, flash success
-    flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  except Exception as e:
+  except Exception:
     db.session.rollback()
-    print(e)
+    app.logger.exception('could not create artist %r', request.form.get('name'))
     # on unsuccessful db insert, flash an error instead
     # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
     flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed')
+    return render_template('pages/home.html')
+  finally:
+    db.session.close()
+  # saved: what follows the commit cannot undo the listing
+  table_versions.bump('Artist')
+  tasks.fire('artist.saved', artist_id=artist_id)
+  # on successful db insert, flash success
+  flash('Artist ' + request.form['name'] + ' was successfully listed!')
   return render_template('pages/home.html')
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
+# /shows and its calendar take the same filters:
+#
+#   ?from=2026-11-06&to=2026-11-08    dates (to is inclusive) or datetimes
+#   ?when=today|tomorrow|weekend|week|month|all
+#   ?city=&state=&venue_id=&artist_id=
+#
+# Without from/when the listing starts at the beginning of today. Every
+# filter is a range or equality on an indexed column: start_date alone, or
+# (venue_id, start_date) / (artist_id, start_date), or Venue (state, city).
+
+SHOW_PERIODS = ('today', 'tomorrow', 'weekend', 'week', 'month', 'all')
+CALENDAR_BUCKETS = ('day', 'week', 'month')
+
+
+def _range_bound(value, end=False):
+  # a date (inclusive as an end) or a datetime from a query string
+  try:
+    day = date.fromisoformat(value)
+    return datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+  except ValueError:
+    pass
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    abort(400)
+
+
+def period_range(period, now=None):
+  # [start, end) of a named period around now; end None is open
+  now = now or datetime.now()
+  today = datetime.combine(now.date(), datetime.min.time())
+  if period == 'today':
+    return today, today + timedelta(days=1)
+  if period == 'tomorrow':
+    return today + timedelta(days=1), today + timedelta(days=2)
+  if period == 'weekend':
+    # Saturday and Sunday of this week; from today when it is one of them
+    saturday = today + timedelta(days=5 - today.weekday())
+    return max(saturday, today), saturday + timedelta(days=2)
+  if period == 'week':
+    return today, today + timedelta(days=7)
+  if period == 'month':
+    return today, datetime(today.year + today.month // 12, today.month % 12 + 1, 1)
+  if period == 'all':
+    return None, None
+  abort(400)
+
+
+def show_range():
+  when = request.args.get('when')
+  if when:
+    return period_range(when)
+  start = request.args.get('from')
+  end = request.args.get('to')
+  start = _range_bound(start) if start else datetime.combine(date.today(), datetime.min.time())
+  return start, _range_bound(end, end=True) if end else None
+
+
+def show_filters():
+  # WHERE conditions for the shows asked for; the city/state ones need Venue
+  start, end = show_range()
+  conditions = []
+  if start is not None:
+    conditions.append(Show.start_date >= start)
+  if end is not None:
+    conditions.append(Show.start_date < end)
+  for column, field in ((Show.venue_id, 'venue_id'), (Show.artist_id, 'artist_id')):
+    if request.args.get(field):
+      value = request.args.get(field, type=int)
+      if value is None:
+        abort(400)
+      conditions.append(column == value)
+  return conditions + location_filters(Venue)
+
+
+def date_bucket(column, unit):
+  # start of the day/week/month a timestamp falls in, computed by the
+  # database; weeks start on Monday as with PostgreSQL's date_trunc
+  if db.engine.dialect.name == 'postgresql':
+    return db.func.date_trunc(db.literal_column("'%s'" % unit), column)
+  if unit == 'day':
+    return db.func.date(column)
+  if unit == 'week':
+    return db.func.date(column, db.literal_column("'weekday 0'"), db.literal_column("'-6 days'"))
+  return db.func.strftime(db.literal_column("'%Y-%m-01'"), column)
+
+
+def shows_statement():
+  # one page of the shows matching show_filters(), keyset-paginated on
+  # (start_date, id); returns the statement and the arguments build_page()
+  # needs for its rows
+  cursor, per_page = page_args(app.config['SHOWS_PER_PAGE'])
+  statement = db.select(
+      Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+      Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'), Show.start_date, Show.id) \
+    .select_from(Show).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id==Show.artist_id) \
+    .where(live(Venue), live(Artist), *show_filters())
+  statement, direction = keyset(statement, [Show.start_date, Show.id], cursor, per_page)
+  return statement, (direction, cursor, per_page, lambda s: (s.start_date, s.id))
+
+
+def shows_page():
+  statement, page_spec = shows_statement()
+  return build_page(db.session.execute(statement), *page_spec)
+
+
+def show_entry(q):
+  return {
+    'venue_id': q.venue_id,
+    'venue_name': q.venue_name,
+    'artist_id': q.artist_id,
+    'artist_name': q.artist_name,
+    'artist_image_link': q.artist_image_link,
+    'start_time': q.start_date
+  }
+
+
 @app.route('/shows')
+@query_budget(1)
+@conditional('Show', 'Venue', 'Artist', time_window=True)
 def shows():
   # displays list of shows at /shows
-  query = db.session.query(Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, shows_table.c.start_date) \
-    .select_from(shows_table).join(Venue, Venue.id == shows_table.c.venue_id).join(Artist, Artist.id==shows_table.c.artist_id) \
-      .all()
-  
-  data = []
-
-  for q in query:
-    new_entry = {
-      'venue_id': q[0],
-      'venue_name': q[1],
-      'artist_id': q[2],
-      'artist_name': q[3],
-      'artist_image_link': q[4],
-      'start_time': str(q[5])
-    }
-    data.append(new_entry)
-
-  return render_template('pages/shows.html', shows=data)
+  page = shows_page()
+  data = [show_entry(q) for q in page.items]
+  return render_template('pages/shows.html', shows=data, page=page)
+
+
+@app.route('/shows.json')
+@query_budget(1)
+@conditional('Show', 'Venue', 'Artist', time_window=True)
+def shows_json():
+  page = shows_page()
+  data = [{
+    'venue_id': q.venue_id,
+    'venue_name': q.venue_name,
+    'artist_id': q.artist_id,
+    'artist_name': q.artist_name,
+    'artist_image_link': q.artist_image_link,
+    'start_time': q.start_date.isoformat() if q.start_date else None,
+  } for q in page.items]
+  return jsonify(data=data, **page.to_dict())
+
+
+def calendar_buckets():
+  # show counts per day, week or month for the current filters, grouped by
+  # the database in one query over the start_date range
+  unit = request.args.get('bucket', 'day')
+  if unit not in CALENDAR_BUCKETS:
+    abort(400)
+  bucket = date_bucket(Show.start_date, unit).label('bucket')
+  statement = db.select(bucket, db.func.count().label('shows')).select_from(Show) \
+    .join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  statement = statement.where(live(Venue), live(Artist), *show_filters()).group_by(bucket).order_by(bucket) \
+    .limit(app.config['CALENDAR_MAX_BUCKETS'])
+
+  step = {'day': timedelta(days=1), 'week': timedelta(days=7)}.get(unit)
+  args = dict((field, request.args[field]) for field in ('city', 'state', 'venue_id', 'artist_id')
+              if request.args.get(field))
+  buckets = []
+  for value, count in db.session.execute(statement):
+    # PostgreSQL returns a timestamp, SQLite a 'YYYY-MM-DD' string
+    start = value.date() if isinstance(value, datetime) else date.fromisoformat(str(value)[:10])
+    if step:
+      end = start + step - timedelta(days=1)
+    else:
+      end = date(start.year + start.month // 12, start.month % 12 + 1, 1) - timedelta(days=1)
+    buckets.append({
+      'start': start,
+      'end': end,
+      'shows': count,
+      'url': url_for('shows', **dict(args, **{'from': start.isoformat(), 'to': end.isoformat()})),
+    })
+  return unit, buckets
+
+
+@app.route('/shows/calendar')
+@query_budget(1)
+@conditional('Show', 'Venue', time_window=True)
+def shows_calendar():
+  unit, buckets = calendar_buckets()
+  return render_template('pages/calendar.html', unit=unit, buckets=buckets, units=CALENDAR_BUCKETS)
+
+
+@app.route('/shows/calendar.json')
+@query_budget(1)
+@conditional('Show', 'Venue', time_window=True)
+def shows_calendar_json():
+  unit, buckets = calendar_buckets()
+  return jsonify(bucket=unit, data=[dict(b, start=b['start'].isoformat(), end=b['end'].isoformat())
+                                    for b in buckets])
 
 @app.route('/shows/create')
 def create_shows():
@@ -462,17 +1161,21 @@ def create_show_submission():
   # insert form data as a new Show record in the db
   try:
     
-    artist = Artist.query.filter(Artist.id==request.form['artist_id']).first()
-    venue = Venue.query.filter(Venue.id==request.form['venue_id']).first()
-    start_time = request.form['start_time']
-    show = shows_table.insert().values(artist_id=artist.id, venue_id=venue.id, start_date=start_time)
-    db.session.execute(show)
+    artist = Artist.query.filter(Artist.id==request.form['artist_id'], live(Artist)).first()
+    venue = Venue.query.filter(Venue.id==request.form['venue_id'], live(Venue)).first()
+    start_time = stored_datetime(dateutil.parser.parse(request.form['start_time']))
+    show = Show(artist_id=artist.id, venue_id=venue.id, start_date=start_time)
+    db.session.add(show)
+    db.session.flush()
+    counters.shows_added([(venue.id, artist.id, start_time)])
     db.session.commit()
+    table_versions.bump('Show', 'Venue', 'Artist')
+    invalidate_pages(venue_ids=[venue.id], artist_ids=[artist.id])
     # on successful db insert, flash success
     flash('Show was successfully listed!')
-  except Exception as e:
+  except Exception:
     db.session.rollback()
-    print(e)
+    app.logger.exception('could not create show')
     # on unsuccessful db insert will flash an error instead
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     flash('An error occurred. Show could not be listed.')
@@ -480,6 +1183,32 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, jsonl):format>')
+@query_budget(1)
+def export_catalog(kind, format):
+  # the whole table, streamed in batches from a server-side cursor
+  mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+  response = Response(stream_with_context(exporter.export(kind, format)), mimetype=mimetype)
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+  return response
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def metrics():
+  # per-process counters for the connection pool, the page cache, the
+  # background tasks and the read replicas
+  return jsonify({
+    'pool': pool_stats.to_dict(db.engine.pool),
+    'cache': page_cache.stats(),
+    'tasks': tasks.runner.metrics(),
+    'replicas': replicas.router.metrics(),
+  })
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -499,6 +1228,44 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+import api
+api.init_app(app)
+
+#----------------------------------------------------------------------------#
+# Warm-up.
+#----------------------------------------------------------------------------#
+
+# The app is assembled at import time above, and so are the objects built
+# from its configuration (page cache, version stamps, replicas, task runner,
+# profiling, sessions): configure it through the environment that config.py
+# reads. create_app() returns it warmed up, so the one-off costs of a first
+# request are paid before gunicorn forks its workers (see wsgi.py and
+# gunicorn.conf.py): mapper configuration, every Jinja template compiled,
+# Babel's locale data, the URL map, and SQL compilation for the
+# WARM_UP_PATHS requested through a test client.
+
+def warm_up(app):
+  configure_mappers()
+  for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+    app.jinja_env.get_template(name)
+  for locale in app.config['LOCALES']:
+    for format in DATETIME_FORMATS:
+      format_datetime(datetime.now(), format, locale)
+  with app.test_request_context():
+    url_for('index')
+
+  client = app.test_client()
+  for path in app.config['WARM_UP_PATHS']:
+    try:
+      client.get(path)
+    except Exception:
+      app.logger.exception('warm-up request to %s failed', path)
+  return app
+
+
+def create_app(warm=True):
+  return warm_up(app) if warm else app
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -509,8 +1276,8 @@ if not app.debug:
 
 # Or specify port manually:
 
+# Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 2022))
-    app.debug=True
     app.run(host='0.0.0.0', port=port)
 
@@ -0,0 +1,357 @@
+import asyncio
+import contextvars
+import io
+import sys
+import threading
+from flask import abort, render_template, request
+from sqlalchemy.engine import make_url
+from app import app, db, page_cache, conditional, timeline_limits, venue_context, artist_context, \
+  shows_statement, show_entry
+from cache import venue_key, artist_key
+from models import Venue, Artist, live
+from pagination import build_page
+from profiling import query_budget
+import search
+from timeline import venue_timeline_query, artist_timeline_query
+
+#----------------------------------------------------------------------------#
+# ASGI serving mode.
+#----------------------------------------------------------------------------#
+
+# Serve the app from an ASGI server with the read-heavy routes running as
+# coroutines on an async SQLAlchemy engine:
+#
+#   pip install uvicorn asyncpg        # aiosqlite for a SQLite database
+#   uvicorn asgi:application --workers 4
+#
+# The detail pages, /shows and the search endpoints are awaited on the event
+# loop, so a slow query parks the request instead of a worker thread. Every
+# other route (forms, writes, JSON, metrics) is the unchanged Flask view, run
+# on the loop's thread pool. Both kinds render the same Jinja templates inside
+# an ordinary Flask request context, so url_for, sessions, flashes,
+# before/after_request hooks and the error handlers all behave as under WSGI.
+#
+# The async engine takes the sync engine's URL with the driver swapped
+# (postgresql -> asyncpg, sqlite -> aiosqlite) unless ASYNC_DATABASE_URL is
+# set, and shares its pool settings.
+
+ASYNC_DRIVERS = {
+  'postgresql': ('postgresql+asyncpg', 'asyncpg'),
+  'postgres': ('postgresql+asyncpg', 'asyncpg'),
+  'sqlite': ('sqlite+aiosqlite', 'aiosqlite'),
+}
+
+
+def async_database_url(config):
+  url = make_url(config['ASYNC_DATABASE_URL'] or config['SQLALCHEMY_DATABASE_URI'])
+  if '+' in url.drivername and url.drivername.split('+')[1] in ('asyncpg', 'aiosqlite'):
+    return url
+  if url.get_backend_name() not in ASYNC_DRIVERS:
+    raise RuntimeError('no async driver known for %s; set ASYNC_DATABASE_URL' % url.drivername)
+  return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()][0])
+
+
+def create_engine(config):
+  from sqlalchemy.ext.asyncio import create_async_engine
+
+  url = async_database_url(config)
+  # the pool class and psycopg2 connect_args do not carry over
+  options = dict((key, value) for key, value in config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+                 if key not in ('poolclass', 'connect_args'))
+  if config['DB_STATEMENT_TIMEOUT'] and url.get_backend_name() == 'postgresql':
+    options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+  try:
+    return create_async_engine(url, **options)
+  except ImportError:
+    package = url.drivername.split('+')[1]
+    raise RuntimeError('the ASGI mode needs the %s package (pip install %s)' % (package, package))
+
+
+_engine = None
+
+
+def async_engine():
+  global _engine
+  if _engine is None:
+    _engine = create_engine(app.config)
+  return _engine
+
+
+async def in_thread(function, *args):
+  # run blocking work on the loop's thread pool, inside the current request
+  # context, with its own database session
+  def call():
+    try:
+      return function(*args)
+    finally:
+      db.session.remove()
+  return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, call)
+
+
+async def fetch_timeline(connection, query):
+  past_rows, upcoming_rows = query.split(await connection.execute(query.statement))
+  counts = None
+  if query.truncated(past_rows, upcoming_rows):
+    counts = (await connection.execute(query.count_statement)).one()
+  return query.timeline(past_rows, upcoming_rows, counts)
+
+
+async def fetch_row(connection, model, id):
+  row = (await connection.execute(db.select(model.__table__).where(model.id == id, live(model)))).first()
+  if row is None:
+    abort(404)
+  return row
+
+#----------------------------------------------------------------------------#
+# Async views.
+#----------------------------------------------------------------------------#
+
+# Keyed by the endpoint of the Flask view they replace; routing, query
+# budgets and conditional responses mirror the sync views in app.py.
+
+@query_budget(3)
+async def show_venue(venue_id):
+  past_limit, upcoming_limit = timeline_limits()
+  cacheable = past_limit == upcoming_limit == app.config['TIMELINE_PAGE_SIZE']
+  data = page_cache.get(venue_key(venue_id)) if cacheable else None
+  if data is None:
+    async with async_engine().connect() as connection:
+      venue = await fetch_row(connection, Venue, venue_id)
+      timeline = await fetch_timeline(connection, venue_timeline_query(venue.id, past_limit, upcoming_limit))
+    data = venue_context(venue, timeline)
+    if cacheable:
+      page_cache.set(venue_key(venue_id), data)
+
+  return render_template('pages/show_venue.html', venue=data,
+    past_limit=past_limit, upcoming_limit=upcoming_limit)
+
+
+@query_budget(3)
+async def show_artist(artist_id):
+  past_limit, upcoming_limit = timeline_limits()
+  cacheable = past_limit == upcoming_limit == app.config['TIMELINE_PAGE_SIZE']
+  data = page_cache.get(artist_key(artist_id)) if cacheable else None
+  if data is None:
+    async with async_engine().connect() as connection:
+      artist = await fetch_row(connection, Artist, artist_id)
+      timeline = await fetch_timeline(connection, artist_timeline_query(artist.id, past_limit, upcoming_limit))
+    data = artist_context(artist, timeline)
+    if cacheable:
+      page_cache.set(artist_key(artist_id), data)
+
+  return render_template('pages/show_artist.html', artist=data,
+    past_limit=past_limit, upcoming_limit=upcoming_limit)
+
+
+@query_budget(1)
+@conditional('Show', 'Venue', 'Artist', time_window=True)
+async def shows():
+  statement, page_spec = shows_statement()
+  async with async_engine().connect() as connection:
+    page = build_page(await connection.execute(statement), *page_spec)
+  return render_template('pages/shows.html', shows=[show_entry(q) for q in page.items], page=page)
+
+
+async def search_results(model, term):
+  statement = search.search_statement(model, term)
+  if statement is None:
+    # the in-process index answers without SQL once it is built
+    return await in_thread(search.search, model, term)
+  async with async_engine().connect() as connection:
+    return search.results(await connection.execute(statement))
+
+
+@query_budget(1)
+async def search_venues():
+  search_term = request.form.get('search_term', '')
+  queried_data = await search_results(Venue, search_term)
+  response = {'count': len(queried_data), 'data': queried_data}
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+
+@query_budget(1)
+async def search_artists():
+  search_term = request.form.get('search_term', '')
+  queried_data = await search_results(Artist, search_term)
+  response = {'count': len(queried_data), 'data': queried_data}
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+
+ASYNC_VIEWS = {
+  'show_venue': show_venue,
+  'show_artist': show_artist,
+  'shows': shows,
+  'search_venues': search_venues,
+  'search_artists': search_artists,
+}
+
+#----------------------------------------------------------------------------#
+# ASGI application.
+#----------------------------------------------------------------------------#
+
+# body chunks a sync view may run ahead of the client
+WSGI_QUEUE_SIZE = 16
+
+
+def build_environ(scope, body):
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+    'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope['query_string'].decode('latin-1'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+    'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name, value = name.decode('latin-1'), value.decode('latin-1')
+    if name == 'content-type':
+      key = 'CONTENT_TYPE'
+    elif name == 'content-length':
+      key = 'CONTENT_LENGTH'
+    else:
+      key = 'HTTP_' + name.upper().replace('-', '_')
+    environ[key] = environ[key] + ',' + value if key in environ else value
+  return environ
+
+
+async def read_body(receive):
+  body = b''
+  more_body = True
+  while more_body:
+    message = await receive()
+    body += message.get('body', b'')
+    more_body = message.get('more_body', False)
+  return body
+
+
+def _headers(headers):
+  return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class Application(object):
+
+  def __init__(self, flask_app, views):
+    self.app = flask_app
+    self.views = views
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      await self.lifespan(receive, send)
+    elif scope['type'] == 'http':
+      environ = build_environ(scope, await read_body(receive))
+      endpoint = self.endpoint(environ)
+      if endpoint in self.views:
+        await self.call_async(environ, self.views[endpoint], send)
+      else:
+        await self.call_wsgi(environ, send)
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        try:
+          async_engine()
+        except Exception as e:
+          await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+          return
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        if _engine is not None:
+          await _engine.dispose()
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+  def endpoint(self, environ):
+    try:
+      return self.app.url_map.bind_to_environ(environ).match()[0]
+    except Exception:
+      return None
+
+  async def call_async(self, environ, view, send):
+    # Flask's full_dispatch_request, awaiting the view
+    with self.app.request_context(environ):
+      try:
+        try:
+          rv = self.app.preprocess_request()
+          if rv is None:
+            rv = await view(**request.view_args)
+        except Exception as e:
+          rv = self.app.handle_user_exception(e)
+        response = self.app.finalize_request(rv)
+      except Exception as e:
+        response = self.app.handle_exception(e)
+      headers = response.get_wsgi_headers(environ)
+      body = b''.join(response.get_app_iter(environ))
+
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': _headers(headers.items())})
+    await send({'type': 'http.response.body', 'body': body})
+
+  async def call_wsgi(self, environ, send):
+    # run a sync view on the thread pool and forward its body chunk by chunk,
+    # so streamed responses stay streamed. The view, every chunk and close()
+    # run on one thread, as WSGI expects: the request context and the
+    # thread's database session live there. Chunks come back through a small
+    # queue, which holds the thread back when the client reads slowly.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(WSGI_QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def put(item):
+      if not stopped.is_set():
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+      started = []
+
+      def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+      try:
+        iterable = self.app.wsgi_app(environ, start_response)
+        try:
+          put(('start', started))
+          for chunk in iterable:
+            if stopped.is_set():
+              break
+            if chunk:
+              put(('body', chunk))
+        finally:
+          if hasattr(iterable, 'close'):
+            iterable.close()
+        put(('end', None))
+      except Exception as e:
+        put(('error', e))
+
+    producing = loop.run_in_executor(None, produce)
+    try:
+      while True:
+        kind, value = await queue.get()
+        if kind == 'start':
+          await send({'type': 'http.response.start', 'status': value[0], 'headers': _headers(value[1])})
+        elif kind == 'body':
+          await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+        elif kind == 'end':
+          await send({'type': 'http.response.body', 'body': b''})
+          break
+        else:
+          raise value
+    finally:
+      # a client that went away stops the thread after its current chunk
+      stopped.set()
+      while not queue.empty():
+        queue.get_nowait()
+      await producing
+
+
+application = Application(app, ASYNC_VIEWS)
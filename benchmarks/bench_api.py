@@ -0,0 +1,100 @@
+# Bytes on the wire and latency of the JSON API against the HTML pages.
+#
+#   python -m benchmarks.bench_api --scale small
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.bench_api --scale medium --no-generate
+#
+# Each pair requests the same data as an HTML page and as /api/v1 JSON
+# (whole records and a ?fields= selection) through the Flask test client
+# with the page cache off. Sizes are the body as sent, uncompressed and
+# with Accept-Encoding: gzip (and br when the brotli package is installed);
+# latency is p50/p95 of the uncompressed request.
+import argparse
+import gzip
+import os
+import random
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('CACHE_BACKEND', 'null')
+
+from app import app, db
+from models import Venue, Artist
+from benchmarks import datagen
+from benchmarks.run import percentile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAIRS = [
+    ('venues', '/venues', '/api/v1/venues', '/api/v1/venues?fields=id,name'),
+    ('venue', '/venues/{venue_id}', '/api/v1/venues/{venue_id}', '/api/v1/venues/{venue_id}?fields=id,name,genres'),
+    ('artists', '/artists', '/api/v1/artists', '/api/v1/artists?fields=id'),
+    ('artist', '/artists/{artist_id}', '/api/v1/artists/{artist_id}',
+     '/api/v1/artists/{artist_id}?fields=id,name,upcoming_shows'),
+    ('shows', '/shows', '/api/v1/shows', '/api/v1/shows?fields=venue_id,artist_id,start_time'),
+]
+
+
+def measure(client, path, ids, requests, rng):
+    latencies = []
+    for _ in range(requests):
+        url = path.format(venue_id=rng.choice(ids['venue']), artist_id=rng.choice(ids['artist']))
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError('{} returned {}'.format(url, response.status_code))
+
+    url = path.format(venue_id=ids['venue'][0], artist_id=ids['artist'][0])
+    raw = client.get(url).data
+    sizes = {'raw': len(raw)}
+    for encoding in ['gzip'] + (['br'] if brotli else []):
+        response = client.get(url, headers={'Accept-Encoding': encoding})
+        if response.headers.get('Content-Encoding') == encoding or path.startswith('/api/'):
+            # the API leaves bodies under API_COMPRESS_MIN_SIZE as they are
+            sizes[encoding] = len(response.data)
+        elif encoding == 'gzip':
+            # the HTML pages are sent as is; show what a compressing proxy would send
+            sizes[encoding] = len(gzip.compress(raw, 6))
+        else:
+            sizes[encoding] = len(brotli.compress(raw, quality=4))
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'sizes': sizes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(datagen.SCALES), default='small')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--no-generate', action='store_true', help='use the rows already in the database')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        if not args.no_generate:
+            datagen.generate(args.scale)
+        ids = {
+            'venue': [row[0] for row in db.session.query(Venue.id).limit(1000)],
+            'artist': [row[0] for row in db.session.query(Artist.id).limit(1000)],
+        }
+
+    client = app.test_client()
+    encodings = ['raw', 'gzip'] + (['br'] if brotli else [])
+    print('{:<10} {:<6} {:>9} {:>9} '.format('data', 'as', 'p50 ms', 'p95 ms')
+          + ' '.join('{:>10}'.format(encoding + ' B') for encoding in encodings))
+    for name, html, full, sparse in PAIRS:
+        for label, path in (('html', html), ('json', full), ('fields', sparse)):
+            measure(client, path, ids, 3, rng)  # warm up
+            result = measure(client, path, ids, args.requests, rng)
+            print('{:<10} {:<6} {:>9} {:>9} '.format(name, label, result['p50_ms'], result['p95_ms'])
+                  + ' '.join('{:>10}'.format(result['sizes'][encoding]) for encoding in encodings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Concurrent-request throughput of the sync WSGI server against the ASGI mode.
+#
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.bench_async \
+#       --concurrency 1,8,32,64 --seconds 10 --paths /shows,/venues/1,/artists/1
+#
+# Both servers run as subprocesses on the same database with the page cache
+# off: the WSGI side is the threaded server that `python app.py` starts, the
+# ASGI side is `uvicorn asgi:application`. Each concurrency level keeps that
+# many client threads requesting the paths round robin and reports req/s and
+# p50/p95 latency. Pass --generate to fill the database first; an in-memory
+# SQLite database cannot be shared between the processes.
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def serve_wsgi(port):
+    from app import app
+    app.run(host='127.0.0.1', port=port, threaded=True, use_reloader=False)
+
+
+def start(command, port, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:{}/'.format(port), timeout=1)
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    sys.exit('server did not start: ' + ' '.join(command))
+
+
+def load(port, paths, concurrency, seconds):
+    stop = time.perf_counter() + seconds
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def run(slot):
+        i = slot
+        while time.perf_counter() < stop:
+            url = 'http://127.0.0.1:{}{}'.format(port, paths[i % len(paths)])
+            i += 1
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(url, timeout=30).read()
+                latencies[slot].append((time.perf_counter() - started) * 1000)
+            except (urllib.error.URLError, ConnectionError):
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [ms for slot in latencies for ms in slot] or [0]
+    return {
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(samples, 50), 1),
+        'p95_ms': round(percentile(samples, 95), 1),
+        'errors': sum(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', default='1,8,32,64')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--paths', default='/shows,/venues/1,/artists/1')
+    parser.add_argument('--generate', metavar='SCALE', help='fill the database with a datagen scale first')
+    parser.add_argument('--wsgi-port', type=int, default=5081)
+    parser.add_argument('--asgi-port', type=int, default=5082)
+    parser.add_argument('--serve-wsgi', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi)
+
+    if os.getenv('DATABASE_URL', 'sqlite://') in ('sqlite://', 'sqlite:///:memory:'):
+        sys.exit('bench_async needs a database both servers can open, e.g. DATABASE_URL=sqlite:////tmp/fyyur.db')
+
+    if args.generate:
+        from app import app, db
+        from benchmarks import datagen
+        with app.app_context():
+            db.create_all()
+            datagen.generate(args.generate)
+
+    env = dict(os.environ, CACHE_BACKEND='null')
+    servers = [
+        ('wsgi', args.wsgi_port, [sys.executable, '-m', 'benchmarks.bench_async', '--serve-wsgi', str(args.wsgi_port)]),
+        ('asgi', args.asgi_port, [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                                  '--port', str(args.asgi_port), '--log-level', 'warning']),
+    ]
+    paths = args.paths.split(',')
+    results = {}
+    for name, port, command in servers:
+        process = start(command, port, env)
+        try:
+            for concurrency in args.concurrency.split(','):
+                load(port, paths, int(concurrency), 1)  # warm up
+                results[name, concurrency] = load(port, paths, int(concurrency), args.seconds)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print('{:>12} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8}'.format(
+        'concurrency', 'wsgi req/s', 'asgi req/s', 'wsgi p50', 'asgi p50', 'wsgi p95', 'asgi p95', 'errors'))
+    for concurrency in args.concurrency.split(','):
+        wsgi, asgi = results['wsgi', concurrency], results['asgi', concurrency]
+        print('{:>12} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8}'.format(
+            concurrency, wsgi['rps'], asgi['rps'], wsgi['p50_ms'], asgi['p50_ms'],
+            wsgi['p95_ms'], asgi['p95_ms'], wsgi['errors'] + asgi['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Render time of the /shows template at 10k tiles, by datetime filter.
+#
+#   python -m benchmarks.bench_datetime --tiles 10000 --runs 5
+#   LOCALES=en,fr TIMEZONE=UTC python -m benchmarks.bench_datetime --tz Europe/Paris
+#
+# No database: the tiles are built in memory and pages/shows.html is
+# rendered in a request context, so only templating and date formatting
+# are measured. "string" is the filter as it was, given str() values that
+# it parsed with dateutil and formatted with babel.dates.format_datetime
+# on every call; "datetime" is app.format_datetime given datetime objects,
+# with compiled patterns. "filter only" times the 10k filter calls alone.
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import app, format_datetime, DATETIME_FORMATS
+from pagination import Page
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format), locale='en')
+
+
+def tiles(count, as_string):
+    start = datetime(2026, 1, 1, 20, 0)
+    shows = []
+    for i in range(count):
+        start_time = start + timedelta(hours=7 * i, minutes=i % 60)
+        shows.append({
+            'venue_id': i % 500,
+            'venue_name': 'Venue %d' % (i % 500),
+            'artist_id': i % 900,
+            'artist_name': 'Artist %d' % (i % 900),
+            'artist_image_link': 'https://example.com/artists/%d.jpg' % (i % 900),
+            'start_time': str(start_time) if as_string else start_time,
+        })
+    return shows
+
+
+def best_of(runs, function):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(min(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tiles', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--locale', default='en', help='Accept-Language of the rendering request')
+    parser.add_argument('--tz', help='"tz" cookie of the rendering request')
+    args = parser.parse_args()
+
+    headers = {'Accept-Language': args.locale}
+    if args.tz:
+        headers['Cookie'] = 'tz=' + args.tz
+    variants = [
+        ('string', legacy_format_datetime, tiles(args.tiles, True)),
+        ('datetime', format_datetime, tiles(args.tiles, False)),
+    ]
+
+    print('{:<10} {:>16} {:>16}'.format('filter', 'render ms', 'filter only ms'))
+    for name, filter_function, shows in variants:
+        app.jinja_env.filters['datetime'] = filter_function
+        try:
+            with app.test_request_context('/shows', headers=headers):
+                page = Page(shows, len(shows))
+                render = lambda: render_template('pages/shows.html', shows=shows, page=page)
+                render()  # warm up
+                rendered = best_of(args.runs, render)
+                filtered = best_of(args.runs, lambda: [filter_function(show['start_time'], 'full') for show in shows])
+        finally:
+            app.jinja_env.filters['datetime'] = format_datetime
+        print('{:<10} {:>16} {:>16}'.format(name, rendered, filtered))
+
+
+if __name__ == '__main__':
+    main()
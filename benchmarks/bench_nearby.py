@@ -0,0 +1,88 @@
+# Latency of the nearby-venues backends on a synthetic catalog.
+#
+#   DATABASE_URL=sqlite:////tmp/fyyur-geo.db python -m benchmarks.bench_nearby --venues 100000
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.bench_nearby
+#
+# Venues are generated around the datagen cities (see datagen.venue_rows)
+# and two in five are marked as having upcoming shows. Queries are points
+# near those cities plus a few in between, where the geohash search has to
+# widen; every backend is checked against 'scan' for the same venues in the
+# same order. On PostgreSQL run it against a scratch database migrated with
+# "flask db upgrade"; the rows it inserts are not cleaned up.
+import argparse
+import math
+import random
+import time
+
+from app import app, db
+from models import Venue
+import geo
+from benchmarks import datagen
+from benchmarks.run import percentile
+
+
+def query_points(count, rng):
+    points = []
+    for i in range(count):
+        if i % 10 == 9:
+            # rural: between the cities, often nothing within reach
+            points.append((rng.uniform(30, 47), rng.uniform(-120, -75)))
+            continue
+        lat, lng = geo.geocode(*rng.choice(datagen.CITIES))
+        points.append((lat + rng.gauss(0, 0.1), lng + rng.gauss(0, 0.1) / math.cos(math.radians(lat))))
+    return points
+
+
+def measure(backend, points, k, within, upcoming_only):
+    latencies, answers = [], []
+    for lat, lng in points:
+        started = time.perf_counter()
+        found = geo.nearest(lat, lng, k, within, upcoming_only, backend=backend)
+        latencies.append((time.perf_counter() - started) * 1000)
+        answers.append([venue['id'] for venue in found])
+    return latencies, answers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--within', type=float, default=100)
+    parser.add_argument('--all', action='store_true', help='include venues without upcoming shows')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        existing = Venue.query.count()
+        if existing < args.venues:
+            datagen.insert_venues(args.venues - existing)
+            Venue.query.update({'upcoming_shows_count': db.case((Venue.id % 5 < 2, 1), else_=0)},
+                               synchronize_session=False)
+            db.session.commit()
+
+        backends = ['scan', 'geohash']
+        if geo.backend_for('auto').name == 'postgis':
+            backends.append('postgis')
+        points = query_points(args.queries, random.Random(7))
+
+        print('{} venues, {} queries, k={}, within {} km'.format(
+            Venue.query.count(), len(points), args.k, args.within))
+        print('{:<10} {:>9} {:>9} {:>9}'.format('backend', 'p50 ms', 'p95 ms', 'max ms'))
+        expected = None
+        for backend in backends:
+            measure(backend, points[:5], args.k, args.within, not args.all)  # warm up
+            latencies, answers = measure(backend, points, args.k, args.within, not args.all)
+            line = '{:<10} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                backend, percentile(latencies, 50), percentile(latencies, 95), max(latencies))
+            if expected is None:
+                expected = answers
+            else:
+                differ = sum(1 for a, b in zip(answers, expected) if a != b)
+                if differ:
+                    line += '  ({} answers differ from scan)'.format(differ)
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Throughput of the app as the connection pool size changes.
+#
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.bench_pool \
+#       --sizes 1,2,5,10 --threads 32 --seconds 10 --path /venues/1
+#
+# Each pool size runs in a fresh process (the pool is built from DB_POOL_SIZE
+# when the engine is created) with the page cache off, so every request
+# checks a connection out. The database needs at least one venue.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+def worker(args):
+    from app import app, db
+    from metrics import pool_stats
+
+    client = app.test_client()
+    stop = time.perf_counter() + args.seconds
+    counts = [0] * args.threads
+    errors = [0] * args.threads
+
+    def run(slot):
+        while time.perf_counter() < stop:
+            response = client.get(args.path)
+            if response.status_code == 200:
+                counts[slot] += 1
+            else:
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        pool = pool_stats.to_dict(db.engine.pool)
+    print(json.dumps({
+        'requests': sum(counts),
+        'errors': sum(errors),
+        'rps': round(sum(counts) / elapsed, 1),
+        'pool': pool,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1,2,5,10')
+    parser.add_argument('--overflow', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--path', default='/venues/1')
+    parser.add_argument('--worker', action='store_true')
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    if os.getenv('DATABASE_URL', '').startswith('sqlite'):
+        sys.exit('bench_pool needs a server database; SQLite does not use the connection pool')
+
+    print('{:>6} {:>10} {:>8} {:>12} {:>12} {:>10} {:>9}'.format(
+        'size', 'req/s', 'errors', 'wait avg ms', 'wait max ms', 'overflows', 'timeouts'))
+    for size in args.sizes.split(','):
+        env = dict(os.environ, DB_POOL_SIZE=size, DB_MAX_OVERFLOW=str(args.overflow), CACHE_BACKEND='null')
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.bench_pool', '--worker',
+             '--threads', str(args.threads), '--seconds', str(args.seconds), '--path', args.path],
+            env=env)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        pool = result['pool']
+        print('{:>6} {:>10} {:>8} {:>12} {:>12} {:>10} {:>9}'.format(
+            size, result['rps'], result['errors'], pool['wait_ms_avg'], pool['wait_ms_max'],
+            pool['overflow_events'], pool['timeouts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Compare the search backends on a synthetic catalog.
+#
+#   DATABASE_URL=sqlite:// python -m benchmarks.bench_search --venues 20000
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.bench_search
+#
+# On PostgreSQL run it against a scratch database that has been migrated
+# with "flask db upgrade"; the rows it inserts are not cleaned up.
+import argparse
+import time
+
+from app import app, db
+from models import Venue
+import search
+from benchmarks import datagen
+
+TERMS = ['ja', 'jazz', 'blue note', 'river', 'new york', 'soul', 'xyz', 'club 1']
+
+
+def timed(backend, term, limit, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = search.search(Venue, term, limit, backend=backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if Venue.query.count() < args.venues:
+            datagen.insert_venues(args.venues - Venue.query.count())
+
+        backends = ['ilike', 'memory']
+        if db.engine.dialect.name == 'postgresql':
+            backends.append('postgres')
+
+        # the first memory search pays for building the index
+        start = time.perf_counter()
+        search.search(Venue, 'warm', args.limit, backend='memory')
+        print('memory index build: {:.1f} ms'.format((time.perf_counter() - start) * 1000))
+
+        print('{:<12}'.format('term') + ''.join('{:>14}'.format(b) for b in backends))
+        for term in TERMS:
+            line = '{:<12}'.format(term)
+            ranked = {}
+            for backend in backends:
+                elapsed, results = timed(backend, term, args.limit, args.repeat)
+                ranked[backend] = [r['id'] for r in results]
+                line += '{:>11.2f} ms'.format(elapsed * 1000)
+            if 'postgres' in ranked and ranked['postgres'] != ranked['memory']:
+                line += '  (postgres and memory results differ)'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
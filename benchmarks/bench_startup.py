@@ -0,0 +1,94 @@
+# Startup cost of a fresh worker, with and without the warm-up in create_app().
+#
+#   python -m benchmarks.bench_startup --runs 5
+#   python -m benchmarks.bench_startup --max-first-request-ms 50   # regression gate
+#
+# Every run is a new interpreter that imports the app, creates the schema in
+# an in-memory SQLite database, optionally warms up, then times the first
+# and second request to each path. "first request" is what a user waiting on
+# a just-forked worker sees; the gap to "second request" is the one-off cost
+# the warm-up moves before the fork. With --max-first-request-ms the command
+# exits non-zero when the warmed median goes over the limit.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PATHS = ['/', '/venues', '/artists', '/shows', '/venues/create']
+
+
+def worker(args):
+    started = time.perf_counter()
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    os.environ.setdefault('CACHE_BACKEND', 'null')
+    from app import create_app, warm_up, db
+    app = create_app(warm=False)
+    imported = time.perf_counter()
+
+    with app.app_context():
+        db.create_all()
+    warm_started = time.perf_counter()
+    if args.warm:
+        warm_up(app)
+    warmed = time.perf_counter()
+
+    client = app.test_client()
+    first, second = [], []
+    for path in PATHS:
+        for samples in (first, second):
+            request_started = time.perf_counter()
+            response = client.get(path)
+            samples.append((time.perf_counter() - request_started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError('{} returned {}'.format(path, response.status_code))
+
+    print(json.dumps({
+        'import_ms': (imported - started) * 1000,
+        'warm_up_ms': (warmed - warm_started) * 1000,
+        'first_request_ms': sum(first),
+        'second_request_ms': sum(second),
+    }))
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-first-request-ms', type=float,
+                        help='fail when the warmed first requests take longer than this')
+    parser.add_argument('--worker', action='store_true')
+    parser.add_argument('--warm', action='store_true')
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    results = {}
+    for warm in (False, True):
+        command = [sys.executable, '-m', 'benchmarks.bench_startup', '--worker'] + (['--warm'] if warm else [])
+        runs = [json.loads(subprocess.check_output(command).decode().strip().splitlines()[-1])
+                for _ in range(args.runs)]
+        results[warm] = dict((key, round(median([run[key] for run in runs]), 1)) for key in runs[0])
+
+    print('time to serve {} on a fresh worker, median of {} runs\n'.format(', '.join(PATHS), args.runs))
+    print('{:<10} {:>10} {:>12} {:>16} {:>17}'.format('', 'import ms', 'warm-up ms', 'first req ms', 'second req ms'))
+    for warm in (False, True):
+        result = results[warm]
+        print('{:<10} {:>10} {:>12} {:>16} {:>17}'.format(
+            'warm' if warm else 'cold', result['import_ms'], result['warm_up_ms'],
+            result['first_request_ms'], result['second_request_ms']))
+
+    limit = args.max_first_request_ms
+    if limit is not None and results[True]['first_request_ms'] > limit:
+        print('\nfirst requests took {} ms, limit is {} ms'.format(results[True]['first_request_ms'], limit))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
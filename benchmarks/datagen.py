@@ -0,0 +1,161 @@
+# Synthetic catalog generator for the benchmarks.
+#
+#   DATABASE_URL=sqlite:////tmp/fyyur-bench.db python -m benchmarks.datagen --scale medium
+#
+# Scales are named after their show count; venues and artists grow with it.
+# Rows are inserted with executemany in chunks and the generator is seeded,
+# so the same scale always produces the same catalog.
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+import counters
+import geo
+
+SCALES = {
+    'small': {'shows': 1000, 'venues': 100, 'artists': 200},
+    'medium': {'shows': 100000, 'venues': 2000, 'artists': 5000},
+    'large': {'shows': 1000000, 'venues': 20000, 'artists': 50000},
+}
+
+WORDS = ['blue', 'note', 'jazz', 'hall', 'club', 'park', 'sound', 'stage', 'river',
+         'city', 'the', 'house', 'room', 'cellar', 'garden', 'union', 'star', 'lounge',
+         'velvet', 'echo', 'iron', 'golden', 'static', 'north', 'wild', 'sax', 'band']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+          ('Seattle', 'WA'), ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+          ('Portland', 'OR'), ('Atlanta', 'GA'), ('Boston', 'MA'), ('Detroit', 'MI')]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+          'Hip-Hop', 'Heavy Metal', 'Jazz', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul']
+CHUNK = 5000
+
+
+def _name(rng, i):
+    return '{} {} {}'.format(rng.choice(WORDS).title(), rng.choice(WORDS).title(), i)
+
+
+def _genres(rng):
+    return ', '.join(sorted(rng.sample(GENRES, rng.randint(1, 3))))
+
+
+def venue_rows(count, rng, start=0):
+    # venues are scattered around their city's centre (sd ~10 km) by a
+    # generator of their own, so the other columns stay as they were
+    spread = random.Random(start)
+    for i in range(start, start + count):
+        city, state = rng.choice(CITIES)
+        centre_lat, centre_lng = geo.geocode(city, state)
+        latitude = centre_lat + spread.gauss(0, 0.09)
+        longitude = centre_lng + spread.gauss(0, 0.09) / math.cos(math.radians(centre_lat))
+        yield {
+            'name': _name(rng, i),
+            'city': city,
+            'state': state,
+            'address': '{} {} St'.format(rng.randint(1, 999), rng.choice(WORDS).title()),
+            'phone': '555-{:03d}-{:04d}'.format(rng.randint(0, 999), rng.randint(0, 9999)),
+            'genres': _genres(rng),
+            'image_link': 'https://example.com/venues/{}.jpg'.format(i),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(i),
+            'website_link': 'https://venue{}.example.com'.format(i),
+            'looking_for_talent': rng.random() < 0.3,
+            'seeking_description': '',
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': geo.geohash(latitude, longitude),
+        }
+
+
+def artist_rows(count, rng, start=0):
+    for i in range(start, start + count):
+        city, state = rng.choice(CITIES)
+        yield {
+            'name': _name(rng, i),
+            'city': city,
+            'state': state,
+            'phone': '555-{:03d}-{:04d}'.format(rng.randint(0, 999), rng.randint(0, 9999)),
+            'genres': _genres(rng),
+            'image_link': 'https://example.com/artists/{}.jpg'.format(i),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(i),
+            'website_link': 'https://artist{}.example.com'.format(i),
+            'seeking_venue': rng.random() < 0.3,
+            'seeking_description': '',
+        }
+
+
+def show_rows(count, venue_ids, artist_ids, rng, now):
+    # spread over two years around now; pairs repeat, like residencies do
+    for _ in range(count):
+        yield {
+            'artist_id': rng.choice(artist_ids),
+            'venue_id': rng.choice(venue_ids),
+            'start_date': now + timedelta(hours=rng.randint(-365 * 24, 365 * 24)),
+        }
+
+
+def _insert(table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+    db.session.commit()
+
+
+def link_genres(model, links, column, after_id=0):
+    # fill a link table from the genres strings of rows with id > after_id
+    known = set(name for name, in db.session.query(Genre.name))
+    missing = [{'name': name} for name in GENRES if name not in known]
+    if missing:
+        db.session.execute(Genre.__table__.insert(), missing)
+    genre_ids = dict(db.session.query(Genre.name, Genre.id))
+    rows = db.session.query(model.id, model.genres).filter(model.id > after_id).order_by(model.id)
+    _insert(links, ({'genre_id': genre_ids[name], column: id}
+                    for id, genres in rows.all() for name in genres.split(', ')))
+
+
+def _max_id(model):
+    return db.session.query(db.func.coalesce(db.func.max(model.id), 0)).scalar()
+
+
+def insert_venues(count, seed=42):
+    _insert(Venue.__table__, venue_rows(count, random.Random(seed)))
+
+
+def generate(scale, seed=42):
+    sizes = SCALES[scale] if isinstance(scale, str) else scale
+    rng = random.Random(seed)
+    venues_after, artists_after = _max_id(Venue), _max_id(Artist)
+    _insert(Venue.__table__, venue_rows(sizes['venues'], rng))
+    _insert(Artist.__table__, artist_rows(sizes['artists'], rng))
+    link_genres(Venue, venue_genres, 'venue_id', venues_after)
+    link_genres(Artist, artist_genres, 'artist_id', artists_after)
+    venue_ids = [row[0] for row in db.session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [row[0] for row in db.session.query(Artist.id).order_by(Artist.id)]
+    _insert(Show.__table__, show_rows(sizes['shows'], venue_ids, artist_ids, rng, datetime.now()))
+    counters.rebuild()
+    db.session.commit()
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        sizes = generate(args.scale, args.seed)
+        print('generated {venues} venues, {artists} artists, {shows} shows'.format(**sizes) +
+              ' in {:.1f} s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
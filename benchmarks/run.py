@@ -0,0 +1,166 @@
+# Benchmark every route against a synthetic catalog.
+#
+#   python -m benchmarks.run --scale small                 # SQLite in memory
+#   DATABASE_URL=postgresql://.../scratchdb python -m benchmarks.run --scale medium
+#   python -m benchmarks.run --save bench_baseline.json
+#   python -m benchmarks.run --compare bench_baseline.json
+#
+# Each route is driven through the Flask test client with the page cache
+# off, and reports p50/p95/p99 latency, statements per request and the
+# process's peak RSS after the route ran. --compare exits non-zero when a
+# route's p95 got slower than the baseline by more than --tolerance.
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('CACHE_BACKEND', 'null')
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, db
+from models import Venue, Artist
+from benchmarks import datagen
+
+ROUTES = [
+    ('GET', '/'),
+    ('GET', '/venues'),
+    ('GET', '/venues.json'),
+    ('GET', '/venues?state=NY&genre=Jazz'),
+    ('GET', '/venues/{venue_id}'),
+    ('GET', '/venues/{venue_id}/edit'),
+    ('POST', '/venues/search', {'search_term': 'jazz'}),
+    ('GET', '/venues/nearby?city=Austin&state=TX'),
+    ('GET', '/artists'),
+    ('GET', '/artists.json'),
+    ('GET', '/artists?genre=Rock+n+Roll&genre=Blues'),
+    ('GET', '/artists/{artist_id}'),
+    ('GET', '/artists/{artist_id}/edit'),
+    ('POST', '/artists/search', {'search_term': 'band'}),
+    ('GET', '/shows'),
+    ('GET', '/shows.json'),
+    ('GET', '/shows?when=weekend&state=CA&city=San+Francisco'),
+    ('GET', '/shows/calendar?bucket=week'),
+    ('GET', '/venues/create'),
+    ('GET', '/artists/create'),
+    ('GET', '/shows/create'),
+]
+
+_statements = [0]
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _count_statement(*args):
+    _statements[0] += 1
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def bench_route(client, route, ids, requests, rng):
+    method, path = route[0], route[1]
+    data = route[2] if len(route) > 2 else None
+    latencies, statements = [], []
+    for _ in range(requests):
+        url = path.format(venue_id=rng.choice(ids['venue']), artist_id=rng.choice(ids['artist']))
+        _statements[0] = 0
+        start = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        latencies.append((time.perf_counter() - start) * 1000)
+        statements.append(_statements[0])
+        if response.status_code >= 400:
+            raise RuntimeError('{} {} returned {}'.format(method, url, response.status_code))
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': round(sum(statements) / float(len(statements)), 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    regressions = []
+    print('\n{:<32} {:>12} {:>12} {:>8}'.format('route', 'base p95', 'p95', 'change'))
+    for name, result in results['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / max(before['p95_ms'], 0.01)
+        flag = ''
+        if change > tolerance and result['p95_ms'] - before['p95_ms'] > min_delta_ms:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        if result['queries'] > before['queries']:
+            regressions.append(name)
+            flag += '  MORE QUERIES'
+        print('{:<32} {:>12} {:>12} {:>+7.0%}{}'.format(name, before['p95_ms'], result['p95_ms'], change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(datagen.SCALES), default='small')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--no-generate', action='store_true', help='use the rows already in the database')
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ignore p95 changes smaller than this')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        if not args.no_generate:
+            start = time.perf_counter()
+            datagen.generate(args.scale)
+            print('generated {} catalog in {:.1f} s'.format(args.scale, time.perf_counter() - start))
+        ids = {
+            'venue': [row[0] for row in db.session.query(Venue.id).limit(1000)],
+            'artist': [row[0] for row in db.session.query(Artist.id).limit(1000)],
+        }
+        database = db.engine.dialect.name
+
+    client = app.test_client()
+    results = {'scale': args.scale, 'database': database, 'requests': args.requests, 'routes': {}}
+    print('{:<32} {:>9} {:>9} {:>9} {:>8} {:>9}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'rss MB'))
+    for route in ROUTES:
+        name = route[0] + ' ' + route[1]
+        bench_route(client, route, ids, 3, rng)  # warm up
+        result = bench_route(client, route, ids, args.requests, rng)
+        results['routes'][name] = result
+        print('{:<32} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries'], result['peak_rss_mb']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('\nsaved baseline to ' + args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline['scale'], baseline['database']) != (args.scale, database):
+            print('\nwarning: baseline was taken at {} on {}'.format(baseline['scale'], baseline['database']))
+        if compare(results, baseline, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
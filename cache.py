@@ -0,0 +1,251 @@
+import os
+import pickle
+import threading
+import time
+from datetime import datetime, timezone
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Page context cache.
+#----------------------------------------------------------------------------#
+
+# Read-through cache for the assembled context of the venue and artist
+# detail pages. Routes that change a venue, artist or show delete the keys
+# they affect, and every entry also expires after a TTL so the past/upcoming
+# split cannot drift far from the clock.
+#
+# The default backend is an in-process LRU bounded by CACHE_MAX_ENTRIES.
+# Setting CACHE_BACKEND=redis shares the cache between workers through any
+# client with the redis-py get/set/delete API; the tests pass create_cache
+# an in-process stand-in (tests/fake_redis.py).
+
+
+class LRUCache(object):
+    name = 'memory'
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+        }
+
+
+class RedisCache(object):
+    # memory is bounded by the server's maxmemory/eviction policy; entries
+    # carry the same TTL as the in-process cache
+    name = 'redis'
+
+    def __init__(self, client, ttl=300, prefix='fyyur:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {'backend': self.name, 'hits': self.hits, 'misses': self.misses}
+
+
+class NullCache(object):
+    name = 'null'
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.name, 'hits': 0, 'misses': self.misses}
+
+
+def redis_client(config):
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('CACHE_BACKEND=redis needs the redis package (pip install redis)')
+    return redis.Redis.from_url(config['CACHE_REDIS_URL'])
+
+
+def create_cache(config, client=None):
+    backend = config['CACHE_BACKEND']
+    ttl = config['CACHE_DEFAULT_TTL']
+    if backend == 'memory':
+        return LRUCache(config['CACHE_MAX_ENTRIES'], ttl)
+    if backend == 'redis':
+        return RedisCache(client or redis_client(config), ttl)
+    if backend == 'null':
+        return NullCache()
+    raise ValueError('unknown CACHE_BACKEND %r' % backend)
+
+
+#----------------------------------------------------------------------------#
+# Table version stamps.
+#----------------------------------------------------------------------------#
+
+# Every route that writes a table bumps its stamp. A stamp is a counter plus
+# the time of the last bump; list pages derive their ETag and Last-Modified
+# from the stamps of the tables they read, so a repeat request can be
+# answered with 304 before any query runs.
+#
+# In-process stamps start from a random epoch so two processes (or one
+# process before and after a restart) never hand out the same ETag for
+# different data. They only see this process's writes: run more than one
+# worker with CACHE_BACKEND=redis so the stamps are shared. The Redis stamps
+# carry an epoch key of their own, seeded again after a flush resets the
+# counters to 0.
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class MemoryVersions(object):
+
+    def __init__(self):
+        self._epoch = os.urandom(4).hex()
+        self._started = _now()
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        # a forked worker must not hand out its parent's (or a sibling's) ETags
+        with self._lock:
+            self._epoch = os.urandom(4).hex()
+            self._stamps.clear()
+
+    def bump(self, *tables):
+        now = _now()
+        with self._lock:
+            for table in tables:
+                counter = self._stamps.get(table, (0, None))[0]
+                self._stamps[table] = (counter + 1, now)
+
+    def stamp(self, *tables):
+        # (token, last_modified) for a page that reads these tables
+        with self._lock:
+            stamps = [self._stamps.get(table, (0, self._started)) for table in tables]
+        token = self._epoch + ':' + '.'.join(str(counter) for counter, _ in stamps)
+        return token, max(modified for _, modified in stamps)
+
+
+class RedisVersions(object):
+
+    def __init__(self, client, prefix='fyyur:version:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _epoch(self, value):
+        if value is None:
+            # the first stamp, or the first after a flush; another worker may
+            # be seeding it at the same time, and the first one wins
+            self.client.set(self.prefix + 'epoch', os.urandom(4).hex(), nx=True)
+            value = self.client.get(self.prefix + 'epoch')
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def reset(self):
+        pass
+
+    def bump(self, *tables):
+        now = _now()
+        pipe = self.client.pipeline()
+        for table in tables:
+            pipe.incr(self.prefix + table)
+            pipe.set(self.prefix + table + ':modified', int(now.timestamp()))
+        pipe.execute()
+
+    def stamp(self, *tables):
+        keys = [self.prefix + 'epoch']
+        for table in tables:
+            keys += [self.prefix + table, self.prefix + table + ':modified']
+        values = self.client.mget(keys)
+        epoch, values = self._epoch(values[0]), values[1:]
+        counters = [int(v or 0) for v in values[0::2]]
+        modified = max(int(v or 0) for v in values[1::2])
+        return (epoch + ':' + '.'.join(str(c) for c in counters),
+                datetime.fromtimestamp(modified, timezone.utc))
+
+
+def create_versions(config, client=None):
+    if config['CACHE_BACKEND'] == 'redis':
+        return RedisVersions(client or redis_client(config))
+    return MemoryVersions()
+
+
+def venue_key(venue_id):
+    return 'venue:%d' % int(venue_id)
+
+
+def artist_key(artist_id):
+    return 'artist:%d' % int(artist_id)
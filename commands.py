@@ -0,0 +1,273 @@
+import sys
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from app import db, table_versions
+import counters
+import deletion
+import exporter
+import geo
+import importer
+import tasks
+from models import Venue, Artist, Job
+
+#----------------------------------------------------------------------------#
+# Catalog commands.
+#----------------------------------------------------------------------------#
+
+# flask catalog import venues venues.csv
+# flask catalog import shows feed.jsonl --chunk-size 10000
+# flask catalog export shows shows.csv
+# flask catalog delete venues 12 13 14 --soft
+# flask catalog purge venues --older-than 30
+
+catalog = AppGroup('catalog', help='Bulk import and export of venues, artists and shows.')
+
+
+def _echo_progress(report):
+    click.echo('  %d rows, %.0f rows/s' % (report.read, report.rate), err=True)
+
+
+@catalog.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(allow_dash=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='file format; taken from the extension by default')
+@click.option('--chunk-size', default=importer.CHUNK_SIZE, show_default=True,
+              help='rows written per transaction')
+@click.option('--copy/--no-copy', default=None,
+              help='load shows with COPY (the default on PostgreSQL)')
+@click.option('--quiet', is_flag=True, help='no per-chunk progress')
+def import_command(kind, path, format, chunk_size, copy, quiet):
+    """Load venues, artists or shows from a CSV or JSONL file ('-' for stdin).
+
+    Venues and artists are upserted on name; shows name their artist and
+    venue, which must already exist.
+    """
+    try:
+        format = format or importer.format_for(path)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        rows = importer.read_rows(stream, format)
+        progress = None if quiet else _echo_progress
+        if kind == 'shows':
+            report = importer.import_shows(rows, chunk_size, progress, copy)
+        else:
+            report = importer.import_entities(Venue if kind == 'venues' else Artist, rows, chunk_size, progress)
+    except importer.ImportFailed as e:
+        raise click.ClickException(str(e))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    for problem in report.problems:
+        click.echo('  skipped ' + problem, err=True)
+    click.echo(report.summary())
+
+
+@catalog.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', default='-', type=click.Path(allow_dash=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='file format; taken from the extension by default, csv for stdout')
+@click.option('--batch-size', default=exporter.BATCH_SIZE, show_default=True,
+              help='rows fetched from the cursor at a time')
+def export_command(kind, path, format, batch_size):
+    """Write venues, artists or shows to a CSV or JSONL file ('-' for stdout).
+
+    The output can be loaded again with `flask catalog import`.
+    """
+    if not format:
+        try:
+            format = 'csv' if path == '-' else importer.format_for(path)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+    stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    try:
+        for chunk in exporter.export(kind, format, batch_size):
+            stream.write(chunk)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+MODELS = {'venues': Venue, 'artists': Artist}
+
+
+@catalog.command('delete')
+@click.argument('kind', type=click.Choice(['venues', 'artists']))
+@click.argument('ids', nargs=-1, required=True, type=int)
+@click.option('--soft', is_flag=True, help='stamp deleted_at instead of removing the rows')
+@click.option('--batch-size', default=None, type=int,
+              help='ids and shows deleted per statement [default: DELETE_BATCH_SIZE]')
+def delete_command(kind, ids, soft, batch_size):
+    """Delete venues or artists by id in one transaction; a hard delete removes their shows."""
+    try:
+        report = deletion.delete(MODELS[kind], ids, soft, batch_size)
+    except deletion.DeletionFailed as e:
+        raise click.ClickException(str(e))
+    if report.missing:
+        click.echo('  not found: %s' % ' '.join(map(str, report.missing)), err=True)
+    click.echo(report.summary())
+
+
+@catalog.command('restore')
+@click.argument('kind', type=click.Choice(['venues', 'artists']))
+@click.argument('ids', nargs=-1, required=True, type=int)
+def restore_command(kind, ids):
+    """Bring back soft deleted venues or artists, with their shows."""
+    try:
+        restored = deletion.restore(MODELS[kind], ids)
+    except deletion.DeletionFailed as e:
+        raise click.ClickException(str(e))
+    click.echo('%d %s restored' % (len(restored), kind))
+
+
+@catalog.command('purge')
+@click.argument('kind', type=click.Choice(['venues', 'artists']))
+@click.option('--older-than', default=30.0, show_default=True, metavar='DAYS',
+              help='remove rows soft deleted at least this long ago')
+@click.option('--batch-size', default=None, type=int,
+              help='ids and shows deleted per statement [default: DELETE_BATCH_SIZE]')
+def purge_command(kind, older_than, batch_size):
+    """Remove soft deleted venues or artists, and their shows, for good."""
+    try:
+        report = deletion.purge(MODELS[kind], datetime.now() - timedelta(days=older_than), batch_size)
+    except deletion.DeletionFailed as e:
+        raise click.ClickException(str(e))
+    click.echo(report.summary())
+
+
+#----------------------------------------------------------------------------#
+# Show counter commands.
+#----------------------------------------------------------------------------#
+
+# flask counters roll --every 60     # keep upcoming/past counts current
+# flask counters check --fix
+
+counters_group = AppGroup('counters', help='Maintain the show counters on venues and artists.')
+
+
+@counters_group.command('roll')
+@click.option('--every', type=float, metavar='SECONDS',
+              help='keep rolling at this interval instead of once')
+def roll_command(every):
+    """Move shows that have started since the last roll from upcoming to past."""
+    def report(moved):
+        click.echo('%d shows moved to past' % moved)
+
+    if every:
+        counters.run_periodically(every, report)
+    else:
+        report(counters.roll())
+
+
+@counters_group.command('check')
+@click.option('--fix', is_flag=True, help='rebuild the counters when they disagree')
+def check_command(fix):
+    """Compare the counters with a live count of the shows.
+
+    Exits with status 1 when they disagree (and --fix is not given).
+    """
+    mismatches = counters.check()
+    if mismatches is None:
+        raise click.ClickException('the counters were never built; run `flask counters rebuild`')
+    for table, id, stored, live in mismatches[:50]:
+        click.echo('  %s %d: past/upcoming %d/%d, live %d/%d' % ((table, id) + stored + live), err=True)
+    if not mismatches:
+        click.echo('counters match')
+    elif fix:
+        counters.rebuild(counters.rolled_at())
+        db.session.commit()
+        table_versions.bump('Venue', 'Artist')
+        click.echo('%d rows disagreed; counters rebuilt' % len(mismatches))
+    else:
+        click.echo('%d rows disagree' % len(mismatches))
+        sys.exit(1)
+
+
+@counters_group.command('rebuild')
+def rebuild_command():
+    """Recompute every counter from the shows as of now."""
+    counters.rebuild()
+    db.session.commit()
+    table_versions.bump('Venue', 'Artist')
+    click.echo('counters rebuilt')
+
+
+#----------------------------------------------------------------------------#
+# Background task commands.
+#----------------------------------------------------------------------------#
+
+# flask tasks work        # run queued jobs here (TASK_RUN_IN_WEB=false)
+# flask tasks status
+# flask tasks retry
+
+tasks_group = AppGroup('tasks', help='Run and inspect background tasks.')
+
+
+@tasks_group.command('work')
+def work_command():
+    """Run queued jobs until interrupted."""
+    if tasks.runner.eager:
+        raise click.ClickException('TASK_BACKEND=eager runs tasks inline; there is no queue to work')
+    click.echo('running %s jobs with %d threads' % (
+        tasks.runner.queue.name, tasks.runner.app.config['TASK_WORKERS']))
+    tasks.runner.start()
+    tasks.runner.join()
+
+
+@tasks_group.command('status')
+def status_command():
+    """Job counts by status, and the most recent failures."""
+    counts = tasks.runner.queue.counts()
+    click.echo(', '.join('%s: %d' % item for item in sorted(counts.items())) or 'no jobs')
+    if tasks.runner.queue.name == 'database':
+        failed = Job.query.filter(Job.status == 'failed').order_by(Job.finished_at.desc()).limit(10)
+        for job in failed:
+            click.echo('  job %d %s failed after %d attempts at %s: %s' % (
+                job.id, job.name, job.attempts, job.finished_at, job.last_error))
+
+
+@tasks_group.command('retry')
+def retry_command():
+    """Queue the failed jobs again."""
+    if tasks.runner.queue.name != 'database':
+        raise click.ClickException('only TASK_BACKEND=database keeps failed jobs')
+    updated = Job.query.filter(Job.status == 'failed').update(
+        {'status': 'queued', 'attempts': 0, 'run_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    click.echo('%d jobs queued again' % updated)
+
+
+#----------------------------------------------------------------------------#
+# Venue location commands.
+#----------------------------------------------------------------------------#
+
+# flask venues geocode        # place venues imported without coordinates
+
+venues_group = AppGroup('venues', help='Maintain venue locations.')
+
+
+@venues_group.command('geocode')
+@click.option('--all', 'everything', is_flag=True,
+              help='place every venue at its city again, dropping imported coordinates')
+def geocode_command(everything):
+    """Place venues without coordinates at their city, from the bundled gazetteer."""
+    if everything:
+        Venue.query.update({'latitude': None, 'longitude': None, 'geohash': None}, synchronize_session=False)
+    located, missed = geo.locate_venues()
+    db.session.commit()
+    table_versions.bump('Venue')
+    click.echo('%d venues located, %d not found in the gazetteer' % (located, missed))
+
+
+def init_app(app):
+    app.cli.add_command(catalog)
+    app.cli.add_command(counters_group)
+    app.cli.add_command(tasks_group)
+    app.cli.add_command(venues_group)
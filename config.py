@@ -1,10 +1,30 @@
 import os
-SECRET_KEY = os.urandom(32)
+
+
+def _secret(name):
+    # NAME from the environment, or the contents of the file at NAME_FILE
+    path = os.getenv(name + '_FILE')
+    if path:
+        with open(path) as f:
+            return f.read().strip()
+    return os.getenv(name, '').strip()
+
+
+# Cookie signing key, shared by every worker and node (see sessions.py).
+# SECRET_KEY_FALLBACKS are older keys still accepted while they rotate out:
+# comma separated, or one per line in SECRET_KEY_FALLBACKS_FILE.
+SECRET_KEY = _secret('SECRET_KEY')
+SECRET_KEY_GENERATED = not SECRET_KEY
+if SECRET_KEY_GENERATED:
+    SECRET_KEY = os.urandom(32)
+SECRET_KEY_FALLBACKS = [key.strip() for key in _secret('SECRET_KEY_FALLBACKS').replace('\n', ',').split(',')
+                        if key.strip()]
+
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Debug mode is opt-in: FLASK_DEBUG=true for local development
+DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
 
 # Connect to the database
 DB_HOST = os.getenv('DB_HOST', '127.0.0.1:5432')
@@ -13,5 +33,133 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'student')
 DB_NAME = os.getenv('DB_NAME', 'myfyyurdb')
 
 # IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://{}:{}@{}/{}'.format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)
-SQLALCHEMY_TRACK_MODIFICATIONS = True
\ No newline at end of file
+# DATABASE_URL overrides the DB_* settings, e.g. sqlite:// for local runs
+SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'postgresql://{}:{}@{}/{}'.format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME))
+# Flask-SQLAlchemy's per-flush change tracking (models_committed signals), unused
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Read replicas (see replicas.py): comma-separated URLs GET requests read
+# from; writes and everything outside a request use the URL above
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# a visitor's reads stay on the primary this many seconds after their own write
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+# seconds between health checks of a replica, and before a failed one is tried again
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 30))
+# PostgreSQL replicas further behind than this many seconds are not read from; 0 = no limit
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 30))
+# page cache entries filled from a replica expire after this many seconds
+REPLICA_CACHE_TTL = int(os.getenv('REPLICA_CACHE_TTL', 30))
+# async engine for the ASGI mode (asgi.py); derived from the URL above when unset
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+
+# Connection pool (ignored for SQLite, which manages its own connections)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# server-side statement timeout in milliseconds, 0 disables it
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT and SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(DB_STATEMENT_TIMEOUT)
+        }
+
+# Keyset pagination page sizes for the listing pages
+ARTISTS_PER_PAGE = int(os.getenv('ARTISTS_PER_PAGE', 20))
+VENUES_PER_PAGE = int(os.getenv('VENUES_PER_PAGE', 20))
+SHOWS_PER_PAGE = int(os.getenv('SHOWS_PER_PAGE', 21))
+MAX_PER_PAGE = int(os.getenv('MAX_PER_PAGE', 100))
+
+# most day/week/month buckets /shows/calendar returns
+CALENDAR_MAX_BUCKETS = int(os.getenv('CALENDAR_MAX_BUCKETS', 366))
+
+# /venues/nearby (see geo.py): 'auto' uses the PostGIS index when the
+# extension is installed and geohash range scans elsewhere; 'postgis',
+# 'geohash' and 'scan' force a backend
+GEO_BACKEND = os.getenv('GEO_BACKEND', 'auto')
+NEARBY_DEFAULT_K = int(os.getenv('NEARBY_DEFAULT_K', 10))
+NEARBY_MAX_K = int(os.getenv('NEARBY_MAX_K', 50))
+# farthest a listed venue may be, in km (?within= can only lower it)
+NEARBY_MAX_KM = float(os.getenv('NEARBY_MAX_KM', 100))
+
+# Search: 'auto' uses the pg_trgm index on PostgreSQL and the in-process
+# inverted index elsewhere; 'postgres', 'memory' and 'ilike' force a backend
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+# maximum number of ranked results returned by the search pages
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', 50))
+
+# Venue/artist pages: shows listed per section, grown by "load more" up to
+# TIMELINE_MAX_SHOWS
+TIMELINE_PAGE_SIZE = int(os.getenv('TIMELINE_PAGE_SIZE', 12))
+TIMELINE_MAX_SHOWS = int(os.getenv('TIMELINE_MAX_SHOWS', 500))
+
+# Detail page cache: 'memory' (per-process LRU), 'redis' or 'null'
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2048))
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+# List pages that show time-dependent data (upcoming counts) change their
+# ETag at least this often, in seconds, even without writes
+CONDITIONAL_TIME_WINDOW = int(os.getenv('CONDITIONAL_TIME_WINDOW', 300))
+
+# Dates are shown in the first of LOCALES the visitor's Accept-Language
+# matches (else LOCALES[0]). When TIMEZONE names the zone show times are
+# stored in, they are converted to the visitor's "tz" cookie zone or to
+# DISPLAY_TIMEZONE
+LOCALES = [locale for locale in os.getenv('LOCALES', 'en').split(',') if locale]
+TIMEZONE = os.getenv('TIMEZONE')
+DISPLAY_TIMEZONE = os.getenv('DISPLAY_TIMEZONE', TIMEZONE)
+
+# Pages requested once at startup (app.create_app) so a fresh worker's first
+# real request does not pay for template and SQL compilation
+WARM_UP_PATHS = [path for path in os.getenv('WARM_UP_PATHS', '/,/venues,/artists,/shows').split(',') if path]
+
+# /api/v1 responses at least this many bytes are compressed (brotli if the
+# package is installed and accepted, else gzip)
+API_COMPRESS_MIN_SIZE = int(os.getenv('API_COMPRESS_MIN_SIZE', 500))
+API_GZIP_LEVEL = int(os.getenv('API_GZIP_LEVEL', 6))
+API_BROTLI_QUALITY = int(os.getenv('API_BROTLI_QUALITY', 4))
+
+# Background tasks (see tasks.py): TASK_BACKEND is 'database' (the Job
+# table), 'memory' or 'eager' (run inline). With TASK_RUN_IN_WEB=false the
+# web processes only queue jobs for `flask tasks work`
+TASK_BACKEND = os.getenv('TASK_BACKEND', 'database')
+TASK_RUN_IN_WEB = os.getenv('TASK_RUN_IN_WEB', 'true').lower() in ('1', 'true', 'yes')
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', 2))
+TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', 5))
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 5))
+# seconds before the first retry, doubled for each one after it
+TASK_RETRY_BACKOFF = float(os.getenv('TASK_RETRY_BACKOFF', 2))
+# a job running longer than this is assumed lost and queued again
+TASK_TIMEOUT = int(os.getenv('TASK_TIMEOUT', 300))
+# finished jobs are kept this many seconds
+TASK_KEEP_DONE = int(os.getenv('TASK_KEEP_DONE', 86400))
+# check that a saved image_link answers with an image (a warning if not)
+CHECK_IMAGE_LINKS = os.getenv('CHECK_IMAGE_LINKS', 'false').lower() in ('1', 'true', 'yes')
+IMAGE_CHECK_TIMEOUT = float(os.getenv('IMAGE_CHECK_TIMEOUT', 5))
+
+# Per-request SQL profiling (see profiling.py)
+SQL_PROFILING = os.getenv('SQL_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+SQL_PROFILING_SLOWEST = int(os.getenv('SQL_PROFILING_SLOWEST', 3))
+SQL_NPLUSONE_THRESHOLD = int(os.getenv('SQL_NPLUSONE_THRESHOLD', 5))
+# default per-request statement budget for views without @query_budget, 0 = none
+SQL_QUERY_BUDGET = int(os.getenv('SQL_QUERY_BUDGET', 0))
+SQL_QUERY_BUDGET_STRICT = os.getenv('SQL_QUERY_BUDGET_STRICT', 'false').lower() in ('1', 'true', 'yes')
+
+# Venue and artist deletion (see deletion.py): DELETE requests soft delete
+# unless DELETE_SOFT is false or ?soft=false is given; a hard delete removes
+# shows in batches of DELETE_BATCH_SIZE, and a bulk DELETE takes up to
+# DELETE_MAX_IDS
+DELETE_SOFT = os.getenv('DELETE_SOFT', 'true').lower() in ('1', 'true', 'yes')
+DELETE_BATCH_SIZE = int(os.getenv('DELETE_BATCH_SIZE', 1000))
+DELETE_MAX_IDS = int(os.getenv('DELETE_MAX_IDS', 1000))
@@ -0,0 +1,220 @@
+import time
+from datetime import datetime
+from sqlalchemy import bindparam, or_
+from app import db, table_versions
+from models import Venue, Artist, Show, counter_clock, live
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry past_shows_count and upcoming_shows_count so list
+# pages read them from the row instead of aggregating Show per request.
+# The counters are exact against one boundary, counter_clock.rolled_at:
+# shows starting before it are past, the rest upcoming (the split the
+# timelines use; shows without a start date count as neither).
+#
+# - shows_added() counts new shows in the transaction that inserts them,
+#   and shows_removed() uncounts shows in the one that deletes them;
+# - roll() moves the shows that started since the last roll from upcoming
+#   to past and advances the boundary. It runs periodically (flask counters
+#   roll --every 60), so a show that has just started can still count as
+#   upcoming for up to one interval;
+# - check() compares the counters with the live aggregate at the boundary
+#   and rebuild() recomputes them all.
+#
+# A row counts only the shows whose other side is live: soft deleting a
+# venue keeps its shows but takes them off its artists' counters
+# (soft_deleted()), and restoring it puts them back (restored()).
+#
+# shows_added() and shows_removed() hold a shared lock on the clock row and
+# roll() an exclusive one, so a roll never misses shows counted by a
+# transaction still in flight.
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def _listed(model):
+    # the shows that count on <model>'s rows: those whose other side is live
+    if model is Venue:
+        return Show.artist_id.in_(db.select(Artist.id).where(live(Artist)))
+    return Show.venue_id.in_(db.select(Venue.id).where(live(Venue)))
+
+
+def rolled_at(lock=None):
+    # the boundary, or None when the counters were never built; lock is
+    # 'share' or 'update' for a row lock on PostgreSQL
+    statement = db.select(counter_clock.c.rolled_at).where(counter_clock.c.id == 1)
+    if lock:
+        statement = statement.with_for_update(read=lock == 'share')
+    return db.session.execute(statement).scalar()
+
+
+def _set_clock(value):
+    updated = db.session.execute(counter_clock.update().where(counter_clock.c.id == 1).values(rolled_at=value))
+    if not updated.rowcount:
+        db.session.execute(counter_clock.insert().values(id=1, rolled_at=value))
+
+
+def _apply(model, deltas):
+    # add (past, upcoming) deltas to the counters, keyed by id; rows are
+    # updated in id order so concurrent writers lock them in the same order
+    table = model.__table__
+    statement = table.update().where(table.c.id == bindparam('owner_id')).values(
+        past_shows_count=table.c.past_shows_count + bindparam('past'),
+        upcoming_shows_count=table.c.upcoming_shows_count + bindparam('upcoming'))
+    rows = [{'owner_id': owner_id, 'past': past, 'upcoming': upcoming}
+            for owner_id, (past, upcoming) in sorted(deltas.items()) if past or upcoming]
+    if rows:
+        db.session.execute(statement, rows)
+
+
+def shows_added(shows):
+    # count new shows, given as (venue_id, artist_id, start_date), after they
+    # are flushed and before the transaction commits
+    boundary = rolled_at(lock='share')
+    if boundary is None:
+        # first use: the rebuild counts every show, these included
+        rebuild()
+        return
+    venues, artists = {}, {}
+    for venue_id, artist_id, start_date in shows:
+        if start_date is None:
+            continue
+        upcoming = start_date >= boundary
+        for deltas, owner_id in ((venues, venue_id), (artists, artist_id)):
+            past_delta, upcoming_delta = deltas.get(owner_id, (0, 0))
+            deltas[owner_id] = (past_delta + (not upcoming), upcoming_delta + upcoming)
+    _apply(Venue, venues)
+    _apply(Artist, artists)
+
+
+def shows_removed(condition):
+    # uncount the shows matching <condition> before they are deleted, in
+    # the same transaction
+    boundary = rolled_at(lock='share')
+    if boundary is None:
+        return
+    start = Show.start_date
+    for model, column in OWNERS:
+        rows = db.session.execute(db.select(column,
+                                            db.func.count(db.case((start < boundary, 1))),
+                                            db.func.count(db.case((start >= boundary, 1))))
+                                  .where(condition, _listed(model))
+                                  .group_by(column))
+        _apply(model, dict((owner_id, (-past, -upcoming)) for owner_id, past, upcoming in rows))
+
+
+def _shift(model, ids, sign):
+    # add or take the shows of these venues (or artists) on the counters of
+    # the other side
+    boundary = rolled_at(lock='share')
+    if boundary is None:
+        return
+    start = Show.start_date
+    (_, own_column), (other, column) = OWNERS if model is Venue else reversed(OWNERS)
+    rows = db.session.execute(db.select(column,
+                                        db.func.count(db.case((start < boundary, 1))),
+                                        db.func.count(db.case((start >= boundary, 1))))
+                              .where(own_column.in_(ids))
+                              .group_by(column))
+    _apply(other, dict((owner_id, (sign * past, sign * upcoming)) for owner_id, past, upcoming in rows))
+
+
+def soft_deleted(model, ids):
+    # uncount the shows of venues or artists being soft deleted from the
+    # other side, in the same transaction
+    _shift(model, ids, -1)
+
+
+def restored(model, ids):
+    # count them again when they are restored
+    _shift(model, ids, 1)
+
+
+def roll(now=None):
+    # move shows that started since the last roll to past and commit;
+    # returns the number of shows moved
+    now = now or datetime.now()
+    boundary = rolled_at(lock='update')
+    if boundary is None:
+        rebuild(now)
+        db.session.commit()
+        table_versions.bump('Venue', 'Artist')
+        return 0
+    if now <= boundary:
+        db.session.rollback()
+        return 0
+
+    moved = 0
+    for model, column in OWNERS:
+        rows = db.session.execute(db.select(column, db.func.count())
+                                  .where(Show.start_date >= boundary, Show.start_date < now, _listed(model))
+                                  .group_by(column))
+        deltas = dict((owner_id, (n, -n)) for owner_id, n in rows)
+        _apply(model, deltas)
+        if model is Venue:
+            moved = sum(past for past, _ in deltas.values())
+    _set_clock(now)
+    db.session.commit()
+    if moved:
+        table_versions.bump('Venue', 'Artist')
+    return moved
+
+
+def run_periodically(interval, on_roll=None):
+    # roll every <interval> seconds until interrupted
+    while True:
+        started = time.monotonic()
+        moved = roll()
+        if on_roll:
+            on_roll(moved)
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+def _live_counts(model, column, boundary):
+    start = Show.start_date
+    return db.select(column.label('owner_id'),
+                     db.func.count(db.case((start < boundary, 1))).label('past'),
+                     db.func.count(db.case((start >= boundary, 1))).label('upcoming')) \
+        .where(_listed(model)).group_by(column).subquery()
+
+
+def rebuild(now=None):
+    # recompute every counter at <now> with one UPDATE per table; the caller
+    # commits
+    now = now or datetime.now()
+    start = Show.start_date
+    for model, column in OWNERS:
+        table = model.__table__
+
+        def count(condition):
+            return db.select(db.func.count()).select_from(Show.__table__) \
+                .where(column == table.c.id, condition, _listed(model)).scalar_subquery()
+
+        db.session.execute(table.update().values(
+            past_shows_count=count(start < now),
+            upcoming_shows_count=count(start >= now)))
+    _set_clock(now)
+    return now
+
+
+def check():
+    # (table, id, stored (past, upcoming), live (past, upcoming)) for each row
+    # whose counters disagree with the live aggregate at the boundary
+    boundary = rolled_at()
+    if boundary is None:
+        return None
+    mismatches = []
+    for model, column in OWNERS:
+        counts = _live_counts(model, column, boundary)
+        past = db.func.coalesce(counts.c.past, 0)
+        upcoming = db.func.coalesce(counts.c.upcoming, 0)
+        rows = db.session.execute(
+            db.select(model.id, model.past_shows_count, model.upcoming_shows_count, past, upcoming)
+            .outerjoin(counts, counts.c.owner_id == model.id)
+            .where(or_(model.past_shows_count != past, model.upcoming_shows_count != upcoming))
+            .order_by(model.id))
+        mismatches.extend((model.__tablename__, id, (stored_past, stored_upcoming), (live_past, live_upcoming))
+                          for id, stored_past, stored_upcoming, live_past, live_upcoming in rows)
+    return mismatches
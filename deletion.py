@@ -0,0 +1,176 @@
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, page_cache, table_versions
+from cache import venue_key, artist_key
+from models import Venue, Artist, Show, venue_genres, artist_genres, live, split_genres
+from importer import GenreLinks, chunked
+import counters
+import search
+
+#----------------------------------------------------------------------------#
+# Deletion.
+#----------------------------------------------------------------------------#
+
+# Deletes venues or artists, one or many at a time, for the DELETE routes
+# and `flask catalog delete`. Each call is one transaction that, for every
+# DELETE_BATCH_SIZE ids:
+#
+# - removes their genre links;
+# - removes the rows and their shows. The shows are uncounted on the show
+#   counters of the other side (the artists of a deleted venue's shows, see
+#   counters.py) and removed in batches of DELETE_BATCH_SIZE, each a
+#   DELETE .. WHERE id IN (the next batch of show ids), so no statement
+#   touches an unbounded number of rows;
+# - or, with soft=True, stamps deleted_at on the rows instead. A soft
+#   deleted row keeps its data, name (so the name stays taken) and shows,
+#   but drops out of every live read, and so do its shows: the show lists
+#   and timelines join both sides and keep live rows only, and the other
+#   side's counters stop counting them. restore() brings the row back with
+#   its shows and its genre links written again from the genres column;
+#   purge() removes the rows soft deleted before a cutoff, shows included.
+#
+# Any database error rolls the whole call back and raises DeletionFailed.
+# Caches are invalidated once, after the commit.
+
+
+class DeletionFailed(Exception):
+    pass
+
+
+class DeletionReport(object):
+
+    def __init__(self, kind, soft):
+        self.kind = kind
+        self.soft = soft
+        self.started = time.perf_counter()
+        self.finished = None
+        self.deleted = []
+        self.missing = []
+        self.shows = self.batches = 0
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_dict(self):
+        return {
+            'deleted': self.deleted,
+            'missing': self.missing,
+            'soft': self.soft,
+            'shows_deleted': self.shows,
+            'batches': self.batches,
+            'seconds': round(self.elapsed, 4),
+        }
+
+    def summary(self):
+        return '%s: %d %s, %d shows removed in %d batches, %d not found, in %.2f s' % (
+            self.kind, len(self.deleted), 'soft deleted' if self.soft else 'deleted',
+            self.shows, self.batches, len(self.missing), self.elapsed)
+
+
+# model -> (its show column, the other side's show column, genre links,
+# link column, page key, the other side's page key and table)
+SIDES = {
+    Venue: (Show.venue_id, Show.artist_id, venue_genres, 'venue_id', venue_key, artist_key, 'Artist'),
+    Artist: (Show.artist_id, Show.venue_id, artist_genres, 'artist_id', artist_key, venue_key, 'Venue'),
+}
+
+
+def _delete_shows(column, owner_ids, batch_size, report):
+    shows = Show.__table__
+    batch = db.select(shows.c.id).where(column.in_(owner_ids)).limit(batch_size)
+    while True:
+        removed = db.session.execute(shows.delete().where(shows.c.id.in_(batch))).rowcount
+        if removed:
+            report.shows += removed
+            report.batches += 1
+        if removed < batch_size:
+            return
+
+
+def _related(model, ids):
+    # the other side of these rows' shows
+    column, other_column, _, _, _, _, _ = SIDES[model]
+    return set(row[0] for row in db.session.execute(db.select(other_column).where(column.in_(ids)).distinct()))
+
+
+def _invalidate(model, ids, related):
+    _, _, _, _, key, other_key, other = SIDES[model]
+    search.invalidate(model)
+    table_versions.bump(model.__tablename__, *(('Show', other) if related else ()))
+    # the pages of the other side list the deleted rows' names and shows
+    page_cache.delete(*([key(i) for i in ids] + [other_key(i) for i in related]))
+
+
+def delete(model, ids, soft=False, batch_size=None, now=None):
+    # delete the venues or artists with these ids (and, unless soft, their
+    # shows); ids not found (or, for a soft delete, already soft deleted)
+    # are reported as missing
+    batch_size = batch_size or current_app.config['DELETE_BATCH_SIZE']
+    column, _, links, owner_column, _, _, _ = SIDES[model]
+    table = model.__table__
+    report = DeletionReport(model.__tablename__, soft)
+    now = now or datetime.now()
+    related = set()
+    try:
+        for chunk in chunked(sorted(set(ids)), batch_size):
+            # locked in id order, so an edit cannot save over a deleted row
+            statement = db.select(table.c.id).where(table.c.id.in_(chunk)).order_by(table.c.id).with_for_update()
+            if soft:
+                statement = statement.where(live(model))
+            found = [row[0] for row in db.session.execute(statement)]
+            report.missing.extend(sorted(set(chunk).difference(found)))
+            if not found:
+                continue
+            related.update(_related(model, found))
+            db.session.execute(links.delete().where(links.c[owner_column].in_(found)))
+            if soft:
+                counters.soft_deleted(model, found)
+                db.session.execute(table.update().where(table.c.id.in_(found))
+                                   .values(deleted_at=now, version=table.c.version + 1))
+            else:
+                counters.shows_removed(column.in_(found))
+                _delete_shows(column, found, batch_size, report)
+                db.session.execute(table.delete().where(table.c.id.in_(found)))
+            report.deleted.extend(found)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise DeletionFailed('could not delete %s %s: %s' % (
+            model.__tablename__, ', '.join(map(str, sorted(set(ids))[:10])), e.__class__.__name__)) from e
+    report.finished = time.perf_counter()
+    if report.deleted:
+        _invalidate(model, report.deleted, related)
+    return report
+
+
+def restore(model, ids):
+    # undo soft deletes, shows included; returns the ids restored
+    _, _, links, owner_column, _, _, _ = SIDES[model]
+    table = model.__table__
+    rows = db.session.execute(db.select(table.c.id, table.c.genres)
+                              .where(table.c.id.in_(list(ids)), table.c.deleted_at.isnot(None))
+                              .order_by(table.c.id).with_for_update()).all()
+    restored = [row.id for row in rows]
+    if not restored:
+        return restored
+    try:
+        related = _related(model, restored)
+        counters.restored(model, restored)
+        db.session.execute(table.update().where(table.c.id.in_(restored))
+                           .values(deleted_at=None, version=table.c.version + 1))
+        GenreLinks(links, owner_column).replace(dict((row.id, split_genres(row.genres)) for row in rows))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise DeletionFailed('could not restore %s: %s' % (model.__tablename__, e.__class__.__name__)) from e
+    _invalidate(model, restored, related)
+    return restored
+
+
+def purge(model, before, batch_size=None):
+    # hard delete the rows soft deleted before <before>
+    ids = [row[0] for row in db.session.execute(db.select(model.id).where(model.deleted_at < before))]
+    return delete(model, ids, batch_size=batch_size)
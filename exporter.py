@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from datetime import datetime
+from app import db
+from models import Venue, Artist, Show, live, split_genres
+from importer import VENUE_COLUMNS, ARTIST_COLUMNS
+
+#----------------------------------------------------------------------------#
+# Streaming export.
+#----------------------------------------------------------------------------#
+
+# Writes venues, artists or shows as CSV or JSONL in the layout `flask
+# catalog import` reads back. Rows come from one statement executed with
+# stream_results (a server-side cursor on PostgreSQL) and are fetched and
+# encoded BATCH_SIZE at a time, so memory stays flat however large the
+# table is and the first bytes go out as soon as the first batch is read.
+# Used by the /export routes and `flask catalog export`.
+
+BATCH_SIZE = 1000
+
+SHOW_COLUMNS = ['id', 'artist', 'venue', 'artist_id', 'venue_id', 'start_time', 'image_link']
+
+
+def _statement(kind):
+    if kind == 'venues':
+        return ['id'] + VENUE_COLUMNS, db.select(Venue.id, *[Venue.__table__.c[c] for c in VENUE_COLUMNS]) \
+            .where(live(Venue)).order_by(Venue.id)
+    if kind == 'artists':
+        return ['id'] + ARTIST_COLUMNS, db.select(Artist.id, *[Artist.__table__.c[c] for c in ARTIST_COLUMNS]) \
+            .where(live(Artist)).order_by(Artist.id)
+    if kind == 'shows':
+        return SHOW_COLUMNS, db.select(
+            Show.id, Artist.name, Venue.name, Show.artist_id, Show.venue_id, Show.start_date, Show.image_link) \
+            .select_from(Show).join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id) \
+            .where(live(Artist), live(Venue)).order_by(Show.id)
+    raise ValueError('unknown export %r' % kind)
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_lines(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([_value(v) for v in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _jsonl_lines(columns, batches):
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(columns, [_value(v) for v in row]))
+            if 'genres' in record:
+                record['genres'] = split_genres(record['genres'])
+            lines.append(json.dumps(record, separators=(',', ':')) + '\n')
+        yield ''.join(lines)
+
+
+def export(kind, format, batch_size=BATCH_SIZE):
+    # a generator of text chunks; the statement runs when it is first advanced
+    columns, statement = _statement(kind)
+    encode = {'csv': _csv_lines, 'jsonl': _jsonl_lines}[format]
+
+    def batches():
+        result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        try:
+            for rows in result.partitions(batch_size):
+                yield rows
+        finally:
+            result.close()
+
+    return encode(columns, batches())
@@ -6,13 +6,20 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m pytest tests -q", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench(scale="small"):
+    # compare every route against the saved baseline, or save one
+    import os
+    if os.path.exists("bench_baseline.json"):
+        local("python -m benchmarks.run --scale {} --compare bench_baseline.json".format(scale))
+    else:
+        local("python -m benchmarks.run --scale {} --save bench_baseline.json".format(scale))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -39,9 +46,7 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local("heroku run \"pip install -q pytest && python -m pytest tests -q\"")
 
 
 def deploy():
@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, AnyOf, URL
 
 class ShowForm(Form):
@@ -126,6 +126,9 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # the venue's version when the edit form was loaded
+    version = HiddenField('version')
+
 
 
 class ArtistForm(Form):
@@ -237,3 +240,6 @@ class ArtistForm(Form):
             'seeking_description'
      )
 
+    # the artist's version when the edit form was loaded
+    version = HiddenField('version')
+
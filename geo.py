@@ -0,0 +1,264 @@
+import csv
+import heapq
+import math
+import os
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import and_, bindparam, or_
+from app import db
+from models import Venue, live
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+# Venues carry a latitude, longitude and geohash. Coordinates come from the
+# import feeds when they have them; otherwise they are looked up offline by
+# city and state in the bundled gazetteer (data/gazetteer.csv: US cities,
+# and state centroids as a fallback), so a geocoded venue is placed at its
+# city's centre, not its street address.
+#
+# nearest() answers "the k venues closest to a point" with one of:
+#
+# - 'postgis': a KNN scan (ORDER BY location <-> origin) over the GiST
+#   index of the "venue geo columns" migration, created when the PostGIS
+#   extension is installed; LOCATION below must stay identical to the
+#   indexed expression;
+# - 'geohash': prefix range scans over the geohash btree index, on any
+#   database. The cell holding the point and its eight neighbours cover
+#   every venue closer than one cell size, so the search starts with small
+#   cells and widens until the k-th nearest candidate lies inside that
+#   radius; candidates are ranked by great-circle distance;
+# - 'scan': distance to every geocoded venue, kept for benchmarking.
+#
+# GEO_BACKEND=auto picks 'postgis' when the extension is installed and
+# 'geohash' otherwise.
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# stored hashes name ~5 m cells; searches start from ~1 km cells
+GEOHASH_PRECISION = 9
+SEARCH_PRECISION = 6
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+
+LOCATION = 'geography(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))'
+
+
+#  Geohash
+#  ----------------------------------------------------------------
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    # the base32 geohash of a point: longitude and latitude bisections,
+    # interleaved, five bits to a character
+    lat_interval = [-90.0, 90.0]
+    lng_interval = [-180.0, 180.0]
+    chars = []
+    bits = count = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lng_interval, longitude) if even else (lat_interval, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        count += 1
+        if count == 5:
+            chars.append(BASE32[bits])
+            bits = count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) in degrees of the cells of a precision
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude, longitude, precision):
+    # the cell holding the point and its (up to) eight neighbours
+    height, width = cell_size(precision)
+    cells = set()
+    for lat in (latitude - height, latitude, latitude + height):
+        if not -90 <= lat <= 90:
+            continue
+        for lng in (longitude - width, longitude, longitude + width):
+            cells.add(geohash(lat, (lng + 180) % 360 - 180, precision))
+    return sorted(cells)
+
+
+def covered_radius(latitude, precision):
+    # km from the point within which every venue lies in covering_cells();
+    # east-west cells are measured at the block's edge nearest a pole
+    height, width = cell_size(precision)
+    edge = min(89.9, abs(latitude) + height)
+    return min(height, width * math.cos(math.radians(edge))) * KM_PER_DEGREE
+
+
+def prefix_range(column, cell):
+    # hashes starting with <cell>, as a btree range: [cell, next cell)
+    stripped = cell.rstrip(BASE32[-1])
+    if not stripped:
+        return column >= cell
+    following = stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+    return and_(column >= cell, column < following)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    # great-circle (haversine) distance
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+#  Gazetteer
+#  ----------------------------------------------------------------
+
+def _place_key(value):
+    return ' '.join((value or '').replace('.', ' ').lower().split())
+
+
+@lru_cache(maxsize=None)
+def gazetteer(path=GAZETTEER_PATH):
+    # {(city, state): (latitude, longitude)}, states under (None, state)
+    places = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            city = _place_key(row['city']) or None
+            places[(city, row['state'].strip().upper())] = (float(row['latitude']), float(row['longitude']))
+    return places
+
+
+def geocode(city, state):
+    # (latitude, longitude) of a city, else of its state, else None
+    places = gazetteer()
+    state = (state or '').strip().upper()
+    return places.get((_place_key(city) or None, state)) or places.get((None, state))
+
+
+def locate_venues(venue_ids=None):
+    # geocode the venues without coordinates (of venue_ids, or all) with
+    # one executemany UPDATE; the caller commits. Returns (located, missed)
+    table = Venue.__table__
+    statement = db.select(Venue.id, Venue.city, Venue.state).where(Venue.latitude.is_(None))
+    if venue_ids is not None:
+        statement = statement.where(Venue.id.in_(venue_ids))
+    rows, missed = [], 0
+    for id, city, state in db.session.execute(statement):
+        point = geocode(city, state)
+        if point is None:
+            missed += 1
+            continue
+        rows.append({'venue_id': id, 'lat': point[0], 'lng': point[1], 'hash': geohash(*point)})
+    if rows:
+        db.session.execute(table.update().where(table.c.id == bindparam('venue_id')).values(
+            latitude=bindparam('lat'), longitude=bindparam('lng'), geohash=bindparam('hash')), rows)
+    return len(rows), missed
+
+
+#  Nearest venues
+#  ----------------------------------------------------------------
+
+def _columns():
+    return (Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+            Venue.upcoming_shows_count)
+
+
+def _conditions(upcoming_only):
+    return [live(Venue)] + ([Venue.upcoming_shows_count > 0] if upcoming_only else [])
+
+
+def result(row, distance):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'num_upcoming_shows': row.upcoming_shows_count,
+        'distance_km': round(distance, 3),
+    }
+
+
+def _closest(rows, latitude, longitude, k, within):
+    ranked = ((distance_km(latitude, longitude, row.latitude, row.longitude), row.id, row) for row in rows)
+    return heapq.nsmallest(k, (r for r in ranked if r[0] <= within), key=lambda r: r[:2])
+
+
+class ScanIndex(object):
+    # every geocoded venue, ranked in Python
+    name = 'scan'
+
+    def nearest(self, latitude, longitude, k, within, upcoming_only):
+        rows = db.session.execute(db.select(*_columns())
+                                  .where(Venue.latitude.isnot(None), *_conditions(upcoming_only)))
+        return [result(row, distance) for distance, _, row in _closest(rows, latitude, longitude, k, within)]
+
+
+class GeohashIndex(object):
+    name = 'geohash'
+
+    def nearest(self, latitude, longitude, k, within, upcoming_only):
+        precision = SEARCH_PRECISION
+        while True:
+            radius = covered_radius(latitude, precision)
+            cells = covering_cells(latitude, longitude, precision)
+            rows = db.session.execute(db.select(*_columns()).where(
+                or_(*[prefix_range(Venue.geohash, cell) for cell in cells]), *_conditions(upcoming_only)))
+            found = _closest(rows, latitude, longitude, k, within)
+            if precision == 1 or radius >= within or (len(found) == k and found[-1][0] <= radius):
+                return [result(row, distance) for distance, _, row in found]
+            # widen to the cells that cover the k-th candidate, if there is one
+            needed = found[-1][0] if len(found) == k else radius
+            precision -= 1
+            while precision > 1 and covered_radius(latitude, precision) < min(needed, within):
+                precision -= 1
+
+
+class PostgisIndex(object):
+    name = 'postgis'
+
+    def nearest(self, latitude, longitude, k, within, upcoming_only):
+        location = db.literal_column(LOCATION)
+        origin = db.func.geography(db.func.ST_SetSRID(db.func.ST_MakePoint(longitude, latitude), 4326))
+        distance = (db.func.ST_Distance(location, origin) / 1000.0).label('distance_km')
+        rows = db.session.execute(db.select(*_columns(), distance)
+                                  .where(db.func.ST_DWithin(location, origin, within * 1000.0),
+                                         *_conditions(upcoming_only))
+                                  .order_by(location.op('<->')(origin), Venue.id).limit(k))
+        return [result(row, row.distance_km) for row in rows]
+
+
+_backends = {
+    'scan': ScanIndex(),
+    'geohash': GeohashIndex(),
+    'postgis': PostgisIndex(),
+}
+
+
+@lru_cache(maxsize=None)
+def _has_postgis(url):
+    return bool(db.session.execute(db.text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).scalar())
+
+
+def backend_for(name=None):
+    name = name or current_app.config['GEO_BACKEND']
+    if name == 'auto':
+        engine = db.engine
+        postgis = engine.dialect.name == 'postgresql' and _has_postgis(str(engine.url))
+        name = 'postgis' if postgis else 'geohash'
+    return _backends[name]
+
+
+def nearest(latitude, longitude, k=None, within=None, upcoming_only=True, backend=None):
+    # the k venues closest to a point and no further than <within> km,
+    # nearest first; upcoming_only keeps those with upcoming shows
+    config = current_app.config
+    k = config['NEARBY_DEFAULT_K'] if k is None else k
+    within = config['NEARBY_MAX_KM'] if within is None else within
+    return backend_for(backend).nearest(latitude, longitude, k, within, upcoming_only)
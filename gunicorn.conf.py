@@ -0,0 +1,46 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# With CACHE_BACKEND=redis, one worker process per core plus one by default
+# (WEB_CONCURRENCY overrides it). The in-process page cache and version
+# stamps are not shared between processes, so without Redis a worker would
+# keep serving pages (and 304s) that another worker's write made stale: the
+# default is then one worker with GUNICORN_THREADS threads, and asking for
+# more workers is refused. The app is loaded and warmed up once in the
+# master and shared copy-on-write by the workers; anything a worker must
+# not share with its siblings (pooled connections, version-stamp epochs,
+# background task threads) is reset in post_fork.
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker with
+# asgi:application runs the ASGI mode under the same settings.
+import multiprocessing
+import os
+from config import CACHE_BACKEND
+
+shared_cache = CACHE_BACKEND == 'redis'
+cores = multiprocessing.cpu_count()
+
+bind = '0.0.0.0:' + os.getenv('PORT', '2022')
+workers = int(os.getenv('WEB_CONCURRENCY', cores + 1 if shared_cache else 1))
+if workers > 1 and not shared_cache:
+    raise RuntimeError('%d workers need CACHE_BACKEND=redis: with CACHE_BACKEND=%s the page cache '
+                       'and version stamps are per process' % (workers, CACHE_BACKEND))
+threads = int(os.getenv('GUNICORN_THREADS', 1 if shared_cache else 2 * cores + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    from app import app, db, table_versions
+    from tasks import runner
+    from replicas import router
+    # connections opened in the master would be shared by every worker
+    db.engine.dispose()
+    router.dispose()
+    table_versions.reset()
+    # background task threads are per process; start them to pick up jobs
+    # queued before this worker was forked
+    if app.config['TASK_RUN_IN_WEB'] and not runner.eager:
+        runner.start()
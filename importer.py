@@ -0,0 +1,371 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+import babel.dates
+import dateutil.parser
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db, page_cache, table_versions
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres, live, split_genres
+import counters
+import geo
+import search
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Loads venues, artists and shows from CSV or JSONL files (flask catalog
+# import, see commands.py). Rows are streamed and written in chunks, one
+# transaction per chunk:
+#
+# - venues and artists are upserted on their unique name with a batched
+#   INSERT .. ON CONFLICT (name) DO UPDATE of the columns the file has,
+#   and their genre links are replaced when the file has a genres column.
+#   Venues keep the latitude/longitude a file gives; the rest are placed
+#   from the gazetteer (see geo.py) once the import is done;
+# - shows name their artist and venue (or give artist_id / venue_id),
+#   resolved through a name -> id map held in memory for the whole run.
+#   Shows already present with the same artist, venue and start time are
+#   skipped, so a feed can be loaded again. On PostgreSQL new shows go in
+#   with COPY, elsewhere with executemany, and the show counters of their
+#   venues and artists are updated in the same transaction.
+#
+# Caches are invalidated once, at the end, also when an import fails partway
+# (the chunks committed before the failure stay).
+
+CHUNK_SIZE = 5000
+
+VENUE_COLUMNS = ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                 'genres', 'website_link', 'looking_for_talent', 'seeking_description', 'latitude', 'longitude']
+ARTIST_COLUMNS = ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                  'genres', 'website_link', 'seeking_venue', 'seeking_description']
+BOOLEAN_COLUMNS = ('looking_for_talent', 'seeking_venue')
+# coordinate columns and their largest absolute value
+COORDINATE_COLUMNS = {'latitude': 90, 'longitude': 180}
+# alternative column names accepted in feeds
+ALIASES = {'seeking_talent': 'looking_for_talent', 'website': 'website_link', 'start_date': 'start_time',
+           'lat': 'latitude', 'lng': 'longitude'}
+
+
+class ImportFailed(Exception):
+    pass
+
+
+class ImportReport(object):
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.read = self.written = self.skipped = self.present = 0
+        self.problems = []
+
+    def skip(self, line, reason):
+        self.skipped += 1
+        if len(self.problems) < 20:
+            self.problems.append('line %d: %s' % (line, reason))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.read / max(self.elapsed, 1e-9)
+
+    def summary(self):
+        return '%s: %d rows read, %d written, %d already present, %d skipped in %.1f s (%.0f rows/s)' % (
+            self.kind, self.read, self.written, self.present, self.skipped, self.elapsed, self.rate)
+
+
+def read_rows(stream, format):
+    # (line number, dict) for each record of a CSV or JSONL stream
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_num, json.loads(line)
+    else:
+        raise ValueError('unknown format %r' % format)
+
+
+def format_for(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError('cannot tell the format of %s; pass --format' % path)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _boolean(value):
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _genres(value):
+    names = value if isinstance(value, list) else split_genres(value)
+    return ', '.join(sorted(set(name.strip() for name in names if name and name.strip())))
+
+
+def _coordinate(value, limit):
+    value = float(value)
+    if not -limit <= value <= limit:
+        raise ValueError('%r is out of range' % value)
+    return value
+
+
+def _datetime(value):
+    # ISO 8601 is the common case and far cheaper than dateutil's parser
+    try:
+        value = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        value = dateutil.parser.parse(value or '')
+    return stored_datetime(value)
+
+
+def stored_datetime(value):
+    # show times are stored naive, in TIMEZONE (the server's zone when it is
+    # unset); a value with an offset or 'Z' is converted to it. The show
+    # form uses it too.
+    if value.tzinfo is None:
+        return value
+    name = current_app.config['TIMEZONE']
+    return value.astimezone(babel.dates.get_timezone(name) if name else None).replace(tzinfo=None)
+
+
+def _clean(row, columns):
+    record = {}
+    for key, value in row.items():
+        key = ALIASES.get(key, key)
+        if key not in columns:
+            continue
+        if value == '':
+            value = None
+        if key in BOOLEAN_COLUMNS:
+            value = _boolean(value)
+        elif key == 'genres':
+            value = _genres(value)
+        elif key in COORDINATE_COLUMNS and value is not None:
+            value = _coordinate(value, COORDINATE_COLUMNS[key])
+        record[key] = value
+    if 'latitude' in record or 'longitude' in record:
+        latitude, longitude = record.get('latitude'), record.get('longitude')
+        located = latitude is not None and longitude is not None
+        record['geohash'] = geo.geohash(latitude, longitude) if located else None
+    return record
+
+
+#  Venues and artists
+#  ----------------------------------------------------------------
+
+def _upsert_statement(model, columns):
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert(table)
+    elif dialect == 'sqlite':
+        insert = sqlite.insert(table)
+    else:
+        raise ImportFailed('bulk upserts need PostgreSQL or SQLite, not %s' % dialect)
+    updates = dict((column, insert.excluded[column]) for column in columns if column != 'name')
+    if not updates:
+        return insert.on_conflict_do_nothing(index_elements=['name'])
+    # an edit form loaded before the import must not save over it
+    updates['version'] = table.c.version + 1
+    return insert.on_conflict_do_update(index_elements=['name'], set_=updates)
+
+
+class GenreLinks(object):
+    # replaces the genre links of upserted rows, creating Genre rows on demand
+
+    def __init__(self, links, owner_column):
+        self.links = links
+        self.owner_column = owner_column
+        self.ids = dict(db.session.query(Genre.name, Genre.id))
+
+    def _genre_ids(self, names):
+        missing = sorted(set(names) - set(self.ids))
+        if missing:
+            db.session.execute(Genre.__table__.insert(), [{'name': name} for name in missing])
+            self.ids.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+        return self.ids
+
+    def replace(self, genres_by_owner):
+        owner = self.links.c[self.owner_column]
+        db.session.execute(self.links.delete().where(owner.in_(list(genres_by_owner))))
+        ids = self._genre_ids(name for names in genres_by_owner.values() for name in names)
+        rows = [{'genre_id': ids[name], self.owner_column: owner_id}
+                for owner_id, names in genres_by_owner.items() for name in names]
+        if rows:
+            db.session.execute(self.links.insert(), rows)
+
+
+def import_entities(model, rows, chunk_size=CHUNK_SIZE, progress=None):
+    columns, links, owner_column = {
+        Venue: (VENUE_COLUMNS, venue_genres, 'venue_id'),
+        Artist: (ARTIST_COLUMNS, artist_genres, 'artist_id'),
+    }[model]
+    report = ImportReport(model.__tablename__)
+    genre_links = GenreLinks(links, owner_column)
+
+    try:
+        for chunk in chunked(rows, chunk_size):
+            # a record per name (the last one wins), grouped by the columns it
+            # carries so every executemany batch has one shape
+            records = {}
+            for line, row in chunk:
+                report.read += 1
+                try:
+                    record = _clean(row, columns)
+                except ValueError as e:
+                    report.skip(line, 'bad coordinates: %s' % e)
+                    continue
+                if not record.get('name'):
+                    report.skip(line, 'no name')
+                    continue
+                records[record['name']] = record
+            shapes = {}
+            for record in records.values():
+                shapes.setdefault(tuple(sorted(record)), []).append(record)
+            for shape, batch in shapes.items():
+                db.session.execute(_upsert_statement(model, shape), batch)
+
+            with_genres = [record for record in records.values() if 'genres' in record]
+            if with_genres:
+                ids = dict(db.session.query(model.name, model.id)
+                           .filter(model.name.in_([record['name'] for record in with_genres])))
+                genre_links.replace(dict((ids[record['name']], split_genres(record['genres']))
+                                         for record in with_genres))
+            db.session.commit()
+            report.written += len(records)
+            if progress:
+                progress(report)
+
+        if model is Venue:
+            geo.locate_venues()
+            db.session.commit()
+    except Exception:
+        # the chunks committed so far stay, and the caches must see them
+        db.session.rollback()
+        raise
+    finally:
+        search.invalidate(model)
+        table_versions.bump(model.__tablename__)
+        page_cache.clear()
+    return report
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+def _copy_shows(records):
+    # COPY .. FROM STDIN over the session's own connection and transaction
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([record['artist_id'], record['venue_id'],
+                         record['start_date'].isoformat(), record['image_link'] or ''])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert('COPY "Show" (artist_id, venue_id, start_date, image_link) '
+                           "FROM STDIN WITH (FORMAT csv, NULL '')", buffer)
+    finally:
+        cursor.close()
+
+
+def _resolve(row, line, key, names, ids, report):
+    value = row.get(key + '_id')
+    if value not in (None, ''):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            report.skip(line, 'bad %s_id %r' % (key, value))
+            return None
+        if value not in ids:
+            report.skip(line, 'unknown %s_id %r' % (key, value))
+            return None
+        return value
+    name = row.get(key) or row.get(key + '_name')
+    if not name:
+        report.skip(line, 'no %s' % key)
+        return None
+    if name not in names:
+        report.skip(line, 'unknown %s %r' % (key, name))
+        return None
+    return names[name]
+
+
+def import_shows(rows, chunk_size=CHUNK_SIZE, progress=None, copy=None):
+    report = ImportReport('Show')
+    if copy is None:
+        copy = db.engine.dialect.name == 'postgresql'
+    # soft deleted venues and artists take no new shows
+    artists = dict(db.session.query(Artist.name, Artist.id).filter(live(Artist)))
+    venues = dict(db.session.query(Venue.name, Venue.id).filter(live(Venue)))
+    artist_ids, venue_ids = set(artists.values()), set(venues.values())
+
+    try:
+        for chunk in chunked(rows, chunk_size):
+            records = {}
+            for line, row in chunk:
+                report.read += 1
+                row = dict((ALIASES.get(key, key), value) for key, value in row.items())
+                artist_id = _resolve(row, line, 'artist', artists, artist_ids, report)
+                venue_id = _resolve(row, line, 'venue', venues, venue_ids, report) if artist_id else None
+                if not venue_id:
+                    continue
+                try:
+                    start_date = _datetime(row.get('start_time'))
+                except (ValueError, OverflowError):
+                    report.skip(line, 'bad start_time %r' % row.get('start_time'))
+                    continue
+                key = (artist_id, venue_id, start_date)
+                records[key] = {'artist_id': artist_id, 'venue_id': venue_id,
+                                'start_date': start_date, 'image_link': row.get('image_link') or None}
+
+            # drop the shows that are already listed
+            if records:
+                existing = db.session.query(Show.artist_id, Show.venue_id, Show.start_date) \
+                    .filter(tuple_(Show.artist_id, Show.venue_id, Show.start_date).in_(list(records)))
+                for key in existing:
+                    if records.pop(tuple(key), None):
+                        report.present += 1
+
+            new = list(records.values())
+            if new and copy:
+                _copy_shows(new)
+            elif new:
+                db.session.execute(Show.__table__.insert(), new)
+            if new:
+                counters.shows_added((r['venue_id'], r['artist_id'], r['start_date']) for r in new)
+            db.session.commit()
+            report.written += len(new)
+            if progress:
+                progress(report)
+
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        table_versions.bump('Show', 'Venue', 'Artist')
+        page_cache.clear()
+    return report
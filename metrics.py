@@ -0,0 +1,76 @@
+import threading
+from time import perf_counter
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool instrumentation.
+#----------------------------------------------------------------------------#
+
+# InstrumentedQueuePool is a QueuePool that records how long every checkout
+# waited for a connection, how often the pool had to open an overflow
+# connection beyond pool_size, and how often a checkout timed out. The
+# counters are per process and are served by the /metrics route.
+
+
+class PoolStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def record_checkout(self, waited, overflowed):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def to_dict(self, pool=None):
+        with self._lock:
+            data = {
+                'checkouts': self.checkouts,
+                'wait_ms_total': round(self.wait_total * 1000, 3),
+                'wait_ms_avg': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def _do_get(self):
+        overflow_before = self._overflow
+        start = perf_counter()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        overflowed = self._overflow > overflow_before and self._overflow > 0
+        pool_stats.record_checkout(perf_counter() - start, overflowed)
+        return connection
@@ -0,0 +1,74 @@
+"""show surrogate key and indexes
+
+Revision ID: 3f5b8d2e6a91
+Revises: 7c1e9a4d2b10
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f5b8d2e6a91'
+down_revision = '7c1e9a4d2b10'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_show_venue_id_start_date', ['venue_id', 'start_date']),
+    ('ix_show_artist_id_start_date', ['artist_id', 'start_date']),
+    ('ix_show_start_date', ['start_date']),
+]
+
+
+def _copy_table(columns, primary_key, select_sql):
+    # rebuild "Show" under a new primary key, for databases that cannot
+    # alter one in place (SQLite)
+    op.create_table('Show_new', *(columns + [
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id']),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id']),
+        sa.PrimaryKeyConstraint(*primary_key),
+    ]))
+    op.execute('INSERT INTO "Show_new" (artist_id, venue_id, start_date, image_link) ' + select_sql)
+    op.drop_table('Show')
+    op.rename_table('Show_new', 'Show')
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # SERIAL numbers the existing rows as the column is added
+        op.execute('ALTER TABLE "Show" ADD COLUMN id SERIAL')
+        op.drop_constraint('Show_pkey', 'Show', type_='primary')
+        op.create_primary_key('Show_pkey', 'Show', ['id'])
+    else:
+        _copy_table([
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('artist_id', sa.Integer(), nullable=False),
+            sa.Column('venue_id', sa.Integer(), nullable=False),
+            sa.Column('start_date', sa.DateTime(), nullable=True),
+            sa.Column('image_link', sa.String(), nullable=True),
+        ], ['id'], 'SELECT artist_id, venue_id, start_date, image_link FROM "Show" ORDER BY start_date')
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+
+
+def downgrade():
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='Show')
+
+    # the old key allows one show per artist and venue: keep the earliest
+    op.execute('DELETE FROM "Show" WHERE id NOT IN '
+               '(SELECT min(id) FROM "Show" GROUP BY artist_id, venue_id)')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('Show_pkey', 'Show', type_='primary')
+        op.drop_column('Show', 'id')
+        op.create_primary_key('Show_pkey', 'Show', ['artist_id', 'venue_id'])
+    else:
+        _copy_table([
+            sa.Column('artist_id', sa.Integer(), nullable=False),
+            sa.Column('venue_id', sa.Integer(), nullable=False),
+            sa.Column('start_date', sa.DateTime(), nullable=True),
+            sa.Column('image_link', sa.String(), nullable=True),
+        ], ['artist_id', 'venue_id'], 'SELECT artist_id, venue_id, start_date, image_link FROM "Show"')
@@ -0,0 +1,37 @@
+"""search trigram indexes
+
+Revision ID: 7c1e9a4d2b10
+Revises: 05bbcee5653a
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e9a4d2b10'
+down_revision = '05bbcee5653a'
+branch_labels = None
+depends_on = None
+
+# must stay identical to search.SEARCH_DOCUMENT so the planner can use it
+SEARCH_DOCUMENT = "coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || " \
+                  "coalesce(state, '') || ' ' || coalesce(genres, '')"
+
+
+def upgrade():
+    # the in-process fallback index needs nothing on other databases
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute('CREATE INDEX ix_{0}_search_trgm ON "{1}" USING gin (({2}) gin_trgm_ops)'.format(
+            table.lower(), table, SEARCH_DOCUMENT))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        op.execute('DROP INDEX IF EXISTS ix_{0}_search_trgm'.format(table.lower()))
@@ -0,0 +1,73 @@
+"""normalized genres
+
+Revision ID: 9a4c2e7f1b35
+Revises: 3f5b8d2e6a91
+Create Date: 2026-10-18 21:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c2e7f1b35'
+down_revision = '3f5b8d2e6a91'
+branch_labels = None
+depends_on = None
+
+LINKS = [('Venue', 'venue_genres', 'venue_id'), ('Artist', 'artist_genres', 'artist_id')]
+
+
+def _names(value):
+    # older rows hold one form value, a comma list or a postgres array
+    # literal such as {Jazz,"Rock n Roll"}
+    value = (value or '').strip().strip('{}')
+    names = [name.strip().strip('"').strip() for name in value.split(',')]
+    return sorted(set(name for name in names if name))
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    links = {}
+    for owner, table, column in LINKS:
+        links[table] = op.create_table(table,
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint([column], [owner + '.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('genre_id', column)
+        )
+        op.create_index('ix_%s_%s' % (table, column), table, [column])
+
+    # move the existing genre strings into the link tables and rewrite
+    # them in the ", "-joined form the app now keeps
+    bind = op.get_bind()
+    rows = {}
+    for owner, _, _ in LINKS:
+        rows[owner] = [(id, genres, _names(genres)) for id, genres in
+                       bind.execute(sa.text('SELECT id, genres FROM "%s"' % owner))]
+    names = sorted(set(name for owner in rows for _, _, found in rows[owner] for name in found))
+    if names:
+        op.bulk_insert(genre, [{'name': name} for name in names])
+    genre_ids = dict((name, id) for id, name in bind.execute(sa.text('SELECT id, name FROM "Genre"')))
+
+    for owner, table, column in LINKS:
+        link_rows = [{'genre_id': genre_ids[name], column: id} for id, _, found in rows[owner] for name in found]
+        if link_rows:
+            op.bulk_insert(links[table], link_rows)
+        changed = [{'id': id, 'genres': ', '.join(found)} for id, genres, found in rows[owner]
+                   if genres is not None and genres != ', '.join(found)]
+        if changed:
+            bind.execute(sa.text('UPDATE "%s" SET genres = :genres WHERE id = :id' % owner), changed)
+
+
+def downgrade():
+    for _, table, column in LINKS:
+        op.drop_index('ix_%s_%s' % (table, column), table_name=table)
+        op.drop_table(table)
+    op.drop_table('Genre')
@@ -0,0 +1,49 @@
+"""venue geo columns
+
+Revision ID: a8d3f6c2b419
+Revises: e5f1b7a3c962
+Create Date: 2026-10-20 10:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f6c2b419'
+down_revision = 'e5f1b7a3c962'
+branch_labels = None
+depends_on = None
+
+# must stay identical to geo.LOCATION so the planner can use it
+LOCATION = 'geography(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))'
+
+
+def _has_postgis(bind):
+    return bind.dialect.name == 'postgresql' and bool(bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")).scalar())
+
+
+def upgrade():
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_venue_geohash', 'Venue', ['geohash'])
+
+    # existing venues are geocoded with `flask venues geocode`; the KNN
+    # index is only built where PostGIS can be installed
+    bind = op.get_bind()
+    if _has_postgis(bind):
+        op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+        op.execute('CREATE INDEX ix_venue_location ON "Venue" USING gist (({0}))'.format(LOCATION))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_venue_location')
+    op.drop_index('ix_venue_geohash', table_name='Venue')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,51 @@
+"""show counters
+
+Revision ID: b6e2d4f8a017
+Revises: 9a4c2e7f1b35
+Create Date: 2026-10-19 10:15:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d4f8a017'
+down_revision = '9a4c2e7f1b35'
+branch_labels = None
+depends_on = None
+
+OWNERS = [('Venue', 'venue_id'), ('Artist', 'artist_id')]
+COUNTERS = ['past_shows_count', 'upcoming_shows_count']
+
+
+def upgrade():
+    for owner, _ in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            for name in COUNTERS:
+                batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+    clock = op.create_table('counter_clock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # count the existing shows as of now; `flask counters roll` moves them on
+    now = datetime.now()
+    for owner, column in OWNERS:
+        op.get_bind().execute(sa.text(
+            'UPDATE "{owner}" SET '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{column} = "{owner}".id '
+            'AND "Show".start_date < :now), '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{column} = "{owner}".id '
+            'AND "Show".start_date >= :now)'.format(owner=owner, column=column)), {'now': now})
+    op.bulk_insert(clock, [{'id': 1, 'rolled_at': now}])
+
+
+def downgrade():
+    op.drop_table('counter_clock')
+    for owner, _ in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            for name in COUNTERS:
+                batch_op.drop_column(name)
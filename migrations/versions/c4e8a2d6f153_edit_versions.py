@@ -0,0 +1,28 @@
+"""edit versions
+
+Revision ID: c4e8a2d6f153
+Revises: a8d3f6c2b419
+Create Date: 2026-10-20 15:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2d6f153'
+down_revision = 'a8d3f6c2b419'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,39 @@
+"""job table
+
+Revision ID: d3a7c91e5b24
+Revises: b6e2d4f8a017
+Create Date: 2026-10-19 14:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c91e5b24'
+down_revision = 'b6e2d4f8a017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_status_run_at', 'Job', ['status', 'run_at'])
+
+
+def downgrade():
+    op.drop_index('ix_job_status_run_at', table_name='Job')
+    op.drop_table('Job')
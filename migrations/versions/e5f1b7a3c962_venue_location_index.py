@@ -0,0 +1,24 @@
+"""venue location index
+
+Revision ID: e5f1b7a3c962
+Revises: d3a7c91e5b24
+Create Date: 2026-10-19 17:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f1b7a3c962'
+down_revision = 'd3a7c91e5b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'])
+
+
+def downgrade():
+    op.drop_index('ix_venue_state_city', table_name='Venue')
@@ -0,0 +1,40 @@
+"""soft delete
+
+Revision ID: f2b9d4e7a360
+Revises: c4e8a2d6f153
+Create Date: 2026-10-21 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9d4e7a360'
+down_revision = 'c4e8a2d6f153'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        prefix = 'ix_%s_' % table.lower()
+        # live listings in (name, id) order, and the rows a purge looks for
+        op.create_index(prefix + 'live_name', table, ['name', 'id'],
+                        postgresql_where=LIVE, sqlite_where=LIVE)
+        op.create_index(prefix + 'deleted_at', table, ['deleted_at'],
+                        postgresql_where=DELETED, sqlite_where=DELETED)
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        prefix = 'ix_%s_' % table.lower()
+        op.drop_index(prefix + 'deleted_at', table_name=table)
+        op.drop_index(prefix + 'live_name', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('deleted_at')
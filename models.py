@@ -7,16 +7,72 @@ from app import db
 # Models.
 #----------------------------------------------------------------------------#
 
-shows_table = db.Table('Show', 
-  db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
-  db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
-  db.Column('start_date', db.DateTime, default=datetime.now()),
-  db.Column('image_link', db.String)
+# Genres are normalized into Genre plus one link table per entity; the link
+# primary keys lead with genre_id so "venues in genre X" is an index range.
+# Venue.genres / Artist.genres keep a ", "-joined copy of the names for
+# display and the search document; set_genres() writes both.
+#
+# A soft deleted venue or artist has deleted_at set (see deletion.py). Live
+# reads filter on live(model), which the partial indexes below match: the
+# listing order (name, id) over live rows, and the deleted rows for purges.
+
+LIVE = db.text('deleted_at IS NULL')
+DELETED = db.text('deleted_at IS NOT NULL')
+
+venue_genres = db.Table('venue_genres',
+  db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_venue_genres_venue_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+  db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_artist_genres_artist_id', 'artist_id')
 )
 
 
+# One row: the time the show counters on Venue and Artist were last rolled
+# to (see counters.py).
+counter_clock = db.Table('counter_clock',
+  db.Column('id', db.Integer, primary_key=True),
+  db.Column('rolled_at', db.DateTime, nullable=False)
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        # one range scan per venue/artist timeline, and date order for /shows
+        db.Index('ix_show_venue_id_start_date', 'venue_id', 'start_date'),
+        db.Index('ix_show_artist_id_start_date', 'artist_id', 'start_date'),
+        db.Index('ix_show_start_date', 'start_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_date = db.Column(db.DateTime, default=datetime.now)
+    image_link = db.Column(db.String)
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # ?state=&city= on the venue and show listings
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        # prefix range scans for /venues/nearby (see geo.py)
+        db.Index('ix_venue_geohash', 'geohash'),
+        db.Index('ix_venue_live_name', 'name', 'id', postgresql_where=LIVE, sqlite_where=LIVE),
+        db.Index('ix_venue_deleted_at', 'deleted_at', postgresql_where=DELETED, sqlite_where=DELETED),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True)
@@ -30,21 +86,110 @@ class Venue(db.Model):
     website_link = db.Column(db.String(120))
     looking_for_talent = db.Column(db.Boolean, default=False, nullable=False)
     seeking_description = db.Column(db.String())
-    artists = db.relationship('Artist', secondary=shows_table, backref=db.backref('venues', lazy=True))
+    artists = db.relationship('Artist', secondary=Show.__table__, viewonly=True, backref=db.backref('venues', lazy=True))
+    genre_list = db.relationship('Genre', secondary=venue_genres, lazy=True)
+    # maintained by counters.py
+    past_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # set by the import feeds or geo.locate_venues()
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # bumped by every edit, so an edit made from a stale form is refused
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+    __mapper_args__ = {'version_id_col': version}
+    # set by a soft delete
+    deleted_at = db.Column(db.DateTime)
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_live_name', 'name', 'id', postgresql_where=LIVE, sqlite_where=LIVE),
+        db.Index('ix_artist_deleted_at', 'deleted_at', postgresql_where=DELETED, sqlite_where=DELETED),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     genres = db.Column(db.String)
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False, nullable=False)
     seeking_description = db.Column(db.String())
+    genre_list = db.relationship('Genre', secondary=artist_genres, lazy=True)
+    # maintained by counters.py
+    past_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # bumped by every edit, so an edit made from a stale form is refused
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+    __mapper_args__ = {'version_id_col': version}
+    # set by a soft delete
+    deleted_at = db.Column(db.DateTime)
+
+
+def live(model):
+    # the condition that leaves out soft deleted rows
+    return model.deleted_at.is_(None)
+
+
+def split_genres(value):
+    # the list of names stored in a genres column
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def genre_names(names):
+    # the sorted, de-duplicated names a genres column holds
+    return sorted(set(name.strip() for name in names if name and name.strip()))
+
+
+def set_genres(entity, names):
+    # point a venue or artist at these genres, creating missing Genre rows
+    names = genre_names(names)
+    genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+    known = set(genre.name for genre in genres)
+    for name in names:
+        if name not in known:
+            genre = Genre(name=name)
+            db.session.add(genre)
+            genres.append(genre)
+    entity.genre_list = genres
+    entity.genres = ', '.join(names)
+
+
+def link_genres(links, owner_column, owner_id, names):
+    # set_genres() for one row written without the ORM: replace its link
+    # rows, creating missing Genre rows; the caller updates the genres column
+    names = genre_names(names)
+    ids = dict(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(names))) if names else {}
+    missing = [name for name in names if name not in ids]
+    if missing:
+        db.session.execute(Genre.__table__.insert(), [{'name': name} for name in missing])
+        ids.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+    db.session.execute(links.delete().where(links.c[owner_column] == owner_id))
+    if names:
+        db.session.execute(links.insert(), [{'genre_id': ids[name], owner_column: owner_id} for name in names])
+
+
+class Job(db.Model):
+    # a background task run and its retry state (see tasks.py)
+    __tablename__ = 'Job'
+    __table_args__ = (
+        # the runner claims due jobs in run_at order
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
@@ -0,0 +1,127 @@
+import base64
+import json
+from datetime import datetime
+from flask import abort, current_app, request, url_for
+from sqlalchemy import tuple_
+
+#----------------------------------------------------------------------------#
+# Keyset (seek) pagination.
+#----------------------------------------------------------------------------#
+
+# A cursor remembers the sort key of the row at the edge of the current page
+# plus the direction to seek in, so fetching any page is an index range scan
+# of per_page + 1 rows instead of an OFFSET over everything before it.
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(direction, key):
+    payload = json.dumps([direction, [_encode_value(v) for v in key]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # raises ValueError on anything that is not a cursor we produced
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('invalid cursor')
+    if direction not in ('next', 'prev') or not isinstance(key, list):
+        raise ValueError('invalid cursor')
+    return direction, tuple(_decode_value(v) for v in key)
+
+
+def page_args(default_per_page):
+    # read ?cursor= and ?per_page= from the request; a bad cursor is a 400
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    per_page = max(1, min(per_page, current_app.config['MAX_PER_PAGE']))
+    token = request.args.get('cursor')
+    if not token:
+        return None, per_page
+    try:
+        return decode_cursor(token), per_page
+    except ValueError:
+        abort(400)
+
+
+def keyset(query, keys, cursor, per_page):
+    # narrow a Query/Select to the rows after (or before) the cursor
+    direction, after = cursor if cursor else ('next', None)
+    if after is not None:
+        if len(after) != len(keys):
+            abort(400)
+        if direction == 'next':
+            query = query.filter(tuple_(*keys) > tuple_(*after))
+        else:
+            query = query.filter(tuple_(*keys) < tuple_(*after))
+    if direction == 'next':
+        query = query.order_by(*keys)
+    else:
+        query = query.order_by(*[key.desc() for key in keys])
+    return query.limit(per_page + 1), direction
+
+
+def build_page(rows, direction, cursor, per_page, key_of):
+    # turn the per_page + 1 rows fetched by keyset() into a Page
+    rows = list(rows)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor('next', key_of(rows[-1]))
+    if rows and has_prev:
+        prev_cursor = encode_cursor('prev', key_of(rows[0]))
+    return Page(rows, per_page, next_cursor, prev_cursor)
+
+
+def paginate(query, keys, key_of, cursor, per_page):
+    query, direction = keyset(query, keys, cursor, per_page)
+    return build_page(query.all(), direction, cursor, per_page, key_of)
+
+
+class Page(object):
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def _url(self, cursor, endpoint=None):
+        args = request.args.to_dict()
+        args.update(request.view_args or {})
+        args['cursor'] = cursor
+        args['per_page'] = self.per_page
+        return url_for(endpoint or request.endpoint, **args)
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self):
+        return self._url(self.prev_cursor) if self.prev_cursor else None
+
+    def to_dict(self):
+        return {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+        }
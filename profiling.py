@@ -0,0 +1,143 @@
+import re
+from time import perf_counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#----------------------------------------------------------------------------#
+
+# Opt-in with SQL_PROFILING=true. Every statement executed while a request
+# is being handled is timed through engine events; when the request ends
+# the totals are written to the app logger (error.log outside debug mode)
+# and returned in a Server-Timing header:
+#
+#   Server-Timing: db;dur=12.4;desc="7 queries", app;dur=30.1
+#
+# Statements are fingerprinted (literals and IN-lists collapsed) and a
+# fingerprint seen SQL_NPLUSONE_THRESHOLD times in one request is reported
+# as a likely N+1. A view may declare a query budget with @query_budget(n);
+# SQL_QUERY_BUDGET applies to the rest. Going over budget is logged, and
+# raises QueryBudgetExceeded when SQL_QUERY_BUDGET_STRICT is set (test mode).
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile(object):
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def db_time(self):
+        return sum(elapsed for _, elapsed in self.statements)
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda s: s[1], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        counts = {}
+        for statement, _ in self.statements:
+            key = fingerprint(statement)
+            counts[key] = counts.get(key, 0) + 1
+        return sorted(((n, key) for key, n in counts.items() if n >= threshold), reverse=True)
+
+
+_whitespace_re = re.compile(r'\s+')
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_list_re = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|%s))*\s*\)')
+
+
+def fingerprint(statement):
+    statement = _whitespace_re.sub(' ', statement).strip()
+    statement = _string_re.sub('?', statement)
+    statement = _number_re.sub('?', statement)
+    return _in_list_re.sub('(?)', statement)
+
+
+def query_budget(limit):
+    # declare the most statements a view may issue per request
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def current_profile():
+    if has_request_context():
+        return g.get('sql_profile')
+    return None
+
+
+def _profiled(conn):
+    # statements on a connection with execution_options(profile=False), such
+    # as the replica health checks, are not the view's
+    return current_profile() is not None and conn.get_execution_options().get('profile', True)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profiled(conn):
+        conn.info.setdefault('profiling_started', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('profiling_started')
+    if _profiled(conn) and started:
+        profile.statements.append((statement, perf_counter() - started.pop()))
+
+
+def init_app(app):
+    if not app.config['SQL_PROFILING']:
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        g.sql_profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        total = (perf_counter() - profile.started) * 1000
+        db_time = profile.db_time * 1000
+        response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries", app;dur=%.1f'
+                             % (db_time, profile.count, total))
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None) or app.config['SQL_QUERY_BUDGET']
+        repeated = profile.repeated(app.config['SQL_NPLUSONE_THRESHOLD'])
+
+        lines = ['%s %s: %d queries, %.1f ms in db, %.1f ms total'
+                 % (request.method, request.full_path.rstrip('?'), profile.count, db_time, total)]
+        for statement, elapsed in profile.slowest(app.config['SQL_PROFILING_SLOWEST']):
+            lines.append('  %.1f ms  %s' % (elapsed * 1000, _whitespace_re.sub(' ', statement)[:300]))
+        for n, key in repeated:
+            lines.append('  possible N+1, %d times: %s' % (n, key[:300]))
+        over_budget = budget and profile.count > budget
+        if over_budget:
+            lines.append('  over query budget: %d > %d' % (profile.count, budget))
+
+        if repeated or over_budget:
+            app.logger.warning('\n'.join(lines))
+        else:
+            app.logger.info('\n'.join(lines))
+
+        if over_budget and app.config['SQL_QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded('%s issued %d queries, budget is %d'
+                                      % (request.endpoint, profile.count, budget))
+        return response
@@ -0,0 +1,228 @@
+import itertools
+import threading
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, exc, orm, text
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# With DATABASE_REPLICA_URLS set, GET and HEAD requests, and the search
+# forms (POSTs that only read), read from one of the replicas (round robin)
+# and everything else - writes, flushes, background tasks and commands -
+# uses the primary (SQLALCHEMY_DATABASE_URI). The choice is made once per
+# request, on its first query.
+#
+# - Read-your-writes: a visitor's reads stay on the primary for
+#   REPLICA_STICKY_SECONDS after their own writes (a timestamp in the
+#   session cookie), so the page a form redirects to shows the change.
+# - Failover: a replica that cannot be connected to is left out until it
+#   answers a health check again, every REPLICA_CHECK_INTERVAL seconds; a
+#   PostgreSQL replica more than REPLICA_MAX_LAG seconds behind is left out
+#   the same way. The request that hit the failure runs once more on the
+#   primary.
+# - The page cache keeps entries filled from a replica for at most
+#   REPLICA_CACHE_TTL seconds, so a lagging replica cannot refill a page a
+#   write has just invalidated with data from before the write for long.
+
+READ_METHODS = ('GET', 'HEAD')
+# endpoints whose POSTs only read
+READ_ENDPOINTS = ('search_venues', 'search_artists')
+STICKY_KEY = '_db_primary_until'
+
+# seconds a PostgreSQL standby is behind; None on a server not in recovery
+LAG_QUERY = text('SELECT CASE WHEN pg_is_in_recovery() THEN '
+                 'CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                 'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END END')
+
+
+class Replica(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = engine.url.render_as_string(hide_password=True)
+        self.healthy = True
+        self.checked_at = None
+        self.lag = None
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.checking = threading.Lock()
+
+    def to_dict(self):
+        return {
+            'url': self.name,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'requests': self.requests,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+def reads_only():
+    # whether the current request only reads
+    return request.method in READ_METHODS or request.endpoint in READ_ENDPOINTS
+
+
+class ReplicaRouter(object):
+
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.replicas = []
+        self._turn = itertools.count()
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        for url in app.config['DATABASE_REPLICA_URLS']:
+            self.add(url)
+        # registered without replicas too, so one can be added later (the
+        # tests do); both do nothing while there are none
+        app.after_request(self._stick_to_primary)
+        app.register_error_handler(exc.DBAPIError, self._retry_on_primary)
+
+    def add(self, url):
+        # replica pools are left out of the primary's /metrics pool counters
+        options = dict(self.app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        options.pop('poolclass', None)
+        replica = Replica(create_engine(url, **options))
+        event.listen(replica.engine, 'handle_error', self._error_handler(replica))
+        self.replicas.append(replica)
+        return replica
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+    def replica_for_request(self):
+        # the replica the current request reads from, or None for the primary
+        if not self.replicas or not has_request_context():
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self._choose()
+        return g.db_replica
+
+    def serving_replica(self):
+        return has_request_context() and g.get('db_replica') is not None
+
+    def _choose(self):
+        if not reads_only() or session.get(STICKY_KEY, 0) > time.time():
+            return None
+        usable = [replica for replica in self.replicas if self._usable(replica)]
+        if not usable:
+            return None
+        replica = usable[next(self._turn) % len(usable)]
+        replica.requests += 1
+        return replica
+
+    def _usable(self, replica):
+        interval = self.app.config['REPLICA_CHECK_INTERVAL']
+        due = replica.checked_at is None or time.monotonic() - replica.checked_at >= interval
+        # one request checks; the others go by the last result meanwhile
+        if due and replica.checking.acquire(blocking=False):
+            try:
+                self.check(replica)
+            finally:
+                replica.checking.release()
+        return replica.healthy
+
+    def check(self, replica):
+        # connect, and on PostgreSQL measure the replication lag
+        max_lag = self.app.config['REPLICA_MAX_LAG']
+        try:
+            with replica.engine.connect() as connection:
+                # not counted against the budget of the request that checks
+                connection = connection.execution_options(profile=False)
+                if connection.dialect.name == 'postgresql':
+                    lag = connection.execute(LAG_QUERY).scalar()
+                    replica.lag = None if lag is None else round(float(lag), 3)
+                else:
+                    connection.execute(text('SELECT 1'))
+        except exc.DBAPIError:
+            # recorded by the handle_error listener
+            return
+        finally:
+            replica.checked_at = time.monotonic()
+        if max_lag and replica.lag is not None and replica.lag > max_lag:
+            self._mark_down(replica, 'lagging %.1f s behind the primary' % replica.lag)
+        elif not replica.healthy:
+            replica.healthy = True
+            self.app.logger.warning('replica %s is back', replica.name)
+
+    def _mark_down(self, replica, error):
+        replica.failures += 1
+        replica.last_error = error
+        replica.checked_at = time.monotonic()
+        if replica.healthy:
+            replica.healthy = False
+            self.app.logger.warning('replica %s left out for %s s: %s', replica.name,
+                                    self.app.config['REPLICA_CHECK_INTERVAL'], error)
+
+    def _error_handler(self, replica):
+        def handle_error(context):
+            # no connection, or one that died: the replica itself is unwell,
+            # not the statement
+            if context.connection is None or context.is_disconnect:
+                self._mark_down(replica, str(context.original_exception).strip()[:200])
+                if has_request_context() and g.get('db_replica') is replica:
+                    g.db_replica_failed = True
+        return handle_error
+
+    def _retry_on_primary(self, error):
+        if not g.pop('db_replica_failed', False):
+            raise error
+        self.db.session.rollback()
+        g.db_replica = None
+        return self.app.dispatch_request()
+
+    def _stick_to_primary(self, response):
+        if self.replicas and not reads_only():
+            session[STICKY_KEY] = int(time.time() + self.app.config['REPLICA_STICKY_SECONDS']) + 1
+        return response
+
+    def metrics(self):
+        return [replica.to_dict() for replica in self.replicas]
+
+
+router = ReplicaRouter()
+
+
+class RoutingSession(SignallingSession):
+    # reads go to the request's replica; flushes and DML to the primary
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = router.replica_for_request()
+            if replica is not None:
+                return replica.engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaCache(object):
+    # the page cache, with a shorter lifetime for entries filled from a replica
+
+    def __init__(self, cache, ttl):
+        self.cache = cache
+        self.ttl = ttl
+
+    def set(self, key, value, ttl=None):
+        if router.serving_replica():
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self.cache.set(key, value, ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+def init_app(app, db):
+    router.init_app(app, db)
@@ -0,0 +1,197 @@
+import heapq
+import re
+import threading
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db, table_versions
+from models import Venue, Artist, live
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are searched on a single document made of their name,
+# city, state and genres. A row matches when the search term is a
+# case-insensitive substring of that document (the semantics of the old
+# name ILIKE '%term%'), and results are ranked by name match first, then by
+# trigram similarity of the name to the term.
+#
+# On PostgreSQL the match is answered by a pg_trgm GIN index over the
+# document expression (see the "search trigram indexes" migration; the
+# expression below must stay identical to the indexed one). Everywhere else
+# an in-process trigram inverted index gives the same results.
+
+SEARCH_DOCUMENT = "coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || " \
+                  "coalesce(state, '') || ' ' || coalesce(genres, '')"
+
+_word_re = re.compile(r'[^\W_]+')
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def trigrams(text):
+    # the trigram set pg_trgm builds for similarity(): lower-cased words,
+    # each padded with two leading blanks and one trailing blank
+    grams = set()
+    for word in _word_re.findall(text.lower()):
+        padded = '  ' + word + ' '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _similarity(grams_a, grams_b):
+    if not grams_a or not grams_b:
+        return 0.0
+    common = len(grams_a & grams_b)
+    return common / float(len(grams_a) + len(grams_b) - common)
+
+
+def similarity(a, b):
+    # pg_trgm's similarity(a, b)
+    return _similarity(trigrams(a or ''), trigrams(b or ''))
+
+
+def results(rows):
+    return [{'id': row.id, 'name': row.name, 'city': row.city, 'state': row.state} for row in rows]
+
+
+class IlikeSearch(object):
+    # the original sequential-scan path, kept for benchmarking
+    name = 'ilike'
+
+    def statement(self, model, term, limit):
+        return db.select(model.id, model.name, model.city, model.state) \
+            .where(live(model), model.name.ilike('%' + _escape_like(term) + '%', escape='\\')) \
+            .order_by(model.name, model.id).limit(limit)
+
+    def search(self, model, term, limit):
+        return results(db.session.execute(self.statement(model, term, limit)))
+
+
+class PostgresSearch(object):
+    name = 'postgres'
+
+    def statement(self, model, term, limit):
+        pattern = '%' + _escape_like(term) + '%'
+        document = db.literal_column('(' + SEARCH_DOCUMENT + ')')
+        return db.select(model.id, model.name, model.city, model.state) \
+            .where(live(model), document.ilike(pattern, escape='\\')) \
+            .order_by(model.name.ilike(pattern, escape='\\').desc(),
+                      db.func.similarity(model.name, term).desc(),
+                      model.name, model.id) \
+            .limit(limit)
+
+    def search(self, model, term, limit):
+        return results(db.session.execute(self.statement(model, term, limit)))
+
+
+class InvertedIndexSearch(object):
+    # trigram -> ids posting lists over the lower-cased search document,
+    # rebuilt lazily after a write this process sees, or when the model's
+    # table version moves (a write in another worker, or an import)
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._dirty = set()
+
+    def invalidate(self, model):
+        self._dirty.add(model)
+
+    def _build(self, model):
+        rows = db.session.query(model.id, model.name, model.city, model.state, model.genres) \
+            .filter(live(model)).all()
+        docs = {}
+        postings = {}
+        for row in rows:
+            doc = ' '.join(value or '' for value in (row.name, row.city, row.state, row.genres)).lower()
+            docs[row.id] = (doc, (row.name or '').lower(), trigrams(row.name or ''), row)
+            for i in range(len(doc) - 2):
+                postings.setdefault(doc[i:i + 3], set()).add(row.id)
+        return docs, postings
+
+    def _index(self, model):
+        version = table_versions.stamp(model.__tablename__)[0]
+        with self._lock:
+            built = self._indexes.get(model)
+            if built is None or built[0] != version or model in self._dirty:
+                self._dirty.discard(model)
+                built = self._indexes[model] = (version,) + self._build(model)
+            return built[1:]
+
+    def search(self, model, term, limit):
+        docs, postings = self._index(model)
+        needle = term.lower()
+        if len(needle) >= 3:
+            grams = sorted((needle[i:i + 3] for i in range(len(needle) - 2)),
+                           key=lambda g: len(postings.get(g, ())))
+            candidates = set(postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= postings.get(gram, set())
+        else:
+            candidates = docs.keys()
+
+        term_grams = trigrams(term)
+        matches = []
+        for row_id in candidates:
+            doc, name, name_grams, row = docs[row_id]
+            if needle in doc:
+                matches.append((needle not in name, -_similarity(name_grams, term_grams), row.name or '', row_id, row))
+        return results(m[4] for m in heapq.nsmallest(limit, matches, key=lambda m: m[:4]))
+
+
+_backends = {
+    'ilike': IlikeSearch(),
+    'postgres': PostgresSearch(),
+    'memory': InvertedIndexSearch(),
+}
+
+
+def backend_for(name=None):
+    name = name or current_app.config['SEARCH_BACKEND']
+    if name == 'auto':
+        name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return _backends[name]
+
+
+def search(model, term, limit=None, backend=None):
+    if limit is None:
+        limit = current_app.config['SEARCH_RESULT_LIMIT']
+    return backend_for(backend).search(model, term.strip(), limit)
+
+
+def search_statement(model, term, limit=None, backend=None):
+    # the SQL a backend would run, or None for the in-process index
+    if limit is None:
+        limit = current_app.config['SEARCH_RESULT_LIMIT']
+    backend = backend_for(backend)
+    if not hasattr(backend, 'statement'):
+        return None
+    return backend.statement(model, term.strip(), limit)
+
+
+def invalidate(model):
+    # for writes the session events below cannot see, such as bulk inserts
+    _backends['memory'].invalidate(model)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Venue, Artist)):
+            _backends['memory'].invalidate(type(obj))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_after_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Venue, Artist):
+            _backends['memory'].invalidate(mapper.class_)
@@ -0,0 +1,35 @@
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+
+#----------------------------------------------------------------------------#
+# Signed-cookie sessions with key rotation.
+#----------------------------------------------------------------------------#
+
+# Every worker on every node has to sign with the same SECRET_KEY, or a
+# session cookie (and with it flash messages and CSRF tokens) set by one
+# process is rejected by the next. To rotate, put the new key in SECRET_KEY
+# and the old one in SECRET_KEY_FALLBACKS: cookies are signed with the new
+# key and either is accepted until the fallback is dropped.
+
+
+def signing_keys(app):
+    # oldest first; itsdangerous signs with the last key and verifies with any
+    return list(app.config['SECRET_KEY_FALLBACKS']) + [app.secret_key]
+
+
+class RotatingSessionInterface(SecureCookieSessionInterface):
+
+    def get_signing_serializer(self, app):
+        if not app.secret_key:
+            return None
+        signer_kwargs = dict(key_derivation=self.key_derivation, digest_method=self.digest_method)
+        return URLSafeTimedSerializer(signing_keys(app), salt=self.salt,
+                                      serializer=self.serializer, signer_kwargs=signer_kwargs)
+
+
+def init_app(app):
+    app.session_interface = RotatingSessionInterface()
+    app.config.setdefault('WTF_CSRF_SECRET_KEY', signing_keys(app))
+    if app.config['SECRET_KEY_GENERATED'] and not app.debug:
+        app.logger.warning('SECRET_KEY is not set: using a random key, so sessions and flashed '
+                           'messages will not survive a restart or work across processes')
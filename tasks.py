@@ -0,0 +1,368 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from flask import has_app_context
+from app import db
+from models import Job
+
+#----------------------------------------------------------------------------#
+# Background tasks.
+#----------------------------------------------------------------------------#
+
+# Side effects of a write that need not delay its response run as tasks in
+# a small thread pool inside the app process. A task is a function
+# registered with @task, subscribed to the events the write routes fire
+# after db.session.commit():
+#
+#   @tasks.task(on=['venue.saved'])
+#   def refresh_something(venue_id):
+#       ...
+#
+#   tasks.fire('venue.saved', venue_id=venue.id)
+#
+# Each subscriber becomes a job with a JSON payload. TASK_BACKEND picks
+# where jobs wait:
+#
+# - 'database' (default) keeps them in the Job table, so they survive a
+#   restart and any process sharing the database can run them; runners
+#   claim jobs with a conditional UPDATE (FOR UPDATE SKIP LOCKED on
+#   PostgreSQL), so a job runs once;
+# - 'memory' keeps them in a local queue, lost when the process exits;
+# - 'eager' runs them inline in fire(), for scripts and debugging.
+#
+# A job that raises is retried after TASK_RETRY_BACKOFF * 2^(attempt - 1)
+# seconds (with jitter) until it has run max_attempts times, then marked
+# failed. The runner starts in the first process that fires an event (and
+# in each gunicorn worker); with TASK_RUN_IN_WEB=false web processes only
+# queue jobs and `flask tasks work` runs them.
+
+_tasks = {}
+_subscribers = {}
+
+
+class Task(object):
+
+    def __init__(self, name, function, max_attempts=None, when=None):
+        self.name = name
+        self.function = function
+        self.max_attempts = max_attempts
+        self.when = when
+
+
+def task(name=None, on=(), max_attempts=None, when=None):
+    # register a function as a task run for each of the events in <on>;
+    # when names a config flag that must be set for it to be queued
+    def decorator(function):
+        registered = Task(name or function.__name__, function, max_attempts, when)
+        _tasks[registered.name] = registered
+        for event in on:
+            _subscribers.setdefault(event, []).append(registered)
+        return function
+    return decorator
+
+
+def fire(event, **payload):
+    # queue every task subscribed to <event>; call after the commit
+    for subscriber in _subscribers.get(event, ()):
+        if subscriber.when is None or runner.app.config[subscriber.when]:
+            runner.enqueue(subscriber.name, payload, subscriber.max_attempts)
+
+
+class QueuedJob(object):
+
+    def __init__(self, id, name, payload, attempts, max_attempts, run_at=None):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.run_at = run_at
+
+
+#  Queues
+#  ----------------------------------------------------------------
+
+class DatabaseQueue(object):
+    name = 'database'
+
+    def __init__(self, timeout, keep):
+        self.timeout = timeout
+        self.keep = keep
+        self.table = Job.__table__
+
+    def put(self, name, payload, max_attempts):
+        now = datetime.now()
+        with db.engine.begin() as connection:
+            connection.execute(self.table.insert().values(
+                name=name, payload=json.dumps(payload), status='queued', attempts=0,
+                max_attempts=max_attempts, run_at=now, created_at=now))
+
+    def claim(self, limit):
+        jobs = self.table
+        now = datetime.now()
+        with db.engine.begin() as connection:
+            due = db.select(jobs.c.id).where(jobs.c.status == 'queued', jobs.c.run_at <= now) \
+                .order_by(jobs.c.run_at, jobs.c.id).limit(limit)
+            if connection.dialect.name == 'postgresql':
+                due = due.with_for_update(skip_locked=True)
+            claimed = []
+            for id, in connection.execute(due).fetchall():
+                # another runner may have taken it since the select
+                updated = connection.execute(jobs.update()
+                                             .where(jobs.c.id == id, jobs.c.status == 'queued')
+                                             .values(status='running', attempts=jobs.c.attempts + 1, started_at=now))
+                if updated.rowcount:
+                    claimed.append(id)
+            if not claimed:
+                return []
+            rows = connection.execute(db.select(jobs.c.id, jobs.c.name, jobs.c.payload, jobs.c.attempts,
+                                                jobs.c.max_attempts).where(jobs.c.id.in_(claimed)))
+            return [QueuedJob(row.id, row.name, json.loads(row.payload), row.attempts, row.max_attempts)
+                    for row in rows]
+
+    def _update(self, job, **values):
+        with db.engine.begin() as connection:
+            connection.execute(self.table.update().where(self.table.c.id == job.id).values(**values))
+
+    def finish(self, job):
+        self._update(job, status='done', finished_at=datetime.now(), last_error=None)
+
+    def retry(self, job, run_at, error):
+        self._update(job, status='queued', run_at=run_at, last_error=error)
+
+    def fail(self, job, error):
+        self._update(job, status='failed', finished_at=datetime.now(), last_error=error)
+
+    def housekeeping(self):
+        # requeue jobs whose runner died mid-run and drop old finished ones
+        jobs = self.table
+        now = datetime.now()
+        with db.engine.begin() as connection:
+            connection.execute(jobs.update()
+                               .where(jobs.c.status == 'running',
+                                      jobs.c.started_at < now - timedelta(seconds=self.timeout))
+                               .values(status='queued', run_at=now, last_error='runner timed out'))
+            connection.execute(jobs.delete().where(jobs.c.status == 'done',
+                                                   jobs.c.finished_at < now - timedelta(seconds=self.keep)))
+
+    def counts(self):
+        rows = db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status))
+        return dict((status, n) for status, n in rows)
+
+
+class MemoryQueue(object):
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queued = []
+        self._ids = 0
+        self._counts = {}
+
+    def _count(self, status, delta):
+        self._counts[status] = self._counts.get(status, 0) + delta
+
+    def put(self, name, payload, max_attempts):
+        with self._lock:
+            self._ids += 1
+            self._queued.append(QueuedJob(self._ids, name, payload, 0, max_attempts, datetime.now()))
+            self._count('queued', 1)
+
+    def claim(self, limit):
+        now = datetime.now()
+        with self._lock:
+            due = sorted((job for job in self._queued if job.run_at <= now), key=lambda job: job.run_at)[:limit]
+            for job in due:
+                self._queued.remove(job)
+                job.attempts += 1
+            self._count('queued', -len(due))
+            self._count('running', len(due))
+            return due
+
+    def finish(self, job):
+        with self._lock:
+            self._count('running', -1)
+            self._count('done', 1)
+
+    def retry(self, job, run_at, error):
+        with self._lock:
+            job.run_at = run_at
+            self._queued.append(job)
+            self._count('running', -1)
+            self._count('queued', 1)
+
+    def fail(self, job, error):
+        with self._lock:
+            self._count('running', -1)
+            self._count('failed', 1)
+
+    def housekeeping(self):
+        pass
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def create_queue(config):
+    backend = config['TASK_BACKEND']
+    if backend == 'database':
+        return DatabaseQueue(config['TASK_TIMEOUT'], config['TASK_KEEP_DONE'])
+    if backend in ('memory', 'eager'):
+        return MemoryQueue()
+    raise ValueError('unknown TASK_BACKEND %r' % backend)
+
+
+#  Runner
+#  ----------------------------------------------------------------
+
+class TaskStats(object):
+    # per-process counters by task name, served by /metrics
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tasks = {}
+
+    def record(self, name, outcome, elapsed=0.0):
+        with self._lock:
+            stats = self.tasks.setdefault(name, {
+                'queued': 0, 'succeeded': 0, 'retried': 0, 'failed': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stats[outcome] += 1
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def to_dict(self):
+        with self._lock:
+            return dict((name, dict(stats, seconds=round(stats['seconds'], 3),
+                                    max_seconds=round(stats['max_seconds'], 3)))
+                        for name, stats in self.tasks.items())
+
+
+class TaskRunner(object):
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.stats = TaskStats()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._running = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.queue = create_queue(app.config)
+
+    @property
+    def eager(self):
+        return self.app.config['TASK_BACKEND'] == 'eager'
+
+    def enqueue(self, name, payload, max_attempts=None):
+        max_attempts = max_attempts or self.app.config['TASK_MAX_ATTEMPTS']
+        self.stats.record(name, 'queued')
+        if self.eager:
+            self._run(QueuedJob(None, name, payload, 1, 1))
+            return
+        self.queue.put(name, payload, max_attempts)
+        if self.app.config['TASK_RUN_IN_WEB']:
+            self.start()
+            self._wake.set()
+
+    def start(self):
+        # start the dispatcher and pool, once per process: threads do not
+        # survive a fork, so a forked worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._running = 0
+            self._executor = ThreadPoolExecutor(self.app.config['TASK_WORKERS'], thread_name_prefix='task')
+            thread = threading.Thread(target=self._dispatch, name='task-dispatcher', daemon=True)
+            thread.start()
+            self._thread = thread
+
+    def join(self):
+        self._thread.join()
+
+    def _dispatch(self):
+        poll = self.app.config['TASK_POLL_INTERVAL']
+        workers = self.app.config['TASK_WORKERS']
+        last_housekeeping = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - last_housekeeping > 60:
+                        self.queue.housekeeping()
+                        last_housekeeping = time.monotonic()
+                    with self._lock:
+                        free = workers - self._running
+                    jobs = self.queue.claim(free) if free > 0 else []
+                for job in jobs:
+                    with self._lock:
+                        self._running += 1
+                    self._executor.submit(self._run_claimed, job)
+            except Exception:
+                self.app.logger.exception('task dispatcher failed; retrying in %s s', poll)
+            self._wake.wait(poll)
+            self._wake.clear()
+
+    def _run_claimed(self, job):
+        try:
+            self._run(job)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._wake.set()
+
+    def _run(self, job):
+        registered = _tasks.get(job.name)
+        started = time.perf_counter()
+        # eager jobs run inside the firing request and share its session
+        with nullcontext() if has_app_context() else self.app.app_context():
+            try:
+                if registered is None:
+                    raise LookupError('no task named %r' % job.name)
+                registered.function(**job.payload)
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                error = '%s: %s' % (type(e).__name__, e)
+                if self.eager:
+                    self.app.logger.exception('task %s failed', job.name)
+                    self.stats.record(job.name, 'failed', elapsed)
+                elif registered is not None and job.attempts < job.max_attempts:
+                    delay = self.app.config['TASK_RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+                    delay *= random.uniform(1, 1.25)
+                    self.app.logger.warning('task %s (job %s) failed on attempt %d of %d, retrying in %.1f s: %s',
+                                   job.name, job.id, job.attempts, job.max_attempts, delay, error)
+                    self.queue.retry(job, datetime.now() + timedelta(seconds=delay), error)
+                    self.stats.record(job.name, 'retried', elapsed)
+                else:
+                    self.app.logger.exception('task %s (job %s) failed after %d attempts', job.name, job.id, job.attempts)
+                    self.queue.fail(job, error)
+                    self.stats.record(job.name, 'failed', elapsed)
+                return
+            if not self.eager:
+                self.queue.finish(job)
+            self.stats.record(job.name, 'succeeded', time.perf_counter() - started)
+
+    def metrics(self):
+        return {
+            'backend': self.app.config['TASK_BACKEND'],
+            'running': self._running,
+            'jobs': self.queue.counts(),
+            'tasks': self.stats.to_dict(),
+        }
+
+
+runner = TaskRunner()
+
+
+def init_app(app):
+    runner.init_app(app)
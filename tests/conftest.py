@@ -0,0 +1,48 @@
+import os
+import re
+import tempfile
+
+import pytest
+
+# config.py is read when app.py is imported, so the test settings go into
+# the environment first. TEST_DATABASE_URL points the suite at a scratch
+# PostgreSQL database (its tables are dropped); by default it runs on a
+# temporary SQLite file.
+_directory = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or 'sqlite:///' + os.path.join(_directory, 'test.db')
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ['SECRET_KEY'] = 'test'
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['TASK_BACKEND'] = 'eager'
+os.environ['SQL_PROFILING'] = 'true'
+os.environ['SQL_QUERY_BUDGET_STRICT'] = 'true'
+
+from app import app as fyyur, db, page_cache, table_versions
+
+
+def reset():
+    # empty tables and caches
+    with fyyur.app_context():
+        db.drop_all()
+        db.create_all()
+    page_cache.clear()
+    table_versions.reset()
+
+
+@pytest.fixture
+def app():
+    fyyur.config['TESTING'] = True
+    reset()
+    yield fyyur
+    with fyyur.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def statement_count(response):
+    # the number of SQL statements the profiler reports in Server-Timing
+    return int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/api/v1/artists/999999', '/api/v1/venues/999999?fields=id'])
+def test_missing_record_is_a_json_404(client, path):
+    response = client.get(path)
+    assert response.status_code == 404
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['error']['status'] == 404
+
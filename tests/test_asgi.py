@@ -0,0 +1,42 @@
+import asyncio
+
+import asgi
+from benchmarks import datagen
+
+
+def asgi_get(path, query_string=b''):
+    # one GET through the ASGI application: (status, headers, body chunks)
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'query_string': query_string,
+             'headers': [(b'host', b'localhost')], 'http_version': '1.1', 'scheme': 'http',
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 5000)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = messages[0]
+    assert start['type'] == 'http.response.start'
+    chunks = [message['body'] for message in messages[1:]]
+    assert not messages[-1].get('more_body')
+    return start['status'], dict(start['headers']), chunks
+
+
+def test_streamed_export_is_complete(app):
+    with app.app_context():
+        datagen.generate({'venues': 50, 'artists': 50, 'shows': 6000})
+    status, headers, chunks = asgi_get('/export/shows.csv')
+    assert status == 200
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    assert len(lines) == 6001
+    # sent as it is produced, not buffered into one body
+    assert len([chunk for chunk in chunks if chunk]) > 1
+
+
+def test_sync_view_under_asgi(app):
+    status, headers, chunks = asgi_get('/venues.json')
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from cache import RedisVersions, create_cache, create_versions
+from fake_redis import FakeRedis
+
+CONFIG = {'CACHE_BACKEND': 'redis', 'CACHE_DEFAULT_TTL': 300, 'CACHE_MAX_ENTRIES': 10}
+
+
+@pytest.fixture
+def client():
+    return FakeRedis()
+
+
+def test_redis_cache_get_set_delete_clear(client):
+    cache = create_cache(CONFIG, client)
+    assert cache.get('venue:1') is None
+    cache.set('venue:1', {'name': 'Hall'})
+    cache.set('artist:1', ['Band'])
+    client.set('other:1', 'kept')
+    assert cache.get('venue:1') == {'name': 'Hall'}
+
+    cache.delete('venue:1')
+    assert cache.get('venue:1') is None
+    assert cache.get('artist:1') == ['Band']
+    cache.clear()
+    assert cache.get('artist:1') is None
+    assert client.get('other:1') == b'kept'
+    assert cache.stats() == {'backend': 'redis', 'hits': 2, 'misses': 3}
+
+
+def test_redis_cache_entries_expire(client, monkeypatch):
+    cache = create_cache(CONFIG, client)
+    cache.set('venue:1', 'short', ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 6)
+    assert cache.get('venue:1') is None
+
+
+def test_redis_versions_are_shared_between_workers(client):
+    first, second = create_versions(CONFIG, client), create_versions(CONFIG, client)
+    assert isinstance(first, RedisVersions)
+    token, _ = first.stamp('Venue', 'Show')
+    assert second.stamp('Venue', 'Show')[0] == token
+
+    second.bump('Venue')
+    bumped, modified = first.stamp('Venue', 'Show')
+    assert bumped != token
+    assert bumped.rsplit(':', 1)[1] == '1.0'
+    assert modified.year > 1970
+    assert first.stamp('Show')[0] == second.stamp('Show')[0]
+
+
+def test_redis_versions_do_not_repeat_a_token_after_a_flush(client):
+    versions = create_versions(CONFIG, client)
+    versions.bump('Venue')
+    before = versions.stamp('Venue')[0]
+    client.flushall()
+    versions.bump('Venue')
+    assert versions.stamp('Venue')[0] != before
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import counters
+from app import db, table_versions
+from models import Venue, Artist, Show
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues.json', '/api/v1/venues'])
+def test_venue_listing_etag_rolls_over_without_seeing_the_roll(app, client, monkeypatch, path):
+    # `flask counters roll` runs in its own process, whose version bump the
+    # web processes do not see with the memory backend
+    clock = [1800000000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    start = datetime.now() + timedelta(minutes=1)
+    with app.app_context():
+        venue, artist = Venue(name='Hall'), Artist(name='Band')
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_date=start))
+        db.session.commit()
+        counters.rebuild()
+        db.session.commit()
+
+    first = client.get(path)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+    monkeypatch.setattr(table_versions, 'bump', lambda *tables: None)
+    with app.app_context():
+        assert counters.roll(start + timedelta(minutes=1)) == 1
+        assert Venue.query.one().upcoming_shows_count == 0
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+    clock[0] += app.config['CONDITIONAL_TIME_WINDOW']
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    if response.is_json:
+        assert response.get_json()['data'][0]['num_upcoming_shows'] == 0
+
+
+def test_show_form_time_with_an_offset_is_stored_naive(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'TIMEZONE', 'UTC')
+    with app.app_context():
+        venue, artist = Venue(name='Hall'), Artist(name='Band')
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        counters.rebuild()
+        db.session.commit()
+        ids = {'venue_id': venue.id, 'artist_id': artist.id}
+    client.post('/shows/create', data=dict(ids, start_time='2027-01-01T20:00:00+02:00'))
+    with app.app_context():
+        assert [show.start_date for show in Show.query] == [datetime(2027, 1, 1, 18)]
+        assert Venue.query.one().upcoming_shows_count == 1
+        assert counters.check() == []
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import counters
+import deletion
+from app import db
+from models import Venue, Artist, Show
+
+
+@pytest.fixture
+def catalog(app):
+    # two venues sharing an artist, each with a past and an upcoming show
+    now = datetime.now()
+    with app.app_context():
+        venues = [Venue(name='Hall'), Venue(name='Club')]
+        artist = Artist(name='Band')
+        db.session.add_all(venues + [artist])
+        db.session.flush()
+        db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_date=now + timedelta(days=days))
+                            for venue in venues for days in (-1, 1)])
+        db.session.commit()
+        counters.rebuild()
+        db.session.commit()
+        return [venue.id for venue in venues], artist.id
+
+
+def listed_venues(client, artist_id):
+    shows = client.get('/shows.json').get_json()['data']
+    artist = client.get('/api/v1/artists/%d' % artist_id).get_json()
+    return (sorted(show['venue_id'] for show in shows),
+            sorted(show['venue_id'] for show in artist['past_shows'] + artist['upcoming_shows']),
+            (artist['past_shows_count'], artist['upcoming_shows_count']))
+
+
+def test_soft_delete_hides_the_shows_and_restore_brings_them_back(app, client, catalog):
+    (hall, club), artist_id = catalog
+    assert listed_venues(client, artist_id) == ([hall, club], [hall, hall, club, club], (2, 2))
+
+    response = client.delete('/venues/%d' % hall)
+    assert response.get_json()['shows_deleted'] == 0
+    assert listed_venues(client, artist_id) == ([club], [club, club], (1, 1))
+    with app.app_context():
+        assert Show.query.count() == 4
+        assert (Artist.query.one().past_shows_count, Artist.query.one().upcoming_shows_count) == (1, 1)
+        assert counters.check() == []
+        assert deletion.restore(Venue, [hall]) == [hall]
+        assert counters.check() == []
+    assert listed_venues(client, artist_id) == ([hall, club], [hall, hall, club, club], (2, 2))
+
+
+def test_hard_delete_and_purge_remove_the_shows(app, client, catalog):
+    (hall, club), artist_id = catalog
+    assert client.delete('/venues/%d?soft=false' % hall).get_json()['shows_deleted'] == 2
+    client.delete('/venues/%d' % club)
+    with app.app_context():
+        assert Show.query.count() == 2
+        assert deletion.purge(Venue, datetime.now() + timedelta(seconds=1)).shows == 2
+        assert Show.query.count() == 0
+        assert (Artist.query.one().past_shows_count, Artist.query.one().upcoming_shows_count) == (0, 0)
+        assert counters.check() == []
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import tasks
+from app import db
+from models import Venue, Artist, Show
+
+
+@pytest.fixture
+def show(app):
+    with app.app_context():
+        venue, artist = Venue(name='Hall'), Artist(name='Band')
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_date=datetime.now() + timedelta(days=1)))
+        db.session.commit()
+        return venue.id, artist.id
+
+
+def test_rename_clears_the_pages_that_mention_it(app, client, monkeypatch, show):
+    # the jobs of the edit may run in another process, with other caches
+    venue_id, artist_id = show
+    monkeypatch.setattr(tasks, 'fire', lambda event, **payload: None)
+    assert b'Hall' in client.get('/artists/%d' % artist_id).data
+    assert b'Band' in client.get('/venues/%d' % venue_id).data
+
+    client.post('/venues/%d/edit' % venue_id, data={'name': 'Big Hall', 'version': 1})
+    assert b'Big Hall' in client.get('/artists/%d' % artist_id).data
+    client.post('/artists/%d/edit' % artist_id, data={'name': 'Big Band', 'version': 1})
+    assert b'Big Band' in client.get('/venues/%d' % venue_id).data
+
+
+def test_rename_to_a_taken_name_shows_the_form_again(app, client, show):
+    venue_id, _ = show
+    with app.app_context():
+        db.session.add(Venue(name='Club'))
+        db.session.commit()
+    response = client.post('/venues/%d/edit' % venue_id, data={'name': 'Club', 'version': 1})
+    assert response.status_code == 409
+    assert b'already has the name Club' in response.data
+    with app.app_context():
+        assert db.session.get(Venue, venue_id).name == 'Hall'
+
+
+def test_edit_without_genres_keeps_them(app, client, show):
+    venue_id, _ = show
+    client.post('/venues/%d/edit' % venue_id, data={'genres': ['Jazz', 'Blues'], 'version': 1})
+    client.post('/venues/%d/edit' % venue_id, data={'city': 'Austin', 'version': 2})
+    with app.app_context():
+        venue = db.session.get(Venue, venue_id)
+        assert (venue.city, venue.genres, venue.version) == ('Austin', 'Blues, Jazz', 3)
+        assert sorted(genre.name for genre in venue.genre_list) == ['Blues', 'Jazz']
+
+
+def test_new_image_link_clears_the_pages_that_show_it(app, client, show):
+    venue_id, artist_id = show
+    assert b'band.png' not in client.get('/venues/%d' % venue_id).data
+    client.post('/artists/%d/edit' % artist_id, data={'image_link': 'https://example.com/band.png', 'version': 1})
+    assert b'https://example.com/band.png' in client.get('/venues/%d' % venue_id).data
+
+
+@pytest.mark.parametrize('kind, model', [('venues', Venue), ('artists', Artist)])
+def test_create_is_not_reported_failed_after_the_commit(app, client, monkeypatch, kind, model):
+    def fire(event, **payload):
+        raise RuntimeError('job queue unavailable')
+
+    monkeypatch.setattr(tasks, 'fire', fire)
+    form = dict((field, '') for field in ('city', 'state', 'address', 'phone', 'facebook_link', 'image_link',
+                                          'website_link', 'seeking_description'))
+    with pytest.raises(RuntimeError):
+        client.post('/%s/create' % kind, data=dict(form, name='New', genres=['Jazz']))
+    with client.session_transaction() as session:
+        assert not any('could not be listed' in message for _, message in session.get('_flashes', []))
+    with app.app_context():
+        assert model.query.filter_by(name='New').count() == 1
@@ -0,0 +1,36 @@
+import io
+from datetime import datetime
+
+import counters
+import importer
+from app import db
+from models import Venue, Artist, Show
+
+
+def test_show_times_with_an_offset_are_stored_naive(app):
+    app.config['TIMEZONE'] = 'UTC'
+    try:
+        with app.app_context():
+            db.session.add_all([Venue(name='Hall'), Artist(name='Band')])
+            db.session.commit()
+            counters.rebuild()
+            db.session.commit()
+            rows = [(line, {'artist': 'Band', 'venue': 'Hall', 'start_time': value}) for line, value in enumerate([
+                '2027-01-01T20:00:00Z', '2027-01-02T20:00:00+02:00', 'Jan 3 2027 8pm -0500', '2027-01-04 20:00'], 2)]
+            report = importer.import_shows(rows, copy=False)
+            assert (report.written, report.skipped) == (4, 0)
+            assert [show.start_date for show in Show.query.order_by(Show.start_date)] == [
+                datetime(2027, 1, 1, 20), datetime(2027, 1, 2, 18), datetime(2027, 1, 4, 1), datetime(2027, 1, 4, 20)]
+            assert counters.check() == []
+    finally:
+        app.config['TIMEZONE'] = None
+
+
+def test_import_reads_csv_rows(app):
+    with app.app_context():
+        stream = io.StringIO('name,city,state,genres\nHall,Austin,TX,"Jazz, Blues"\n,Austin,TX,\n')
+        report = importer.import_entities(Venue, importer.read_rows(stream, 'csv'))
+        assert (report.written, report.skipped) == (1, 1)
+        venue = Venue.query.one()
+        assert venue.genres == 'Blues, Jazz'
+        assert sorted(genre.name for genre in venue.genre_list) == ['Blues', 'Jazz']
@@ -0,0 +1,66 @@
+# The queries behind the busiest routes must be index scans.
+#
+# Every SELECT a route issues is captured and run again under EXPLAIN; the
+# route passes when one of its plans uses the expected index (or one of the
+# '|'-separated alternatives). On PostgreSQL (TEST_DATABASE_URL) sequential
+# scans are disabled for the check, so a tiny table still shows whether the
+# index is usable rather than whether it is cheaper.
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+from models import Venue, Artist
+from benchmarks import datagen
+
+EXPECTED = [
+    ('/venues/{venue_id}', 'ix_show_venue_id_start_date'),
+    ('/artists/{artist_id}', 'ix_show_artist_id_start_date'),
+    ('/shows', 'ix_show_start_date'),
+    ('/shows?when=week&venue_id={venue_id}', 'ix_show_venue_id_start_date'),
+    ('/shows?when=weekend&state=CA&city=San+Francisco', 'ix_venue_state_city'),
+    ('/shows/calendar?bucket=week', 'ix_show_start_date'),
+    # geohash ranges, or the GiST index where PostGIS is installed
+    ('/venues/nearby.json?city=Austin&state=TX&all=1', 'ix_venue_geohash|ix_venue_location'),
+    # the listings read live rows through the partial indexes
+    ('/venues.json', 'ix_venue_live_name'),
+    ('/artists.json', 'ix_artist_live_name'),
+]
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET enable_seqscan = off')
+        rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters)
+    else:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+@pytest.fixture
+def captured():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', capture)
+    yield statements
+    event.remove(Engine, 'before_cursor_execute', capture)
+
+
+@pytest.mark.parametrize('path, index', EXPECTED)
+def test_route_uses_index(app, client, captured, path, index):
+    with app.app_context():
+        datagen.generate('small')
+        venue_id = db.session.query(Venue.id).first()[0]
+        artist_id = db.session.query(Artist.id).first()[0]
+
+    del captured[:]
+    assert client.get(path.format(venue_id=venue_id, artist_id=artist_id)).status_code == 200
+    statements = list(captured)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            plans = [explain(connection, statement, parameters) for statement, parameters in statements]
+    assert any(name in plan for plan in plans for name in index.split('|')), '\n\n'.join(plans)
@@ -0,0 +1,87 @@
+# Read-replica routing, against a second SQLite database.
+#
+# The "replica" is a separate file that never receives the primary's
+# writes, so which database answered a request shows in its data: a venue
+# that exists only in the replica, or only in the primary.
+import os
+
+import pytest
+
+import replicas
+from app import db
+from models import Venue
+
+VENUE_FORM = {'name': 'Written Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+              'phone': '555-000-0000', 'genres': 'Jazz', 'facebook_link': '', 'image_link': '',
+              'website_link': '', 'seeking_description': ''}
+
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'replica.db')
+    monkeypatch.setitem(app.config, 'REPLICA_CHECK_INTERVAL', 3600)
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'ilike')
+    replica = replicas.router.add('sqlite:///' + path)
+    with app.app_context():
+        db.metadata.create_all(replica.engine)
+        db.session.add(Venue(name='Primary Hall', city='Austin', state='TX'))
+        db.session.commit()
+        with replica.engine.begin() as connection:
+            connection.execute(Venue.__table__.insert().values(name='Replica Hall', city='Austin', state='TX'))
+    yield path
+    replicas.router.replicas.remove(replica)
+    replica.engine.dispose()
+
+
+def venue_names(client):
+    response = client.get('/venues.json')
+    assert response.status_code == 200
+    return set(venue['name'] for venue in response.get_json()['data'])
+
+
+def take_down(path):
+    # a directory where the database file was: connecting fails
+    os.rename(path, path + '.away')
+    os.mkdir(path)
+
+
+def bring_back(path):
+    os.rmdir(path)
+    os.rename(path + '.away', path)
+
+
+def test_reads_go_to_the_replica(app, replica):
+    assert venue_names(app.test_client()) == {'Replica Hall'}
+
+
+def test_writer_reads_from_the_primary_after_a_write(app, replica):
+    visitor, writer = app.test_client(), app.test_client()
+    writer.post('/venues/create', data=VENUE_FORM)
+    assert 'Written Hall' in venue_names(writer)
+    assert venue_names(visitor) == {'Replica Hall'}
+
+
+def test_search_reads_from_the_replica_and_does_not_stick(app, replica):
+    visitor = app.test_client()
+    response = visitor.post('/venues/search', data={'search_term': 'Hall'})
+    assert b'Replica Hall' in response.data and b'Primary Hall' not in response.data
+    assert venue_names(visitor) == {'Replica Hall'}
+
+
+def test_failed_replica_is_left_out_until_it_is_back(app, replica):
+    visitor = app.test_client()
+    router = replicas.router
+    assert venue_names(visitor) == {'Replica Hall'}
+
+    # down between health checks: the request finds out and runs on the primary
+    take_down(replica)
+    assert venue_names(visitor) == {'Primary Hall'}
+    assert router.metrics()[0]['healthy'] is False
+    assert router.metrics()[0]['failures'] == 1
+    assert venue_names(visitor) == {'Primary Hall'}
+
+    # back: the next health check puts it in again
+    bring_back(replica)
+    router.replicas[0].checked_at = None
+    assert venue_names(visitor) == {'Replica Hall'}
+    assert router.metrics()[0]['healthy'] is True
@@ -0,0 +1,45 @@
+import pytest
+
+import search
+from app import db, table_versions
+from benchmarks import datagen
+from models import Venue, Artist, live
+
+TERMS = ['hall', 'Blue Note', 'san fr', 'jazz', 'ca', 'r&b', '7', 'no such venue', '']
+
+
+def sql_search(model, term, limit):
+    # the PostgreSQL statement where it can run; elsewhere the same match
+    # on the search document, ranked the same way in Python
+    if db.engine.dialect.name == 'postgresql':
+        return search.PostgresSearch().search(model, term, limit)
+    pattern = '%' + search._escape_like(term) + '%'
+    document = db.literal_column('(' + search.SEARCH_DOCUMENT + ')')
+    rows = db.session.execute(db.select(model.id, model.name, model.city, model.state)
+                              .where(live(model), document.ilike(pattern, escape='\\'))).all()
+    rows.sort(key=lambda row: (term.lower() not in row.name.lower(), -search.similarity(row.name, term),
+                               row.name, row.id))
+    return search.results(rows[:limit])
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+@pytest.mark.parametrize('term', TERMS)
+def test_index_returns_the_sql_results(app, model, term):
+    with app.app_context():
+        datagen.generate({'venues': 60, 'artists': 60, 'shows': 0})
+        for limit in (5, 1000):
+            assert search.search(model, term, limit, backend='memory') == sql_search(model, term, limit)
+
+
+def test_index_follows_the_table_version(app):
+    # a write made by another process reaches this one only through the
+    # table's version stamp
+    with app.app_context():
+        db.session.add(Venue(name='Old Hall'))
+        db.session.commit()
+        assert [r['name'] for r in search.search(Venue, 'hall', backend='memory')] == ['Old Hall']
+        db.session.execute(Venue.__table__.insert().values(name='New Hall'))
+        db.session.commit()
+        assert [r['name'] for r in search.search(Venue, 'hall', backend='memory')] == ['Old Hall']
+        table_versions.bump('Venue')
+        assert [r['name'] for r in search.search(Venue, 'hall', backend='memory')] == ['New Hall', 'Old Hall']
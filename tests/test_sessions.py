@@ -0,0 +1,37 @@
+import pytest
+from itsdangerous import BadSignature
+
+
+def signed(app, data):
+    return app.session_interface.get_signing_serializer(app).dumps(data)
+
+
+def loaded(app, cookie):
+    return app.session_interface.get_signing_serializer(app).loads(cookie)
+
+
+def test_rotated_key_accepts_cookies_signed_with_a_fallback(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SECRET_KEY_FALLBACKS', [])
+    monkeypatch.setattr(app, 'secret_key', 'key-a')
+    old = signed(app, {'_flashes': [('message', 'saved')]})
+
+    monkeypatch.setattr(app, 'secret_key', 'key-b')
+    with pytest.raises(BadSignature):
+        loaded(app, old)
+
+    monkeypatch.setitem(app.config, 'SECRET_KEY_FALLBACKS', ['key-a'])
+    assert loaded(app, old) == {'_flashes': [('message', 'saved')]}
+    # new cookies are signed with the current key only
+    monkeypatch.setitem(app.config, 'SECRET_KEY_FALLBACKS', [])
+    assert loaded(app, signed(app, {'n': 1})) == {'n': 1}
+
+
+def test_session_survives_between_clients(app):
+    # any process signing with the same keys reads the cookie
+    first, second = app.test_client(), app.test_client()
+    with first.session_transaction() as session:
+        session['n'] = 1
+    cookie = next(c for c in first.cookie_jar if c.name == 'session')
+    second.set_cookie('localhost', 'session', cookie.value)
+    with second.session_transaction() as session:
+        assert session['n'] == 1
@@ -0,0 +1,56 @@
+import json
+import subprocess
+import sys
+
+# Runs in a new interpreter, so nothing is compiled or cached yet: imports
+# the app, optionally warms it up, then requests WARM_UP_PATHS and reports
+# what the requests still had to build.
+WORKER = '''
+import json, os, sys
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['CACHE_BACKEND'] = 'null'
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+from app import create_app, db
+from models import Venue
+
+app = create_app(warm=False)
+with app.app_context():
+    db.create_all()
+    compiled_cache = db.engine._compiled_cache
+if sys.argv[1] == 'warm':
+    create_app()
+configured = Venue.__mapper__.configured
+templates = set(key[1] for key in app.jinja_env.cache.keys())
+compiled = len(compiled_cache)
+
+client = app.test_client()
+statuses = [client.get(path).status_code for path in app.config['WARM_UP_PATHS']]
+print(json.dumps({
+    'mappers_configured': configured,
+    'templates_compiled': sorted(templates),
+    'all_templates': sorted(app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))),
+    'statements_compiled_by_requests': len(compiled_cache) - compiled,
+    'statuses': statuses,
+}))
+'''
+
+
+def fresh_worker(mode):
+    output = subprocess.check_output([sys.executable, '-c', WORKER, mode], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_warm_up_pays_the_first_request_costs_before_the_fork():
+    warm = fresh_worker('warm')
+    assert set(warm['statuses']) == {200}
+    assert warm['mappers_configured']
+    assert warm['templates_compiled'] == warm['all_templates']
+    # every statement the warm-up paths run is in the compiled cache already
+    assert warm['statements_compiled_by_requests'] == 0
+
+
+def test_cold_worker_compiles_on_its_first_requests():
+    # the check above would notice a warm-up that did nothing
+    cold = fresh_worker('cold')
+    assert not cold['mappers_configured']
+    assert cold['statements_compiled_by_requests'] > 0
@@ -0,0 +1,47 @@
+import pytest
+
+from benchmarks import datagen
+from conftest import reset, statement_count
+
+
+def seed(app, venues):
+    with app.app_context():
+        datagen.generate({'venues': venues, 'artists': venues, 'shows': venues * 5})
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues.json', '/api/v1/venues'])
+def test_venue_listing_statement_count_does_not_grow_with_venues(app, client, path):
+    # N venues, then 2N: the page lists all of them with the same statements
+    counts = []
+    for venues in (40, 80):
+        reset()
+        seed(app, venues)
+        response = client.get(path + '?per_page=100')
+        assert response.status_code == 200
+        counts.append(statement_count(response))
+    assert counts[0] == counts[1]
+    assert counts[0] <= 2
+
+
+def test_venue_listing_counts_upcoming_shows(app, client):
+    seed(app, 10)
+    with app.app_context():
+        from models import Venue
+        expected = dict((venue.id, venue.upcoming_shows_count) for venue in Venue.query)
+    data = client.get('/venues.json?per_page=100').get_json()['data']
+    assert len(data) == 10
+    assert dict((venue['id'], venue['num_upcoming_shows']) for venue in data) == expected
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues.json', '/api/v1/venues', '/shows'])
+def test_conditional_pages_vary_with_locale_and_time_zone(app, client, path):
+    response = client.get(path)
+    assert response.headers.get('ETag')
+    assert {'Accept-Language', 'Cookie'} <= set(response.vary)
+    etag = response.headers['ETag']
+    not_modified = client.get(path, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert {'Accept-Language', 'Cookie'} <= set(not_modified.vary)
+    client.set_cookie('localhost', 'tz', 'Pacific/Auckland')
+    other_zone = client.get(path, headers={'If-None-Match': etag})
+    assert other_zone.status_code == 200 and other_zone.headers['ETag'] != etag
@@ -0,0 +1,119 @@
+from datetime import datetime
+from sqlalchemy import select, union_all
+from app import db
+from models import Venue, Artist, Show, live
+
+#----------------------------------------------------------------------------#
+# Show timelines.
+#----------------------------------------------------------------------------#
+
+# The venue and artist pages list an entity's past and upcoming shows. Both
+# lists come from one statement: a UNION ALL of the newest <past_limit> past
+# shows and the first <upcoming_limit> upcoming ones, each branch an index
+# range on (owner, start_date) that only joins the *other* side of the show.
+# Rows are split against a single "now", so a show starting exactly now is
+# upcoming rather than lost between the two lists. Shows whose other side is
+# soft deleted are left out of the lists and the counts.
+
+
+class Timeline(object):
+
+    def __init__(self, past, upcoming, past_count, upcoming_count):
+        self.past = past
+        self.upcoming = upcoming
+        self.past_count = past_count
+        self.upcoming_count = upcoming_count
+
+    @property
+    def more_past(self):
+        return self.past_count > len(self.past)
+
+    @property
+    def more_upcoming(self):
+        return self.upcoming_count > len(self.upcoming)
+
+
+def _branch(columns, joined, visible, owner_column, owner_id, condition, order, limit):
+    return select(*columns) \
+        .select_from(joined) \
+        .where(owner_column == owner_id, visible, condition) \
+        .order_by(order) \
+        .limit(limit + 1) \
+        .subquery()
+
+
+class TimelineQuery(object):
+    # the statements behind a timeline, so they can run on the sync session
+    # or the async engine (see asgi.py)
+
+    def __init__(self, columns, joined, visible, owner_column, owner_id, now, past_limit, upcoming_limit):
+        start = Show.start_date
+        self.now = now
+        self.past_limit = past_limit
+        self.upcoming_limit = upcoming_limit
+        past = _branch(columns, joined, visible, owner_column, owner_id, start < now, start.desc(), past_limit)
+        upcoming = _branch(columns, joined, visible, owner_column, owner_id, start >= now, start.asc(), upcoming_limit)
+        self.statement = union_all(select(past), select(upcoming)).order_by('start_date')
+        # one conditional aggregate answers both counts
+        self.count_statement = select(
+            db.func.count(db.case((start < now, 1))),
+            db.func.count(db.case((start >= now, 1)))) \
+            .select_from(joined) \
+            .where(owner_column == owner_id, visible)
+
+    def split(self, rows):
+        past_rows, upcoming_rows = [], []
+        for row in rows:
+            (past_rows if row.start_date < self.now else upcoming_rows).append(row)
+        past_rows.reverse()
+        return past_rows, upcoming_rows
+
+    def truncated(self, past_rows, upcoming_rows):
+        # a branch that returned its extra row was cut short; only then is
+        # the count statement needed
+        return len(past_rows) > self.past_limit or len(upcoming_rows) > self.upcoming_limit
+
+    def timeline(self, past_rows, upcoming_rows, counts=None):
+        past_count, upcoming_count = counts or (len(past_rows), len(upcoming_rows))
+        return Timeline(past_rows[:self.past_limit], upcoming_rows[:self.upcoming_limit],
+                        past_count, upcoming_count)
+
+
+def _timeline(query):
+    past_rows, upcoming_rows = query.split(db.session.execute(query.statement))
+    counts = None
+    if query.truncated(past_rows, upcoming_rows):
+        counts = db.session.execute(query.count_statement).one()
+    return query.timeline(past_rows, upcoming_rows, counts)
+
+
+def venue_timeline_query(venue_id, past_limit, upcoming_limit, now=None):
+    columns = [
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_date,
+    ]
+    joined = Show.__table__.join(Artist, Show.artist_id == Artist.id)
+    return TimelineQuery(columns, joined, live(Artist), Show.venue_id, venue_id,
+                         now or datetime.now(), past_limit, upcoming_limit)
+
+
+def artist_timeline_query(artist_id, past_limit, upcoming_limit, now=None):
+    columns = [
+        Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_date,
+    ]
+    joined = Show.__table__.join(Venue, Show.venue_id == Venue.id)
+    return TimelineQuery(columns, joined, live(Venue), Show.artist_id, artist_id,
+                         now or datetime.now(), past_limit, upcoming_limit)
+
+
+def venue_timeline(venue_id, past_limit, upcoming_limit, now=None):
+    return _timeline(venue_timeline_query(venue_id, past_limit, upcoming_limit, now))
+
+
+def artist_timeline(artist_id, past_limit, upcoming_limit, now=None):
+    return _timeline(artist_timeline_query(artist_id, past_limit, upcoming_limit, now))
@@ -0,0 +1,10 @@
+# Production WSGI entry point:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# gunicorn.conf.py preloads this module in the master, so the warm-up in
+# create_app() runs once and the forked workers share its result
+# copy-on-write.
+from app import create_app
+
+app = create_app()